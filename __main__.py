@@ -9,8 +9,9 @@ from ingestaweb.modules.ftp import FTPClient
 from ingestaweb.settings import ROOT_DIR, sources_config, Config
 
 from locale import setlocale, LC_TIME
-from ingestaweb.modules.main_helpers import load_root_sources_from_config, extract_sources_from_root, \
-    set_sources_to_be_donwloaded, download_pdf_files
+from ingestaweb.modules.main_helpers import load_root_sources_from_config, set_sources_to_be_donwloaded, \
+    download_pdf_files
+from ingestaweb.modules.sources import SourceRegistry
 # setlocale(LC_TIME, "es_ES")
 setlocale(LC_TIME, "es_ES.utf8")
 
@@ -27,6 +28,14 @@ if __name__ == '__main__':
                         type=str,
                         choices=['all', 'daily', 'monthly', 'weekly'],
                         default='all', required=False)
+    parser.add_argument('--workers',
+                        help='Number of root sources using the browser downloaded concurrently',
+                        type=int,
+                        default=getattr(Config, 'DOWNLOAD_WORKERS', 1), required=False)
+    parser.add_argument('--http_workers',
+                        help='Number of http only root sources downloaded concurrently',
+                        type=int,
+                        default=getattr(Config, 'HTTP_LANE_WORKERS', 16), required=False)
 
     args = parser.parse_args()
     source_recurrence = args.source_recurrence
@@ -38,21 +47,22 @@ if __name__ == '__main__':
     ftp = FTPClient(default_path=Config.FTP_DEFAULT_PATH)
     # Load root sources from gsheets
     root_sources = load_root_sources_from_config(sources_config, ftp)
+    source_registry = SourceRegistry(root_sources)
 
     # From all sources get the ones for today that are not downloaded yet.
     # Extract all sources from root sources
-    all_sources = extract_sources_from_root(root_sources)
+    all_sources = source_registry.sources()
 
     # Load sources with download status to db (if not done yet)
     db.load_sources(all_sources)
 
     # Query db and set sources to be downloaded within each root source.
-    root_sources = set_sources_to_be_donwloaded(root_sources, source_recurrence, db)
+    root_sources = set_sources_to_be_donwloaded(root_sources, source_recurrence, db, source_registry)
 
     # Download process
-    download_pdf_files(root_sources, db, ftp)
+    download_pdf_files(root_sources, db, workers=args.workers, http_workers=args.http_workers)
 
-    db.session.close()
+    db.close()
 
     logger.info(
         "Process finished\n" + "=" * 60 + "\n\n"
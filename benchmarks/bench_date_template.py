@@ -0,0 +1,69 @@
+"""
+Benchmark of the url/xpath date templates.
+
+    python -m ingestaweb.benchmarks.bench_date_template --calls 20000
+
+Compares the former parse_date_fmt_to_current_date (one re.sub per date format of datetime_conf.yaml,
+datetime.now() on every substitution, then str.replace for {edition} and {P}) with a DateTemplate compiled
+once and rendered with a fixed date, placeholders included in the same pass. Outputs are checked to be equal.
+"""
+import argparse
+import re
+import time
+import datetime as dt
+
+from ingestaweb.modules.date_template import get_template
+from ingestaweb.settings import date_format_conf
+
+TEMPLATES = [
+    'https://hemeroteca.example.com/{YYYY}/{MM}/{DD}/{edition}/pagina_{P}.pdf',
+    'https://kiosko.example.com/ediciones/{DDMMYYYY}/portada_{edition}.pdf',
+    "//div[@class='edition'][contains(text(), '{DD-MM-YYYY}')]/a/@href",
+    'https://pdf.example.com/{YYMMDD}_{edition}_{P}.pdf',
+    'https://static.example.com/{YYYYMMDD}/{MONTH}/{WEEKDAY}/{page}.jpg',
+]
+
+
+def legacy_parse(url, offset=0):
+    for pattern in date_format_conf['dt_format']:
+        url = re.sub("{"f"{pattern}""}",
+                     (dt.datetime.now() - dt.timedelta(days=offset))
+                     .strftime(f"{date_format_conf['dt_format'].get(pattern)}"), url)
+    return url
+
+
+def legacy_render(template, edition, page):
+    return legacy_parse(template.replace('{edition}', edition).replace('{P}', f'{str(page).zfill(2)}')
+                        .replace('{page}', f'{page}'))
+
+
+def timed(label, func, calls):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed:8.3f} s  {elapsed / calls * 1e6:8.2f} us/render')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+    today = dt.datetime.now()
+    renders = [(TEMPLATES[i % len(TEMPLATES)], 'barcelona', i % 60 + 1) for i in range(args.calls)]
+
+    for template, edition, page in renders[:len(TEMPLATES) * 2]:
+        expected = legacy_render(template, edition, page)
+        assert get_template(template).render(date=today, edition=edition, page=page) == expected, template
+    print(f'{len(date_format_conf["dt_format"])} date formats, {args.calls} renders, outputs equal\n')
+
+    legacy = timed('re.sub per format (legacy)',
+                   lambda: [legacy_render(*render) for render in renders], args.calls)
+    compiled = timed('compiled template, fixed date',
+                     lambda: [get_template(template).render(date=today, edition=edition, page=page)
+                              for template, edition, page in renders], args.calls)
+    print(f'\nspeed-up: x{legacy / compiled:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the kioskoymas overlay compositor on synthetic page pairs.
+
+    python -m ingestaweb.benchmarks.bench_overlay --pages 20 --width 1600 --height 2200
+
+Compares the former float64 blend (3-channel alpha mask, png written and read back) with
+img_converter.blend_overlay (uint16 in place) run serially and in parallel with in-memory buffers.
+"""
+import os
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from ingestaweb.modules.img_converter import blend_overlay, create_overlayed_image
+
+
+def legacy_blend(background, overlay):
+    alpha_channel = overlay[:, :, 3] / 255
+    overlay_colors = overlay[:, :, :3]
+    alpha_mask = np.dstack((alpha_channel, alpha_channel, alpha_channel))
+    h, w = overlay.shape[:2]
+    background_subsection = background[0:h, 0:w]
+    composite = background_subsection * (1 - alpha_mask) + overlay_colors * alpha_mask
+    background[0:h, 0:w] = composite
+    return background
+
+
+def legacy_page(background_path, overlay_path, new_image_path):
+    background = cv2.imread(background_path)
+    overlay = cv2.imread(overlay_path, cv2.IMREAD_UNCHANGED)
+    cv2.imwrite(new_image_path, legacy_blend(background, overlay))
+    with open(new_image_path, 'rb') as f:
+        return f.read()
+
+
+def make_page_pairs(directory, pages, width, height):
+    rng = np.random.default_rng(0)
+    names = []
+    for page in range(pages):
+        name = f'page{page:03d}'
+        background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        overlay = np.zeros((height, width, 4), dtype=np.uint8)
+        # text-like overlay: opaque blocks, antialiased borders and transparent background
+        overlay[height // 10:height // 2, width // 10:width // 2] = (20, 20, 20, 255)
+        overlay[height // 2:height // 2 + 40, :, 3] = np.linspace(0, 255, width, dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, f'{name}_bg.jpeg'), background)
+        cv2.imwrite(os.path.join(directory, f'{name}_fg.png'), overlay)
+        names.append(name)
+    return names
+
+
+def timed(label, func, pages):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<45} {elapsed:8.3f} s  {elapsed / pages * 1000:8.1f} ms/page')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=2200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        names = make_page_pairs(directory, args.pages, args.width, args.height)
+        pairs = [(os.path.join(directory, f'{x}_bg.jpeg'), os.path.join(directory, f'{x}_fg.png')) for x in names]
+
+        background = cv2.imread(pairs[0][0])
+        overlay = cv2.imread(pairs[0][1], cv2.IMREAD_UNCHANGED)
+        expected = legacy_blend(background.copy(), overlay)
+        result = blend_overlay(background.copy(), overlay)
+        max_diff = np.abs(expected.astype(np.int16) - result.astype(np.int16)).max()
+        print(f'max difference with float64 blend: {max_diff}\n')
+
+        print(f'{args.pages} pages {args.width}x{args.height}, {args.workers} workers')
+        timed('blend only, float64 (legacy)', lambda: [legacy_blend(background.copy(), overlay)
+                                                       for _ in names], args.pages)
+        timed('blend only, uint16 in place', lambda: [blend_overlay(background.copy(), overlay)
+                                                      for _ in names], args.pages)
+        timed('page, float64 + png on disk (legacy)',
+              lambda: [legacy_page(bg, fg, os.path.join(directory, f'{i}.png')) for i, (bg, fg) in enumerate(pairs)],
+              args.pages)
+        timed('page, uint16 + jpeg in memory, serial',
+              lambda: [create_overlayed_image(bg, fg) for bg, fg in pairs], args.pages)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            timed('page, uint16 + jpeg in memory, parallel',
+                  lambda: list(executor.map(lambda pair: create_overlayed_image(*pair), pairs)), args.pages)
+
+
+if __name__ == '__main__':
+    main()
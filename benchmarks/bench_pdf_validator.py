@@ -0,0 +1,78 @@
+"""
+Benchmark of the pdf validation on synthetic editions (or real pdfs).
+
+    python -m ingestaweb.benchmarks.bench_pdf_validator --pages 10 100 400 --repeat 5
+    python -m ingestaweb.benchmarks.bench_pdf_validator --files edition1.pdf edition2.pdf
+
+Compares the former check (PyPDF2 PdfReader + len(reader.pages)) with pdf_validator.fast_page_count and
+pdf_validator.is_valid_pdf (fast tier, deep tier on a sample). A truncated copy of every pdf is also
+validated to check it is rejected by the fast tier.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import PyPDF2
+from PIL import Image
+
+from ingestaweb.modules.pdf_builder import PdfStreamWriter
+from ingestaweb.modules.pdf_validator import fast_page_count, is_valid_pdf
+
+
+def legacy_page_count(fileobj):
+    fileobj.seek(0)
+    return len(PyPDF2.PdfReader(fileobj).pages)
+
+
+def make_edition(directory, pages, width=1200, height=1700):
+    image = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(image, format='JPEG', quality=80)
+    pdf_path = os.path.join(directory, f'edition_{pages}.pdf')
+    with PdfStreamWriter(pdf_path) as writer:
+        for _ in range(pages):
+            writer.add_jpeg(image.getvalue())
+    return pdf_path
+
+
+def timed(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'    {label:<35} {elapsed * 1000:10.2f} ms  -> {result}')
+    return elapsed
+
+
+def bench_file(pdf_path, repeat):
+    size = os.path.getsize(pdf_path)
+    print(f'{os.path.basename(pdf_path)} ({size / 1024 / 1024:.1f} MB)')
+    with open(pdf_path, 'rb') as f:
+        data = io.BytesIO(f.read())
+    legacy = timed('PyPDF2 page count (legacy)', lambda: legacy_page_count(data), repeat)
+    fast = timed('fast tier page count', lambda: fast_page_count(data), repeat)
+    timed('is_valid_pdf (5% deep sample)', lambda: is_valid_pdf(fileobj=data), repeat)
+    print(f'    speed-up fast tier: x{legacy / fast:.0f}')
+    truncated = io.BytesIO(data.getvalue()[:size * 9 // 10])
+    print(f'    truncated copy valid: {is_valid_pdf(fileobj=truncated, sample_rate=0)}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 400])
+    parser.add_argument('--files', nargs='+', default=[])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for pdf_path in args.files:
+        bench_file(pdf_path, args.repeat)
+    if args.files:
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in args.pages:
+            bench_file(make_edition(directory, pages), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
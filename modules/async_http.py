@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+# download types that only need http requests (no browser once logged in)
+ASYNC_HTTP_TYPES = frozenset(getattr(Config, 'ASYNC_HTTP_TYPES', (
+    'standard_requests', 'argia', 'elcultural', 'eltemps', 'gentedigital', 'gacetamedica_elglobal',
+    'eleconomista', 'nuevaalcarria', 'diariandorra')))
+ASYNC_HTTP = getattr(Config, 'ASYNC_HTTP', True)
+HTTP_ENGINE_CONNECTIONS = getattr(Config, 'HTTP_ENGINE_CONNECTIONS', 200)
+HTTP_ENGINE_PER_HOST = getattr(Config, 'HTTP_ENGINE_PER_HOST', 6)
+HTTP_ENGINE_KEEPALIVE = getattr(Config, 'HTTP_ENGINE_KEEPALIVE', 30)
+# (connect, read) seconds when the caller gives no timeout
+HTTP_ENGINE_TIMEOUT = getattr(Config, 'HTTP_ENGINE_TIMEOUT', (10, 60))
+
+
+def client_timeout(timeout):
+    """ requests timeout (seconds or (connect, read)) as an aiohttp.ClientTimeout """
+    connect, read = timeout if isinstance(timeout, (tuple, list)) else (timeout, timeout)
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+
+class EngineResponse:
+    """
+    The part of requests.Response used by the downloaders: status_code, ok, headers, content, iter_content and
+    `with response:`. With stream=True the body is read chunk by chunk from the event loop.
+    """
+
+    def __init__(self, engine, response, content=None):
+        self.engine = engine
+        self.raw = response
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.url = str(response.url)
+        self._content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __repr__(self):
+        return f'<EngineResponse [{self.status_code}]>'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        if self._content is not None:
+            for start in range(0, len(self._content), chunk_size):
+                yield self._content[start:start + chunk_size]
+            return
+        while True:
+            chunk, error = self.engine.run(self._read(chunk_size))
+            if chunk:
+                yield chunk
+            if error is not None:
+                raise requests.exceptions.ChunkedEncodingError(str(error)) from error
+            if not chunk:
+                break
+
+    async def _read(self, chunk_size):
+        """
+        (next chunk, None). When the connection drops aiohttp raises before handing out the bytes already
+        received, those are returned with the error: (received bytes, error), so a resume starts after them
+        """
+        stream = self.raw.content
+        try:
+            return await stream.read(chunk_size), None
+        except aiohttp.ClientPayloadError as e:
+            try:
+                received = stream._read_nowait(-1)
+            except Exception:
+                received = b''
+            return received, e
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b''.join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode(self.raw.get_encoding() or 'utf-8', errors='replace')
+
+    def close(self):
+        if not self.raw.closed:
+            self.engine.loop.call_soon_threadsafe(self.raw.release)
+
+
+class EngineSession:
+    """
+    requests.Session-like front of the engine for one scraper: every request is prepared by the requests session
+    (headers, User-Agent, cookies, auth, form encoding) and sent through the shared aiohttp connection pool.
+    Cookies set by the responses go back to the requests session, so the browser and the session stay in sync.
+    """
+
+    def __init__(self, engine, session):
+        self.engine = engine
+        self.session = session
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def get(self, url, auth=None, headers=None, stream=False, timeout=None, **kwargs):
+        return self.request('GET', url, auth=auth, headers=headers, stream=stream, timeout=timeout)
+
+    def post(self, url, data=None, auth=None, headers=None, stream=False, timeout=None, **kwargs):
+        return self.request('POST', url, data=data, auth=auth, headers=headers, stream=stream, timeout=timeout)
+
+    def request(self, method, url, data=None, auth=None, headers=None, stream=False, timeout=None):
+        prepared = self.session.prepare_request(
+            requests.Request(method, url, data=data, auth=auth, headers=headers))
+        request_headers = dict(prepared.headers)
+        # aiohttp decodes gzip and deflate, brotli only when installed
+        request_headers['Accept-Encoding'] = 'gzip, deflate'
+        response = self.engine.request(prepared.method, prepared.url, headers=request_headers, data=prepared.body,
+                                       stream=stream, timeout=timeout)
+        self.store_cookies(url, response)
+        return response
+
+    def store_cookies(self, url, response):
+        domain = urlparse(response.url or url).hostname
+        for header in response.headers.getall('Set-Cookie', []):
+            cookie = SimpleCookie()
+            try:
+                cookie.load(header)
+            except Exception:
+                continue
+            for name, morsel in cookie.items():
+                self.session.cookies.set(name, morsel.value, domain=morsel['domain'] or domain,
+                                         path=morsel['path'] or '/')
+
+
+class AsyncHttpEngine:
+    """
+    Single aiohttp client running on its own event loop thread, shared by every downloader thread:
+    keep-alive connections pooled up to `connections`, at most `per_host` open connections per host.
+    Worker threads only wait on the result of their request, the sockets of all of them are multiplexed on
+    the loop, so hundreds of http-only sources can be in flight from one process.
+
+        response = http_engine.session(requests_session).get(url)
+
+    Network errors are raised as the requests exceptions (ConnectionError, Timeout, ChunkedEncodingError)
+    the callers already handle. The loop starts with the first request; close() stops it (it starts again
+    if used afterwards).
+    """
+
+    def __init__(self, connections=HTTP_ENGINE_CONNECTIONS, per_host=HTTP_ENGINE_PER_HOST,
+                 keepalive=HTTP_ENGINE_KEEPALIVE, timeout=HTTP_ENGINE_TIMEOUT):
+        self.connections = connections
+        self.per_host = per_host
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.loop = None
+        self.client = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name='http-engine', daemon=True)
+            self._thread.start()
+            self.client = asyncio.run_coroutine_threadsafe(self._create_client(), self.loop).result()
+            logger.info(f"Http engine started: {self.connections} connections, {self.per_host} per host")
+
+    async def _create_client(self):
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.per_host,
+                                         keepalive_timeout=self.keepalive, ttl_dns_cache=300)
+        # cookies are sent and kept by the requests session of every scraper
+        return aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+                                     timeout=client_timeout(self.timeout))
+
+    def run(self, coroutine):
+        """ Runs a coroutine on the engine loop and waits for its result, from any other thread """
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e) or 'timed out') from e
+        except aiohttp.ClientPayloadError as e:
+            raise requests.exceptions.ChunkedEncodingError(str(e)) from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def session(self, requests_session):
+        return EngineSession(self, requests_session)
+
+    async def _request(self, method, url, headers, data, stream, timeout):
+        response = await self.client.request(method, url, headers=headers, data=data,
+                                             timeout=client_timeout(timeout or self.timeout))
+        if stream:
+            return response, None
+        try:
+            return response, await response.read()
+        finally:
+            response.release()
+
+    def request(self, method, url, headers=None, data=None, stream=False, timeout=None):
+        self.start()
+        response, content = self.run(self._request(method, url, headers, data, stream, timeout))
+        return EngineResponse(self, response, content)
+
+    def close(self):
+        with self._lock:
+            if not self.running:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join()
+                self.loop.close()
+                self._thread = None
+
+
+http_engine = AsyncHttpEngine() if aiohttp is not None and ASYNC_HTTP else None
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from lxml import etree
+from requests.auth import HTTPBasicAuth
+
+from ingestaweb.modules.rate_limiter import host_limiter
+from ingestaweb.modules.session_store import session_store
+from ingestaweb.modules.utils import parse_date_fmt_to_current_date
+from ingestaweb.settings import ROOT_DIR, Config
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.path.join(ROOT_DIR, 'ingestaweb', 'data', 'availability.json')
+AVAILABILITY_PROBE = getattr(Config, 'AVAILABILITY_PROBE', True)
+# seconds an unavailable answer is trusted before the source is probed again
+PROBE_INTERVAL = getattr(Config, 'PROBE_INTERVAL', 2 * 3600)
+# (connect, read) seconds of a probe, a slow probe is inconclusive
+PROBE_TIMEOUT = getattr(Config, 'PROBE_TIMEOUT', (5, 15))
+# answers of an edition url meaning the edition is not published (401/403, redirects... prove nothing),
+# only trusted from a configured probe: the url of a download may need the session of its login
+MISSING_STATUSES = (404, 410)
+# probes of the state older than this are dropped when it is loaded
+STATE_DAYS = 40
+
+AVAILABLE = 'available'
+UNAVAILABLE = 'unavailable'
+UNKNOWN = 'unknown'
+
+
+class Probe:
+    """
+    Cheap request telling if today's edition of a source is out, sent before any login or browser start.
+        - without xpath: HEAD (GET with method 'get') of the edition url, 404/410 -> unavailable
+        - with xpath: GET of an archive page (hemeroteca), xpath not found -> unavailable
+    304 to the validators (ETag / Last-Modified) of the edition already downloaded, or of the last probe that
+    found nothing, -> unavailable. Any other answer or error is inconclusive and the source is downloaded.
+    404/410 of a probe derived from the download url (not configured) are inconclusive too.
+    """
+
+    def __init__(self, url, xpath=None, method=None, auth=None, configured=True):
+        self.url = url
+        self.xpath = xpath
+        self.method = (method or ('GET' if xpath else 'HEAD')).upper()
+        self.auth = auth
+        self.configured = configured
+
+    @classmethod
+    def for_source(cls, root_source, source):
+        """
+        Probe of a source, None when the config has none. download_config 'probe' (url, xpath, method and
+        auth 'basic' for the user and password of the login), standard_requests get a HEAD of the url their
+        download requests (Scraper.download_url). Dates (and {edition}) of url and xpath are replaced as in the
+        download. 'probe': false disables it.
+        """
+        download_conf = root_source.download_conf or {}
+        conf = download_conf.get('probe')
+        if conf is False:
+            return None
+        if not conf:
+            if download_conf.get('type') != 'standard_requests':
+                return None
+            url, post = root_source.download_url(source)
+            return cls(url, configured=False) if url and not post else None
+        edition = source.edition or None
+        url = parse_date_fmt_to_current_date(conf.get('url'), edition=edition) if conf.get('url') else None
+        if not url:
+            return None
+        xpath = parse_date_fmt_to_current_date(conf['xpath'], edition=edition) if conf.get('xpath') else None
+        auth = None
+        if conf.get('auth') == 'basic':
+            login_info = root_source.login_info or {}
+            auth = HTTPBasicAuth(login_info.get('user'), login_info.get('password'))
+        return cls(url, xpath=xpath, method=conf.get('method'), auth=auth)
+
+
+class AvailabilityChecker:
+    """
+    Result of the last probe of every source (by name), persisted in a json file:
+        {'url', 'status', 'checked_at', 'etag', 'last_modified', 'downloaded': {'url', 'etag', 'last_modified'}}
+    An unavailable source is not probed again for `interval` seconds (same url). Once downloaded, the
+    validators of its last probe are kept, so a fixed url (monthly editions) answers 304 until a new edition.
+
+        status = availability.check(root_source, source)
+        ...
+        availability.downloaded(source)
+    """
+
+    def __init__(self, state_path=STATE_PATH, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, persist=True):
+        self.state_path = state_path
+        self.interval = interval
+        self.timeout = timeout
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        state = {}
+        if self.persist and os.path.isfile(self.state_path):
+            try:
+                with open(self.state_path, encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Availability state not loaded: {e}")
+        oldest = time.time() - STATE_DAYS * 24 * 3600
+        return {name: entry for name, entry in state.items() if entry.get('checked_at', 0) >= oldest}
+
+    def _save(self):
+        if not self.persist:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f'{self.state_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f, ensure_ascii=False, indent=0)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Availability state not saved: {e}")
+
+    def entry(self, source_name):
+        with self._lock:
+            if self._state is None:
+                self._state = self._load()
+            return dict(self._state.get(source_name) or {})
+
+    def _update(self, source_name, **values):
+        with self._lock:
+            if self._state is None:
+                self._state = self._load()
+            self._state.setdefault(source_name, {}).update(values)
+            self._save()
+
+    @staticmethod
+    def conditional_headers(probe, entry):
+        """ Validators of the edition downloaded from this url, or of the last probe that found nothing """
+        validators = entry.get('downloaded') or {}
+        if validators.get('url') != probe.url:
+            validators = entry if entry.get('url') == probe.url and entry.get('status') == UNAVAILABLE else {}
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    @staticmethod
+    def session(root_source):
+        """ New session with the cookies of the last login of the root source (see SessionStore) """
+        session = requests.Session()
+        session.headers.update({'User-Agent': Config.USER_AGENT})
+        root_source_id = getattr(root_source, 'id', None)
+        login_type = (root_source.login_info or {}).get('type')
+        cookies = session_store.load(root_source_id, login_type) if root_source_id is not None else None
+        for cookie in cookies or []:
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                                path=cookie.get('path', '/'))
+        return session
+
+    def send(self, root_source, probe, headers):
+        """ The request goes with the session of the download when the root source already has one """
+        session = getattr(root_source, 'remote_session', None)
+        new_session = session is None
+        if new_session:
+            session = self.session(root_source)
+        try:
+            host_limiter.acquire(probe.url)
+            response = session.request(probe.method, probe.url, headers=headers, auth=probe.auth,
+                                       timeout=self.timeout, allow_redirects=True)
+            host_limiter.observe(probe.url, response)
+            return response
+        finally:
+            if new_session:
+                session.close()
+
+    @staticmethod
+    def verdict(probe, response):
+        if response.status_code == 304:
+            return UNAVAILABLE
+        if response.status_code in MISSING_STATUSES:
+            return UNAVAILABLE if probe.configured else UNKNOWN
+        if not response.ok:
+            return UNKNOWN
+        if probe.xpath is None:
+            return AVAILABLE
+        try:
+            tree = etree.fromstring(response.content, parser=etree.HTMLParser())
+            if tree is None:
+                return UNKNOWN
+            return AVAILABLE if tree.xpath(probe.xpath) else UNAVAILABLE
+        except (etree.XMLSyntaxError, etree.XPathError, ValueError):
+            return UNKNOWN
+
+    def check(self, root_source, source):
+        """ AVAILABLE, UNAVAILABLE or UNKNOWN (no probe, inconclusive answer or error) """
+        probe = Probe.for_source(root_source, source)
+        if probe is None:
+            return UNKNOWN
+        entry = self.entry(source.name)
+        now = time.time()
+        if entry.get('url') == probe.url and entry.get('status') == UNAVAILABLE \
+                and now - entry.get('checked_at', 0) < self.interval:
+            logger.info(f"\t{source.name} - Unavailable at {time.strftime('%H:%M', time.localtime(entry['checked_at']))}"
+                        f", not probed again")
+            return UNAVAILABLE
+        try:
+            response = self.send(root_source, probe, self.conditional_headers(probe, entry))
+        except Exception as e:
+            logger.warning(f"\t{source.name} - Probe of {probe.url} failed: {e}")
+            return UNKNOWN
+        status = self.verdict(probe, response)
+        logger.info(f"\t{source.name} - Probe {probe.method} {probe.url}: {response.status_code}, {status}")
+        values = {'url': probe.url, 'status': status, 'checked_at': now}
+        if 200 <= response.status_code < 300:
+            values.update(etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        self._update(source.name, **values)
+        return status
+
+    def downloaded(self, source):
+        """ Keeps the validators of the last probe as the ones of the edition downloaded """
+        entry = self.entry(source.name)
+        if not entry.get('url'):
+            return
+        self._update(source.name, status=AVAILABLE, downloaded={
+            'url': entry['url'], 'etag': entry.get('etag'), 'last_modified': entry.get('last_modified')})
+
+
+availability = AvailabilityChecker()
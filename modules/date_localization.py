@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import re
+import threading
+import datetime as dt
+
+from ingestaweb.settings import ROOT_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.path.join(ROOT_DIR, 'ingestaweb', 'data', 'date_localization_cache.json')
+# cached dates older than this are dropped when the cache is loaded
+CACHE_DAYS = 31
+
+MONTHS = {
+    'es': ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto', 'septiembre', 'octubre',
+           'noviembre', 'diciembre'],
+    'ca': ['gener', 'febrer', 'març', 'abril', 'maig', 'juny', 'juliol', 'agost', 'setembre', 'octubre', 'novembre',
+           'desembre'],
+    'eu': ['urtarrila', 'otsaila', 'martxoa', 'apirila', 'maiatza', 'ekaina', 'uztaila', 'abuztua', 'iraila', 'urria',
+           'azaroa', 'abendua'],
+    'gl': ['xaneiro', 'febreiro', 'marzo', 'abril', 'maio', 'xuño', 'xullo', 'agosto', 'setembro', 'outubro',
+           'novembro', 'decembro'],
+    'fr': ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre', 'octobre', 'novembre',
+           'décembre'],
+    'en': ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+           'November', 'December'],
+    'pt': ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho', 'julho', 'agosto', 'setembro', 'outubro',
+           'novembro', 'dezembro'],
+}
+
+# monday first, as date.weekday()
+WEEKDAYS = {
+    'es': ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo'],
+    'ca': ['dilluns', 'dimarts', 'dimecres', 'dijous', 'divendres', 'dissabte', 'diumenge'],
+    'eu': ['astelehena', 'asteartea', 'asteazkena', 'osteguna', 'ostirala', 'larunbata', 'igandea'],
+    'gl': ['luns', 'martes', 'mércores', 'xoves', 'venres', 'sábado', 'domingo'],
+    'fr': ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche'],
+    'en': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+    'pt': ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo'],
+}
+
+# %B, %b, %A, %a from the tables, '-' or '#' flag: number without leading zeros (%-d linux, %#d windows)
+DIRECTIVE_RE = re.compile(r'%([-#]?)([a-zA-Z%])')
+TIME_DIRECTIVE_RE = re.compile(r'%[-#]?[HIMSfpXcz]')
+# catalan: "de" before a month starting with a vowel is elided, "18 d'octubre"
+CATALAN_ELISION_RE = re.compile(
+    r"\b([Dd])e (" + '|'.join(month for month in MONTHS['ca'] if month[0] in 'aeiou') + r")\b")
+
+
+def normalize_lang(lang):
+    return (lang or 'es').replace('_', '-').split('-')[0].lower()
+
+
+def localize_date(date_format, lang, date=None):
+    """
+    strftime with the month and weekday names of `lang` (es, ca, eu, gl, fr, en, pt) instead of the locale ones.
+    Abbreviated names (%b, %a) are the first three letters of the name.
+    """
+    lang = normalize_lang(lang)
+    date = date or dt.datetime.now()
+    months, weekdays = MONTHS[lang], WEEKDAYS[lang]
+
+    def directive(match):
+        flag, code = match.groups()
+        if code == 'B':
+            return months[date.month - 1]
+        if code == 'b':
+            return months[date.month - 1][:3]
+        if code == 'A':
+            return weekdays[date.weekday()]
+        if code == 'a':
+            return weekdays[date.weekday()][:3]
+        value = date.strftime(f'%{code}')
+        if flag and value.isdigit():
+            return value.lstrip('0') or '0'
+        return value
+
+    localized = DIRECTIVE_RE.sub(directive, date_format)
+    if lang == 'ca':
+        localized = CATALAN_ELISION_RE.sub(r"\1'\2", localized)
+    return localized
+
+
+class DateLocalizer:
+    """
+    Localized dates memoized by (lang, format, date) and persisted in a json file, so sources rendering
+    the same date over the day (or over several runs) do not format it again. No network calls involved.
+    """
+
+    def __init__(self, cache_path=CACHE_PATH, persist=True):
+        self.cache_path = cache_path
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @staticmethod
+    def _key(lang, date_format, date):
+        return f'{lang}|{date_format}|{date:%Y-%m-%d}'
+
+    def _load(self):
+        cache = {}
+        if self.persist and os.path.isfile(self.cache_path):
+            try:
+                with open(self.cache_path, encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Date localization cache not loaded: {e}")
+        oldest = f'{dt.date.today() - dt.timedelta(days=CACHE_DAYS):%Y-%m-%d}'
+        return {key: value for key, value in cache.items() if key.rsplit('|', 1)[-1] >= oldest}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f'{self.cache_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._cache, f, ensure_ascii=False, indent=0)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Date localization cache not saved: {e}")
+
+    def localize(self, date_format, lang, date=None):
+        lang = normalize_lang(lang)
+        date = date or dt.datetime.now()
+        if lang not in MONTHS:
+            logger.warning(f"No date names for language {lang}, using the system locale")
+            return date.strftime(date_format)
+        # formats with time directives are not memoized, the key only has the day
+        if TIME_DIRECTIVE_RE.search(date_format):
+            return localize_date(date_format, lang, date)
+        key = self._key(lang, date_format, date)
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._load()
+            if key in self._cache:
+                return self._cache[key]
+            self._cache[key] = localize_date(date_format, lang, date)
+            if self.persist:
+                self._save()
+            return self._cache[key]
+
+
+date_localizer = DateLocalizer()
@@ -0,0 +1,73 @@
+import re
+import datetime as dt
+from functools import lru_cache
+
+from ingestaweb.settings import date_format_conf
+
+# placeholders filled from render() arguments instead of the date
+PLACEHOLDERS = ('edition', 'P', 'page', 'format_date')
+
+
+class DateTemplate:
+    """
+    URL / xpath template compiled once into a token list: literal text and placeholders, found with a single
+    regex over the date formats of datetime_conf.yaml ({DD}, {YYYYMMDD}, {MONTH}...) and the
+    {edition}, {P}, {page} and {format_date} placeholders.
+
+        template = get_template(download_conf.get('url'))
+        template.render(date=today, edition=source.edition, page=3)
+
+    Every date placeholder is rendered from the same reference date. Placeholders without a value
+    (e.g. no edition given) and unknown {names} are kept as they are.
+    """
+
+    def __init__(self, template, date_formats=None):
+        self.template = template
+        self.date_formats = dict(date_formats or date_format_conf['dt_format'])
+        names = sorted(list(self.date_formats) + list(PLACEHOLDERS), key=len, reverse=True)
+        pattern = re.compile(r'\{(' + '|'.join(re.escape(name) for name in names) + r')\}')
+        self.tokens = []
+        position = 0
+        for match in pattern.finditer(template):
+            if match.start() > position:
+                self.tokens.append(template[position:match.start()])
+            self.tokens.append((match.group(1),))
+            position = match.end()
+        if position < len(template):
+            self.tokens.append(template[position:])
+
+    def __repr__(self):
+        return f'DateTemplate({self.template!r})'
+
+    def render(self, date=None, offset=0, edition=None, page=None, page_width=2, format_date=None):
+        """
+        date: reference date (now by default), minus `offset` days
+        {P}: page with leading zeros up to page_width, {page}: page as is
+        """
+        date = (date or dt.datetime.now()) - dt.timedelta(days=offset)
+        values = {'edition': edition, 'format_date': format_date,
+                  'P': str(page).zfill(page_width) if page is not None else None,
+                  'page': str(page) if page is not None else None}
+        parts = []
+        for token in self.tokens:
+            if isinstance(token, str):
+                parts.append(token)
+                continue
+            name = token[0]
+            if name in self.date_formats:
+                parts.append(date.strftime(self.date_formats[name]))
+            elif values.get(name) is not None:
+                parts.append(values[name])
+            else:
+                parts.append(f'{{{name}}}')
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=1024)
+def get_template(template):
+    """ Compiled template, every template is compiled once """
+    return DateTemplate(template)
+
+
+def render_template(template, date=None, offset=0, **placeholders):
+    return get_template(template).render(date=date, offset=offset, **placeholders)
@@ -1,18 +1,34 @@
 import logging
 import os
+import threading
 import datetime as dt
-from sqlalchemy import create_engine, desc
+from sqlalchemy import create_engine, desc, event, Index, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, Date, DateTime
 
-from ingestaweb.settings import DownloadStatus
+from ingestaweb.settings import DownloadStatus, Config
 from settings import ROOT_DIR
 
 Base = declarative_base()
 
 logger = logging.getLogger(__name__)
 
+FREQUENCIES = ['daily', 'weekly', 'monthly']
+PENDING_STATUSES = [DownloadStatus.FAILED, DownloadStatus.UNAVAILABLE, DownloadStatus.DEFAULT]
+
+
+def recurrence_date_window(frequency, today=None):
+    """
+    Dates of the rows that can still be downloaded for a frequency:
+        daily -> today
+        weekly, monthly -> since the first day of the month (their rows are created on day 1)
+    """
+    today = today or dt.datetime.now().date()
+    if frequency == 'daily':
+        return today, today
+    return today.replace(day=1), today
+
 
 class DbSource(Base):
     __tablename__ = "source"
@@ -22,24 +38,57 @@ class DbSource(Base):
     is_relevant = Column(String)
     downloaded = Column(String, default=DownloadStatus.DEFAULT)
     downloaded_at = Column(DateTime(timezone=False), default=None)
+    # why the last attempt failed (e.g. timeout: fetch over 600s), None once downloaded
+    failure_reason = Column(String, default=None)
+
+    __table_args__ = (
+        Index('ix_source_name_date', 'source_name', 'date'),
+        Index('ix_source_relevant_downloaded', 'is_relevant', 'downloaded'),
+        Index('ix_source_date', 'date'),
+    )
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """ WAL: readers (report) do not block the download process writes """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 
 class Db:
     db_path = os.path.join(ROOT_DIR, 'ingestaweb', 'descargaweb.db')
 
-    def __init__(self):
+    def __init__(self, status_batch_size=None):
+        self.lock = threading.RLock()
+        self.status_batch_size = status_batch_size or getattr(Config, 'DB_STATUS_BATCH_SIZE', 20)
+        self.pending_status_updates = []
         self.session = self.connect(self.db_path)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.flush_status_updates()
         self.session.close()
 
     def connect(self, db_path):
-        engine = create_engine(f"sqlite:///{db_path}")
-        Session = sessionmaker(bind=engine)
+        # the session is shared by the download workers, access is serialized through self.lock
+        engine = create_engine(f"sqlite:///{db_path}", connect_args={'check_same_thread': False})
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+        Session = sessionmaker(bind=engine, expire_on_commit=False)
         Base.metadata.create_all(engine)
+        # columns added after the table was created
+        columns = {column['name'] for column in inspect(engine).get_columns(DbSource.__tablename__)}
+        if 'failure_reason' not in columns:
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {DbSource.__tablename__} ADD COLUMN failure_reason VARCHAR'))
+        # tables created before the indexes were declared
+        for index in DbSource.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
         return Session()
 
     def load_sources(self, sources):
@@ -55,28 +104,92 @@ class Db:
             logger.error(f'Error while loading and create dbsource object: \n {e}')
 
     def load_sources_by_frequency(self, sources):
+        """
+        Today's rows are inserted in bulk, in a single transaction
+        """
+        today = dt.datetime.now().date()
+        dbsources = []
         for source in sources:
             create = True if source.frequency in ['monthly', 'weekly'] and dt.datetime.now().day == 1 \
                              or source.frequency == 'daily' else False
             if create:
-                dbsource = DbSource(
+                dbsources.append(dict(
                     source_name=source.name,
-                    date=dt.datetime.now().date(),
-                    is_relevant=source.is_weekday_relevant
-                )
-                self.session.add(dbsource)
-            self.session.commit()
-
-    def get_sources_to_be_downloaded(self, report=False):
-        to_be_donwloaded = self.session.query(DbSource) \
-            .filter(DbSource.is_relevant == 1) \
-            .all() \
-            if report else\
-            self.session.query(DbSource) \
-            .filter(DbSource.is_relevant == 1, DbSource.downloaded.in_(['failed', 'unavailable', 'unprocessed'])) \
-            .all()
-        # to_be_donwloaded = self.session.query(DbSource).filter(DbSource.is_relevant == 0, DbSource.downloaded == "False").all()
-        return to_be_donwloaded if to_be_donwloaded else []
+                    date=today,
+                    is_relevant=source.is_weekday_relevant,
+                    downloaded=DownloadStatus.DEFAULT
+                ))
+        with self.lock:
+            try:
+                self.session.bulk_insert_mappings(DbSource, dbsources)
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+
+    def set_download_status(self, dbsource, downloaded, reason=None):
+        """
+        Thread safe status update of a dbsource row (failed, downloaded, unavailable), reason of a failure.
+        Updates are queued and written in batches of status_batch_size rows (see flush_status_updates)
+        """
+        update = {'id': dbsource.id, 'downloaded': downloaded, 'failure_reason': reason}
+        if downloaded == DownloadStatus.SUCCESS:
+            update['downloaded_at'] = dt.datetime.now().replace(microsecond=0, second=0)
+        with self.lock:
+            self.pending_status_updates.append(update)
+            if len(self.pending_status_updates) >= self.status_batch_size:
+                self.flush_status_updates()
+
+    def flush_status_updates(self):
+        with self.lock:
+            if not self.pending_status_updates:
+                return
+            updates, self.pending_status_updates = self.pending_status_updates, []
+            try:
+                # rows with and without downloaded_at can not share the same executemany statement
+                for has_date in (True, False):
+                    batch = [update for update in updates if ('downloaded_at' in update) is has_date]
+                    if batch:
+                        self.session.bulk_update_mappings(DbSource, batch)
+                self.session.commit()
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f'Error while updating download status of {len(updates)} sources: \n {e}')
+
+    def get_sources_to_be_downloaded(self, date_from, date_to=None, source_names=None, report=False):
+        """
+        Relevant rows dated within [date_from, date_to] as lightweight tuples
+        (id, source_name, date, downloaded, downloaded_at), filtered in SQL.
+            report=False -> only rows still pending (failed, unavailable, unprocessed)
+            source_names -> only rows of these sources
+        """
+        query = self.session.query(
+            DbSource.id, DbSource.source_name, DbSource.date, DbSource.downloaded, DbSource.downloaded_at
+        ).filter(
+            DbSource.is_relevant == 1,
+            DbSource.date >= date_from,
+            DbSource.date <= (date_to or date_from)
+        )
+        if not report:
+            query = query.filter(DbSource.downloaded.in_(PENDING_STATUSES))
+        if source_names is not None:
+            query = query.filter(DbSource.source_name.in_(list(source_names)))
+        with self.lock:
+            return query.all()
+
+    def get_sources_by_recurrence(self, source_recurrence, sources, today=None, report=False):
+        """
+        Rows to be downloaded for the sources of a recurrence (daily, weekly, monthly or all),
+        each frequency with its own date window (see recurrence_date_window)
+        """
+        frequencies = FREQUENCIES if source_recurrence == 'all' else [source_recurrence]
+        dbsources = []
+        for frequency in frequencies:
+            source_names = {source.name for source in sources if source.frequency == frequency}
+            if source_names:
+                date_from, date_to = recurrence_date_window(frequency, today)
+                dbsources.extend(self.get_sources_to_be_downloaded(date_from, date_to, source_names, report=report))
+        return dbsources
 
     # @staticmethod
     # def set_downloaded_codes_to_text(report_list):
@@ -85,20 +198,19 @@ class Db:
     #             sublist[3] = 'pending'
     #     return report_list
 
-    def get_sources_filtered_report(self, root_sources):
+    def get_sources_filtered_report(self, source_registry):
         sources_reported = []
-        sources_to_be_donwloaded = self.get_sources_to_be_downloaded(report=True)
+        today = dt.datetime.now().date()
+        sources_to_be_donwloaded = self.get_sources_to_be_downloaded(today, report=True)
         for dbsource in sources_to_be_donwloaded:
-            for root_source in root_sources:
-                found_source = root_source.get_source_by_name(dbsource.source_name)
-                if found_source:
-                    sources_reported.append([
-                        dbsource.source_name,
-                        found_source.frequency,
-                        str(dbsource.date),
-                        dbsource.downloaded,
-                        dbsource.downloaded_at
-                    ])
+            for _, found_source in source_registry.get_all(dbsource.source_name):
+                sources_reported.append([
+                    dbsource.source_name,
+                    found_source.frequency,
+                    str(dbsource.date),
+                    dbsource.downloaded,
+                    dbsource.downloaded_at
+                ])
 
         # sources_reported = self.set_downloaded_codes_to_text(sources_reported)
         return sources_reported
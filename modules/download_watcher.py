@@ -0,0 +1,105 @@
+import logging
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+# files written by the browser while the download is still running
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp')
+
+
+class DownloadWatcher:
+    """
+    Detects when a browser download is finished in a directory and returns the exact file.
+    Create it BEFORE starting the download, files already in the directory are ignored:
+
+        watcher = DownloadWatcher(download_dir)
+        edition.click()
+        file_path = watcher.wait(timeout=300)  # None if not finished on time
+
+    Uses inotify events when inotify_simple is available (Linux), otherwise the directory is polled.
+    A file is finished when it has one of the extensions, is not empty and its partial file (.crdownload) is
+    gone; when polling, its size must also be stable between two checks (Chrome creates an empty placeholder
+    before the .crdownload file appears).
+    """
+
+    def __init__(self, directory, extensions=('.pdf', '.zip'), ignore_existing=True, poll_interval=0.25):
+        self.directory = directory
+        self.extensions = tuple(extensions)
+        self.poll_interval = poll_interval
+        self.existing = set(os.listdir(directory)) if ignore_existing else set()
+        self._sizes = {}
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(directory, flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO)
+            except OSError as e:
+                logger.warning(f"inotify not available, polling {directory}. {e}")
+                self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _is_finished(self, name, names, closed):
+        if name in self.existing or not name.endswith(self.extensions):
+            return False
+        if any(f'{name}{suffix}' in names for suffix in PARTIAL_SUFFIXES):
+            return False
+        try:
+            size = os.path.getsize(os.path.join(self.directory, name))
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if name in closed:
+            return True
+        previous_size = self._sizes.get(name)
+        self._sizes[name] = size
+        return size == previous_size
+
+    def finished_file(self, closed=()):
+        """ Path of a new finished file, None while the download is running """
+        names = set(os.listdir(self.directory))
+        for name in sorted(names):
+            if self._is_finished(name, names, closed):
+                return os.path.join(self.directory, name)
+        return None
+
+    def _wait_events(self, timeout):
+        """ Names of the files closed or moved into the directory during the next `timeout` seconds """
+        if self.inotify is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return set()
+        events = self.inotify.read(timeout=int(min(timeout, self.poll_interval * 4) * 1000))
+        return {event.name for event in events
+                if event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO)}
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        closed = set()
+        try:
+            while True:
+                file_path = self.finished_file(closed)
+                if file_path:
+                    return file_path
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"\tDownload not finished after {timeout} seconds in {self.directory}")
+                    return None
+                closed |= self._wait_events(remaining)
+        finally:
+            self.close()
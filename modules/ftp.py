@@ -1,20 +1,40 @@
 import os
 import time
+import queue
+import shutil
 import logging
 import ftplib
+import tempfile
+import threading
 import datetime as dt
 
-from ingestaweb.settings import Config
+from ingestaweb.modules.retrying import retry, NO_RETRY, RetryPolicy
+from ingestaweb.settings import Config, TEMP_DIR_FILES
 
 logger = logging.getLogger(__name__)
 
+FTP_BLOCKSIZE = getattr(Config, 'FTP_BLOCKSIZE', 256 * 1024)
+# seconds without an answer (or data) before a command or transfer fails, a stalled upload is then retried
+FTP_TIMEOUT = getattr(Config, 'FTP_TIMEOUT', 120)
+FTP_SPOOL_DIR = os.path.join(TEMP_DIR_FILES, 'ftp_spool')
+# a permanent error of a transfer (550 no such directory, 553 name not allowed...) is not fixed by sending
+# the file again. Connection errors (raised by create_connection as Exception) are retried
+FTP_RETRY_POLICIES = {ftplib.error_perm: NO_RETRY, OSError: RetryPolicy(base=5)}
+# uploads waiting for a connection (per connection), beyond them the downloaders wait: queued file objects
+# are pdfs held in memory
+FTP_QUEUED_PER_CONNECTION = getattr(Config, 'FTP_QUEUED_PER_CONNECTION', 4)
+
 
 class FTPClient:
 
-    def __init__(self, default_path="/"):
-        self.host = Config.FTP_HOST
-        self.user = Config.FTP_USER
-        self.pswd = Config.FTP_PASSWORD
+    def __init__(self, default_path="/", host=None, user=None, password=None, port=21, blocksize=None,
+                 retry_for=300):
+        self.host = host or Config.FTP_HOST
+        self.user = user or Config.FTP_USER
+        self.pswd = password or Config.FTP_PASSWORD
+        self.port = port
+        self.blocksize = blocksize or FTP_BLOCKSIZE
+        self.retry_for = retry_for
         self.path = default_path
         self.disconnected = True
         self.create_connection()
@@ -31,23 +51,23 @@ class FTPClient:
         """ Allows connection with contextmanager (exit)"""
         self.session.quit()
 
+    def connect(self):
+        self.session = ftplib.FTP(timeout=FTP_TIMEOUT)
+        self.session.connect(self.host, self.port)
+        self.session.login(self.user, self.pswd)
+        # self.conn.encoding = 'utf-8'
+        self.session.cwd(self.path)
+        self.disconnected = False
+        print(f"{self.create_date()} - Connected to ftp")
+
     def create_connection(self, email_sent=False):
-        """Connect to ftp"""
-        start_time = time.time()
-        while time.time() - start_time <= 300 and self.disconnected:
-            try:
-                self.session = ftplib.FTP(self.host)
-                self.session.login(self.user, self.pswd)
-                # self.conn.encoding = 'utf-8'
-                self.session.cwd(self.path)
-                self.disconnected = False
-                print(f"{self.create_date()} - Connected to ftp")
-            except Exception as e:
-                time.sleep(10)
-                logger.error(f"{self.create_date()} - Connection error. \n{e}")
-
-        if self.disconnected:
+        """Connect to ftp, retrying with backoff for `retry_for` seconds"""
+        try:
+            retry(max_attempts=None, base=2, cap=30, deadline=self.retry_for, name='ftp.connect')(self.connect)()
+        except Exception as e:
+            logger.error(f"{self.create_date()} - Connection error. \n{e}")
             raise Exception("FTPConnectionError: Couldn't connect to ftp.")
+        return self
 
     def check_connection(self, email_sent):
         """Check if ftp connection is already established. Otherwise, try to reconnect"""
@@ -56,7 +76,7 @@ class FTPClient:
         except:
             logger.warning(f"{self.create_date()} - Trying to reconnect to ftp...")
             self.disconnected = True
-            self.session = self.create_connection(email_sent)
+            self.create_connection(email_sent)
         finally:
             return self
 
@@ -115,8 +135,7 @@ class FTPClient:
         """Upload a single file from local dir to ftp"""
         uploaded = False
         try:
-            with open(os.path.join(local_file_path, filename), 'rb') as f:
-                self.session.storbinary(fr'STOR {ftp_file_path}/{filename}', f)
+            self.store(os.path.join(local_file_path, filename), f'{ftp_file_path}/{filename}')
             uploaded = True
         except ftplib.all_errors as e:
             uploaded = False
@@ -124,6 +143,38 @@ class FTPClient:
         finally:
             return uploaded
 
+    def upload_fileobj(self, fileobj, ftp_file_path, filename):
+        """ Upload an open binary file object (BytesIO, spooled file) without going through the disk """
+        uploaded = False
+        try:
+            fileobj.seek(0)
+            self.store_fileobj(fileobj, f'{ftp_file_path}/{filename}')
+            uploaded = True
+        except ftplib.all_errors as e:
+            uploaded = False
+            logger.error(f"ERROR: Transfer not completed for {filename}. {e}")
+        finally:
+            fileobj.close()
+            return uploaded
+
+    def store(self, file_path, ftp_path):
+        """ STOR a local file, errors are raised """
+        with open(file_path, 'rb') as f:
+            self.store_fileobj(f, ftp_path)
+
+    def store_fileobj(self, fileobj, ftp_path):
+        self.session.storbinary(f'STOR {ftp_path}', fileobj, blocksize=self.blocksize)
+
+    def quit(self):
+        try:
+            self.session.quit()
+        except Exception:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+        self.disconnected = True
+
     def create_dir_if_not_exists(self, dir_path):
         try:
             self.session.mkd(dir_path)
@@ -134,6 +185,188 @@ class FTPClient:
             pass
 
 
+class FTPUploadPool:
+    """
+    Uploads files in the background through `connections` authenticated ftp sessions.
+    Same upload_file/upload_fileobj interface as FTPClient, so it can be passed to the downloaders instead of a
+    session: the file is spooled (hard link, or copy) or the file object is taken over, it is queued and the call
+    returns without waiting for the transfer. At most `max_queued` uploads wait for a connection, the next calls
+    block until one is taken.
+    A failed transfer is retried up to `max_retries` times on a fresh connection, once there are no retries left
+    `on_failure(ftp_path, error)` of the upload is called (see SourceUploads).
+
+        with FTPUploadPool(connections=4, workdir=get_today_folder()) as ftp:
+            ftp.upload_file(local_dir, f"{root_source.dirname}/{source.dirname}", filename)
+        # on exit every queued file has been uploaded (or has failed, see ftp.failed)
+
+    `client_factory` builds the sessions (by default FTPClient(default_path) with the Config credentials),
+    sessions move to `workdir` once connected.
+    """
+
+    def __init__(self, connections=2, default_path=None, workdir=None, blocksize=None, max_retries=2,
+                 spool_dir=FTP_SPOOL_DIR, client_factory=None, max_queued=None):
+        self.connections = max(1, int(connections))
+        self.workdir = workdir
+        self.max_retries = max_retries
+        default_path = default_path or Config.FTP_DEFAULT_PATH
+        self.client_factory = client_factory or (lambda: FTPClient(default_path=default_path, blocksize=blocksize))
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = tempfile.mkdtemp(prefix='upload_', dir=spool_dir)
+        self._queue = queue.Queue(maxsize=max_queued or self.connections * FTP_QUEUED_PER_CONNECTION)
+        self._lock = threading.Lock()
+        self._job_ids = 0
+        self.uploaded = []
+        self.failed = []
+        self.transfer_times = []
+        self._workers = [threading.Thread(target=self._work, name=f'ftp-upload-{i}', daemon=True)
+                         for i in range(self.connections)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _spool(self, file_path):
+        with self._lock:
+            self._job_ids += 1
+            spooled_path = os.path.join(self.spool_dir, f'{self._job_ids}_{os.path.basename(file_path)}')
+        try:
+            os.link(file_path, spooled_path)
+        except OSError:
+            shutil.copyfile(file_path, spooled_path)
+        return spooled_path
+
+    def upload_file(self, local_file_path, ftp_file_path, filename, on_failure=None):
+        """ Queue a file to be uploaded to ftp_file_path/filename. False if the file could not be queued """
+        try:
+            spooled_path = self._spool(os.path.join(local_file_path, filename))
+        except OSError as e:
+            logger.error(f"ERROR: Transfer not queued for {filename}. {e}")
+            return False
+        self._queue.put((spooled_path, f'{ftp_file_path}/{filename}', on_failure))
+        return True
+
+    def upload_fileobj(self, fileobj, ftp_file_path, filename, on_failure=None):
+        """ Queue an open binary file object, it is closed by the pool once transferred """
+        self._queue.put((fileobj, f'{ftp_file_path}/{filename}', on_failure))
+        return True
+
+    def uploads_of(self, on_failure):
+        """ Uploader for the downloaders of a source, its failed transfers call on_failure(ftp_path, error) """
+        return SourceUploads(self, on_failure)
+
+    def _connect(self):
+        client = self.client_factory()
+        if self.workdir:
+            client.session.cwd(self.workdir)
+        return client
+
+    @staticmethod
+    def _discard(upload):
+        try:
+            if isinstance(upload, str):
+                os.remove(upload)
+            else:
+                upload.close()
+        except OSError:
+            pass
+
+    def _transfer(self, client, upload, ftp_path, on_failure=None):
+        """ Upload with retries (FTP_RETRY_POLICIES), returns the (maybe new) client of the worker """
+        worker = {'client': client}
+
+        @retry(max_attempts=self.max_retries + 1, base=1, cap=30, policies=FTP_RETRY_POLICIES, name='ftp.store')
+        def store():
+            try:
+                if worker['client'] is None:
+                    worker['client'] = self._connect()
+                if isinstance(upload, str):
+                    worker['client'].store(upload, ftp_path)
+                else:
+                    upload.seek(0)
+                    worker['client'].store_fileobj(upload, ftp_path)
+            except Exception:
+                # the next attempt runs on a fresh connection
+                if worker['client'] is not None:
+                    worker['client'].quit()
+                worker['client'] = None
+                raise
+
+        start = time.monotonic()
+        try:
+            store()
+            with self._lock:
+                self.uploaded.append(ftp_path)
+                self.transfer_times.append(time.monotonic() - start)
+        except Exception as e:
+            logger.error(f"ERROR: Transfer not completed for {ftp_path}. {e}")
+            with self._lock:
+                self.failed.append(ftp_path)
+            if on_failure is not None:
+                try:
+                    on_failure(ftp_path, e)
+                except Exception as callback_error:
+                    logger.error(f"ERROR: Failed upload of {ftp_path} not recorded. {callback_error}")
+        return worker['client']
+
+    def _work(self):
+        client = None
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    break
+                upload, ftp_path, on_failure = job
+                client = self._transfer(client, upload, ftp_path, on_failure)
+                self._discard(upload)
+            finally:
+                self._queue.task_done()
+        if client is not None:
+            client.quit()
+
+    def join(self):
+        """ Wait until every queued file has been transferred """
+        self._queue.join()
+
+    def report(self):
+        with self._lock:
+            times = list(self.transfer_times)
+            return {
+                'uploaded': len(self.uploaded),
+                'failed': len(self.failed),
+                'transfer_avg_s': round(sum(times) / len(times), 2) if times else 0,
+                'transfer_max_s': round(max(times), 2) if times else 0,
+            }
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+        logger.info(f"FTP upload pool: {self.report()}")
+
+
+class SourceUploads:
+    """
+    Uploads of a single source through an FTPUploadPool, passed to its downloaders as the ftp session.
+    The pool calls `on_failure(ftp_path, error)` for each of them that can not be transferred.
+    """
+
+    def __init__(self, pool, on_failure):
+        self.pool = pool
+        self.on_failure = on_failure
+
+    def upload_file(self, local_file_path, ftp_file_path, filename):
+        return self.pool.upload_file(local_file_path, ftp_file_path, filename, on_failure=self.on_failure)
+
+    def upload_fileobj(self, fileobj, ftp_file_path, filename):
+        return self.pool.upload_fileobj(fileobj, ftp_file_path, filename, on_failure=self.on_failure)
+
+
 # def create_daily_base_directories(ftp, all_sources):
 #     """
 #     FTP folders' structure:
@@ -162,6 +395,11 @@ class FTPClient:
 #         for source in sources:
 #             ftp.create_dir_if_not_exists(dir_path=f'{base_path}/{source}')
 
+def get_today_folder():
+    """ Name of today's ftp folder, created inside the default path """
+    return f"{dt.datetime.now():%Y%m%d}"
+
+
 def create_daily_base_directories_ftp(root_sources, ftp):
     """
     FTP folders' structure:
@@ -184,7 +422,7 @@ def create_daily_base_directories_ftp(root_sources, ftp):
     """
     try:
         ftp.session.cwd(Config.FTP_DEFAULT_PATH)
-        today_folder = f"{dt.datetime.now():%Y%m%d}"
+        today_folder = get_today_folder()
         ftp.create_dir_if_not_exists(dir_path=today_folder)
         ftp.session.cwd(today_folder)
         for root_source in root_sources:
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+# seconds a page is reused, the archive of a root source rarely changes while its editions are downloaded
+HTTP_CACHE_TTL = getattr(Config, 'HTTP_CACHE_TTL', 15 * 60)
+HTTP_CACHE_ENTRIES = getattr(Config, 'HTTP_CACHE_ENTRIES', 128)
+HTTP_CACHE_MAX_BYTES = getattr(Config, 'HTTP_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+
+class CacheEntry:
+
+    def __init__(self, content, tree, expires_at):
+        self.content = content
+        self.tree = tree
+        self.expires_at = expires_at
+        self.size = len(content) if content else 0
+
+
+class HttpCache:
+    """
+    Pages fetched during a run (the html and its lxml tree) by (namespace, scope, url, auth), so the editions
+    of a root source share one fetch and one parse of the archive page (hemeroteca).
+    Entries live `ttl` seconds; beyond `max_entries` or `max_bytes` of html the least recently used go first.
+    The namespace is the root source: its pages are fetched with its own session (cookies, login) and its
+    trees are only read by the worker running it. Failed fetches are not cached.
+
+        key = http_cache.key(url, auth=auth, namespace=root_source.name)
+        entry = http_cache.get(key)
+        ...
+        http_cache.put(key, html, tree)
+    """
+
+    def __init__(self, ttl=HTTP_CACHE_TTL, max_entries=HTTP_CACHE_ENTRIES, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(url, auth=None, scope='etree', namespace=None):
+        """ Credentials are part of the key as a digest, never kept in clear. ('user', 'password') is basic auth """
+        auth_key = None
+        if auth is not None:
+            credentials = repr(tuple(auth) if isinstance(auth, (tuple, list)) else
+                               (getattr(auth, 'username', auth), getattr(auth, 'password', None)))
+            auth_key = hashlib.sha256(credentials.encode('utf-8')).hexdigest()[:16]
+        return namespace, scope, url, auth_key
+
+    def get(self, key):
+        """ Entry of the key (content, tree), None if missing or expired """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, content, tree):
+        entry = CacheEntry(content, tree, time.monotonic() + self.ttl)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+http_cache = HttpCache()
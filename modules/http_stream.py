@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import logging
+import re
+
+import requests
+
+from ingestaweb.modules.rate_limiter import RATE_LIMITED_STATUSES, RATE_LIMIT_RETRIES
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b'%PDF'
+# readers accept the header within the first 1024 bytes
+MAGIC_WINDOW = 1024
+STREAM_CHUNK_SIZE = getattr(Config, 'STREAM_CHUNK_SIZE', 256 * 1024)
+STREAM_MAX_RESUMES = getattr(Config, 'STREAM_MAX_RESUMES', 3)
+STREAM_TIMEOUT = getattr(Config, 'STREAM_TIMEOUT', (10, 60))
+
+DROPPED_CONNECTION_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class DownloadError(Exception):
+    """ The file was answered but could not be downloaded: dropped, incomplete, corrupted or not a pdf """
+
+
+def expected_length(response):
+    """ Size of the whole file, None when unknown or when the body is content-encoded """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    content_range = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+    if content_range:
+        return int(content_range.group(1))
+    content_length = response.headers.get('Content-Length')
+    return int(content_length) if content_length and content_length.isdigit() else None
+
+
+def expected_sha256(response):
+    """ sha-256 announced by the server in a Digest header (base64), if any """
+    match = re.search(r'sha-256=([A-Za-z0-9+/=]+)', response.headers.get('Digest', ''))
+    return base64.b64decode(match.group(1)).hex() if match else None
+
+
+def stream_to_fileobj(session, url, fileobj, is_post_request=False, payload=None, auth=None, magic=PDF_MAGIC,
+                      chunk_size=STREAM_CHUNK_SIZE, max_resumes=STREAM_MAX_RESUMES, timeout=STREAM_TIMEOUT,
+                      rate_limiter=None, cancelled=None):
+    """
+    Downloads url in chunks into fileobj (BytesIO, spooled file) without holding the whole response in memory.
+        - aborts as soon as the first bytes are not `magic` (e.g. an html error page instead of the pdf)
+        - size checked against Content-Length, sha256 against the Digest header when the server sends one
+        - a dropped connection is resumed with a Range request (GET only), up to max_resumes times.
+          If the server ignores the range (or the file changed, If-Range) the download starts again
+        - with a rate_limiter (rate_limiter.AdaptiveRateLimiter) every request waits for the host and
+          429/503 answers are requested again once the host pause is over
+        - cancelled: callable, the download is abandoned as soon as it returns True (source deadline)
+    Returns the sha256 (hex) of the content, None when the server has no file (error status or empty body).
+    Raises DownloadError (with the reason) when the file was answered but the download failed.
+    """
+    if is_post_request:
+        max_resumes = 0
+    digest = hashlib.sha256()
+    head = b''
+    written = 0
+    total = None
+    announced_sha256 = None
+    validator = None
+    resumes = 0
+    throttled = 0
+    fileobj.seek(0)
+    fileobj.truncate()
+    while True:
+        if cancelled and cancelled():
+            raise DownloadError(f"download of {url} cancelled at {written} bytes")
+        headers = {}
+        if written:
+            headers['Range'] = f'bytes={written}-'
+            if validator:
+                headers['If-Range'] = validator
+        if rate_limiter:
+            rate_limiter.acquire(url)
+        try:
+            response = session.post(url, data=payload, auth=auth, headers=headers, stream=True, timeout=timeout) \
+                if is_post_request else session.get(url, auth=auth, headers=headers, stream=True, timeout=timeout)
+            with response:
+                if rate_limiter:
+                    rate_limiter.observe(url, response)
+                    if response.status_code in RATE_LIMITED_STATUSES and throttled < RATE_LIMIT_RETRIES:
+                        throttled += 1
+                        continue
+                if not response.ok:
+                    logger.warning(f"\t{url} answered {response.status_code}")
+                    return None
+                if written and response.status_code != 206:
+                    logger.warning(f"\tRange not honoured by {url}, downloading again")
+                    fileobj.seek(0)
+                    fileobj.truncate()
+                    digest, head, written = hashlib.sha256(), b'', 0
+                if not written:
+                    total = expected_length(response)
+                    announced_sha256 = expected_sha256(response)
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    if cancelled and cancelled():
+                        raise DownloadError(f"download of {url} cancelled at {written} bytes")
+                    if magic and len(head) < MAGIC_WINDOW:
+                        head += chunk[:MAGIC_WINDOW - len(head)]
+                        if len(head) >= MAGIC_WINDOW and magic not in head:
+                            raise DownloadError(f"not a pdf: {url} starts with {head[:20]!r}")
+                    fileobj.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+        except DROPPED_CONNECTION_ERRORS as e:
+            if resumes < max_resumes:
+                resumes += 1
+                logger.warning(f"\tConnection dropped at {written} bytes of {url}, resuming ({resumes}). {e}")
+                continue
+            raise DownloadError(f"download of {url} failed at {written} bytes: {e}") from e
+        if total is not None and written < total and resumes < max_resumes:
+            resumes += 1
+            logger.warning(f"\tIncomplete download of {url} ({written}/{total} bytes), resuming ({resumes})")
+            continue
+        break
+
+    if not written:
+        logger.warning(f"\tEmpty response: {url}")
+        return None
+    if magic and magic not in head:
+        raise DownloadError(f"not a pdf: {url} starts with {head[:20]!r}")
+    if total is not None and written != total:
+        raise DownloadError(f"size mismatch for {url}: {written} bytes, expected {total}")
+    sha256 = digest.hexdigest()
+    if announced_sha256 and sha256 != announced_sha256:
+        raise DownloadError(f"sha256 mismatch for {url}")
+    fileobj.seek(0)
+    return sha256
@@ -1,56 +1,79 @@
 import os
-import time
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-from ingestaweb.settings import TEMP_DIR_IMAGES
+from ingestaweb.modules.pdf_builder import PdfStreamWriter
+from ingestaweb.settings import TEMP_DIR_IMAGES, Config
 
 
-def create_overlayed_images(background_image_path, overlay_img_path, new_image_path):
-    background = cv2.imread(background_image_path)
-    overlay = cv2.imread(overlay_img_path, cv2.IMREAD_UNCHANGED)
+def blend_overlay(background, overlay):
+    """
+    Alpha blends the overlay (BGRA) on the top-left corner of the background (BGR), in place.
+    Integer math: composite = (overlay * alpha + background * (255 - alpha) + 127) // 255
+    The alpha channel is a (h, w, 1) view broadcast over the 3 color channels, it is never copied per channel.
+    """
+    h = min(overlay.shape[0], background.shape[0])
+    w = min(overlay.shape[1], background.shape[1])
+    background_subsection = background[0:h, 0:w]
+    alpha = overlay[0:h, 0:w, 3:4].astype(np.uint16)
 
-    # separate the alpha channel from the color channels
-    alpha_channel = overlay[:, :, 3] / 255 # convert from 0-255 to 0.0-1.0
-    overlay_colors = overlay[:, :, :3]
+    composite = overlay[0:h, 0:w, :3].astype(np.uint16)
+    composite *= alpha
+    weighted_background = background_subsection.astype(np.uint16)
+    weighted_background *= 255 - alpha
+    composite += weighted_background
+    composite += 127
+    composite //= 255
 
-    # To take advantage of the speed of numpy and apply transformations to the entire image with a single operation
-    # the arrays need to be the same shape. However, the shapes currently looks like this:
-    #    - overlay_colors shape:(width, height, 3)  3 color values for each pixel, (red, green, blue)
-    #    - alpha_channel  shape:(width, height, 1)  1 single alpha value for each pixel
-    # We will construct an alpha_mask that has the same shape as the overlay_colors by duplicate the alpha channel
-    # for each color so there is a 1:1 alpha channel for each color channel
-    alpha_mask = np.dstack((alpha_channel, alpha_channel, alpha_channel))
+    # overwrite the section of the background image that has been updated
+    background_subsection[...] = composite
+    return background
 
-    # The background image is larger than the overlay so we'll take a subsection of the background that matches the
-    # dimensions of the overlay.
-    # NOTE: For simplicity, the overlay is applied to the top-left corner of the background(0,0). An x and y offset
-    # could be used to place the overlay at any position on the background.
-    h, w = overlay.shape[:2]
-    background_subsection = background[0:h, 0:w]
 
-    # combine the background with the overlay image weighted by alpha
-    composite = background_subsection * (1 - alpha_mask) + overlay_colors * alpha_mask
+def create_overlayed_image(background_image_path, overlay_img_path, jpeg_quality=95):
+    """
+    Returns the composed page encoded as jpeg bytes, nothing is written to disk.
+    """
+    background = cv2.imread(background_image_path)
+    overlay = cv2.imread(overlay_img_path, cv2.IMREAD_UNCHANGED)
+    if background is None or overlay is None:
+        raise Exception(f"Impossible to read page images {background_image_path}, {overlay_img_path}")
+    if overlay.ndim == 3 and overlay.shape[2] == 4:
+        blend_overlay(background, overlay)
+    encoded, buffer = cv2.imencode('.jpg', background, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not encoded:
+        raise Exception(f"Impossible to encode page {background_image_path}")
+    return buffer.tobytes()
 
-    # overwrite the section of the background image that has been updated
-    background[0:h, 0:w] = composite
 
-    cv2.imwrite(new_image_path, background)
+def compose_pages(page_names, images_path=TEMP_DIR_IMAGES, workers=None):
+    """
+    Yields the composed pages (jpeg bytes) in page order. Pages are composed in parallel threads:
+    cv2 (decode/encode) and numpy release the GIL, so the work spreads across cores.
+    """
+    workers = workers or getattr(Config, 'COMPOSE_WORKERS', None) or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='compose') as executor:
+        yield from executor.map(
+            lambda x: create_overlayed_image(
+                os.path.join(images_path, f'{x}_bg.jpeg'), os.path.join(images_path, f'{x}_fg.png')),
+            page_names
+        )
 
 
-def build_pages(total_pages, mounted_images_path):
+def build_pages(total_pages, pdf_path, images_path=TEMP_DIR_IMAGES):
+    """
+    Composes every page (background + overlay) and streams them into the pdf.
+    """
     status = False
     try:
-        files = os.listdir(TEMP_DIR_IMAGES)
+        files = os.listdir(images_path)
         unique_files = list(set([x.split('_')[0] for x in files if '.' in x]))
         if len(unique_files) == total_pages-1:
             unique_files.sort()
-            [create_overlayed_images(
-                os.path.join(TEMP_DIR_IMAGES, f'{x}_bg.jpeg'), os.path.join(TEMP_DIR_IMAGES, f'{x}_fg.png'),
-                os.path.join(mounted_images_path, f'{x}.png'))
-             for x in unique_files
-            ]
-            time.sleep(5)
+            with PdfStreamWriter(pdf_path, resolution=100.0) as pdf:
+                for page in compose_pages(unique_files, images_path):
+                    pdf.add_jpeg(page)
             status = True
         else:
             raise Exception("Pages missing!!")
@@ -0,0 +1,132 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestaweb.modules.rate_limiter import host_limiter
+from ingestaweb.modules.retrying import retry, NO_RETRY
+from ingestaweb.modules.supervisor import SourceTimeout
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+# answers meaning the page does not exist (the edition has fewer pages), any other error is retried
+MISSING_PAGE_STATUSES = (404, 410)
+PAGE_FETCH_ATTEMPTS = getattr(Config, 'PAGE_FETCH_ATTEMPTS', 3)
+
+
+class PageFetchError(Exception):
+    """ A page could not be retrieved (transport error, 5xx, 429...): the number of pages is not known """
+
+
+def is_missing_page(response):
+    return response is None or response.status_code in MISSING_PAGE_STATUSES
+
+
+class PageFetcher:
+    """
+    Downloads the page images of an edition (issuu, calameo, diariandorra...).
+        1 - probes the number of pages: exponential search on the page index and then binary search
+            between the last page found and the first missing one.
+        2 - downloads the pages concurrently through a bounded pool, rate limited per host.
+    Only a page answered as missing (`is_missing`, 404/410 by default) ends the edition. Errors are retried
+    (`attempts` in total) and then raise PageFetchError, an edition is never cut short by an error.
+
+    :param fetch: callable(url) returning a response object (with .status_code and .content, whatever the
+                  status) or None if the page does not exist
+    :param page_url: callable(page_number) returning the url of the page, pages start at 1
+    :param is_missing: callable(response), True if the response means the page does not exist
+    """
+
+    def __init__(self, fetch, page_url, max_workers=None, rate_limiter=None, max_pages=1000, is_missing=None,
+                 attempts=PAGE_FETCH_ATTEMPTS):
+        self.fetch = fetch
+        self.page_url = page_url
+        self.max_workers = max_workers or getattr(Config, 'PAGE_FETCH_WORKERS', 6)
+        self.rate_limiter = rate_limiter or host_limiter
+        self.max_pages = max_pages
+        self.is_missing = is_missing or is_missing_page
+        self.attempts = attempts
+        # content of the pages already retrieved while probing, so they are not requested twice
+        self._probed = {}
+
+    def _get(self, page):
+        """ Response of the page, None if it does not exist. PageFetchError once the attempts are exhausted """
+        url = self.page_url(page)
+
+        @retry(max_attempts=self.attempts, base=1, cap=10, policies={SourceTimeout: NO_RETRY}, name='pages.fetch')
+        def get():
+            self.rate_limiter.acquire(url)
+            response = self.fetch(url)
+            if self.is_missing(response):
+                return None
+            if not response.ok:
+                raise PageFetchError(f'page {page}: status {response.status_code}')
+            return response
+
+        try:
+            return get()
+        except (PageFetchError, SourceTimeout):
+            raise
+        except Exception as e:
+            raise PageFetchError(f'page {page}: {e}') from e
+
+    def page_exists(self, page):
+        if page in self._probed:
+            return True
+        response = self._get(page)
+        if response is not None:
+            self._probed[page] = response.content
+            return True
+        return False
+
+    def probe_page_count(self):
+        if not self.page_exists(1):
+            return 0
+        last_found, first_missing = 1, 2
+        while first_missing <= self.max_pages and self.page_exists(first_missing):
+            last_found, first_missing = first_missing, first_missing * 2
+        first_missing = min(first_missing, self.max_pages + 1)
+        while first_missing - last_found > 1:
+            middle = (last_found + first_missing) // 2
+            if self.page_exists(middle):
+                last_found = middle
+            else:
+                first_missing = middle
+        return last_found
+
+    def save_page(self, page, output_dir, filename_fmt):
+        """ Path of the page written in output_dir, None if it could not be retrieved """
+        content = self._probed.pop(page, None)
+        if content is None:
+            try:
+                response = self._get(page)
+            except PageFetchError as e:
+                logger.warning(f"\tError retrieving page {page}: {e}")
+                return None
+            content = response.content if response is not None else None
+        if content is None:
+            return None
+        page_path = os.path.join(output_dir, filename_fmt.format(page))
+        with open(page_path, 'wb') as img:
+            img.write(content)
+        return page_path
+
+    def download(self, output_dir, filename_fmt='page_{:03d}.jpg'):
+        """
+        Returns the paths of the pages written in output_dir, sorted by page. Empty list if there is no page 1.
+        PageFetchError if the pages can not be counted or one of them is still missing after a second try
+        """
+        total_pages = self.probe_page_count()
+        logger.info(f"\tRetrieving {total_pages} pages")
+        if not total_pages:
+            return []
+        pages = range(1, total_pages + 1)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pages') as executor:
+            page_paths = list(executor.map(lambda page: self.save_page(page, output_dir, filename_fmt), pages))
+        missing = [page for page, page_path in zip(pages, page_paths) if page_path is None]
+        for page in missing:
+            page_paths[page - 1] = self.save_page(page, output_dir, filename_fmt)
+        missing = [page for page, page_path in zip(pages, page_paths) if page_path is None]
+        if missing:
+            raise PageFetchError(f'pages missing after retry: {missing}')
+        return page_paths
@@ -0,0 +1,155 @@
+import io
+import struct
+import zlib
+
+from PIL import Image
+
+JPEG_MAGIC = b'\xff\xd8'
+# start of frame markers (baseline, progressive, lossless...), they contain the image dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_COLOR_SPACES = {1: b'/DeviceGray', 3: b'/DeviceRGB', 4: b'/DeviceCMYK'}
+
+
+def read_jpeg_info(data):
+    """
+    Returns (width, height, components, is_adobe) reading the jpeg markers, without decoding the image.
+    """
+    is_adobe = False
+    position = 2
+    while position < len(data) - 3:
+        if data[position] != 0xFF:
+            position += 1
+            continue
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            position += 2
+            continue
+        if marker == 0xD9:
+            break
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        if marker == 0xEE and data[position + 4:position + 9] == b'Adobe':
+            is_adobe = True
+        if marker in JPEG_SOF_MARKERS and position + 10 <= len(data):
+            height, width, components = struct.unpack('>HHB', data[position + 5:position + 10])
+            return width, height, components, is_adobe
+        position += 2 + length
+    raise ValueError('Invalid jpeg: frame header not found')
+
+
+class PdfStreamWriter:
+    """
+    Builds a pdf with one image per page, writing each page to disk as soon as it is added.
+    Jpeg images are embedded as they are (DCTDecode), other formats are decoded one at a time and
+    compressed with zlib, so the memory used is about one page.
+
+    with PdfStreamWriter(pdf_path) as pdf:
+        pdf.add_image_file(path)
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, pdf_path, resolution=100.0):
+        self.pdf_path = pdf_path
+        self.scale = 72.0 / resolution
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+        self.file = open(pdf_path, 'wb')
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _new_id(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, dictionary, stream=None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % obj_id)
+        self.file.write(dictionary)
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def _add_page(self, image_dict, image_stream, width, height):
+        image_id, content_id, page_id = self._new_id(), self._new_id(), self._new_id()
+        self._write_object(image_id, image_dict, image_stream)
+
+        page_width, page_height = width * self.scale, height * self.scale
+        content = b'q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q' % (page_width, page_height)
+        self._write_object(content_id, b'<< /Length %d >>' % len(content), content)
+        self._write_object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] /Contents %d 0 R '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> >>'
+            % (self.PAGES_ID, page_width, page_height, content_id, image_id)
+        )
+        self.page_ids.append(page_id)
+
+    def add_jpeg(self, data):
+        """ Embeds jpeg bytes without decoding them """
+        width, height, components, is_adobe = read_jpeg_info(data)
+        color_space = JPEG_COLOR_SPACES.get(components)
+        if color_space is None:
+            raise ValueError(f'Unsupported jpeg with {components} components')
+        # cmyk jpegs written by Adobe (and PIL) store inverted values
+        decode = b' /Decode [1 0 1 0 1 0 1 0]' if components == 4 and is_adobe else b''
+        image_dict = (b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+                      b'/BitsPerComponent 8 /Filter /DCTDecode%s /Length %d >>'
+                      % (width, height, color_space, decode, len(data)))
+        self._add_page(image_dict, data, width, height)
+
+    def add_image(self, image):
+        """ Embeds a PIL image, pixels are compressed with zlib """
+        if image.mode not in ('L', 'RGB', 'CMYK'):
+            image = image.convert('RGB')
+        color_space = {'L': b'/DeviceGray', 'RGB': b'/DeviceRGB', 'CMYK': b'/DeviceCMYK'}[image.mode]
+        width, height = image.size
+        stream = zlib.compress(image.tobytes(), 6)
+        image_dict = (b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+                      b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>'
+                      % (width, height, color_space, len(stream)))
+        self._add_page(image_dict, stream, width, height)
+
+    def add_image_bytes(self, data):
+        if data[:2] == JPEG_MAGIC:
+            self.add_jpeg(data)
+        else:
+            with Image.open(io.BytesIO(data)) as image:
+                self.add_image(image)
+
+    def add_image_file(self, image_path):
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        self.add_image_bytes(data)
+
+    def close(self):
+        if self.file.closed:
+            return
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        self._write_object(self.CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES_ID)
+
+        xref_offset = self.file.tell()
+        self.file.write(b'xref\n0 %d\n' % self.next_id)
+        self.file.write(b'0000000000 65535 f \n')
+        for obj_id in range(1, self.next_id):
+            self.file.write(b'%010d 00000 n \n' % self.offsets[obj_id])
+        self.file.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                        % (self.next_id, self.CATALOG_ID, xref_offset))
+        self.file.close()
+
@@ -0,0 +1,233 @@
+import logging
+import os
+import re
+import zlib
+
+from ingestaweb.modules.pdf_validator import PdfStructure, PdfStructureError, OBJ_HEADER_RE, READ_CHUNK, \
+    MAX_OBJECT_SIZE, get_int, get_ref, read_dict, skip_string
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_RE = re.compile(rb'(?<![\w.+\-])(\d+)\s+(\d+)\s+R(?!\w)')
+COPY_CHUNK = 1024 * 1024
+# objects 1 and 2 of the merged file
+CATALOG_ID = 1
+PAGES_ID = 2
+
+
+def split_strings(data):
+    """ data as [(bytes, is_string)], strings being literal (...) and hex <...> strings """
+    segments = []
+    start = i = 0
+    while i < len(data):
+        char = data[i:i + 1]
+        if char == b'<' and data[i + 1:i + 2] == b'<':
+            i += 2
+            continue
+        if char == b'(':
+            end = skip_string(data, i)
+        elif char == b'<':
+            end = data.index(b'>', i) + 1
+        else:
+            i += 1
+            continue
+        segments.append((data[start:i], False))
+        segments.append((data[i:end], True))
+        start = i = end
+    segments.append((data[start:], False))
+    return segments
+
+
+def find_references(body):
+    return {int(match.group(1)) for segment, is_string in split_strings(body) if not is_string
+            for match in REFERENCE_RE.finditer(segment)}
+
+
+def renumber_references(body, numbers):
+    """ References rewritten with the new object numbers, references to missing objects become null """
+    def renumber(match):
+        number = numbers.get(int(match.group(1)))
+        return b'%d 0 R' % number if number else b'null'
+    return b''.join(segment if is_string else REFERENCE_RE.sub(renumber, segment)
+                    for segment, is_string in split_strings(body))
+
+
+class PdfMerger:
+    """
+    Concatenates pdfs (the pages of an edition) into a single file, one at a time and without loading them:
+    the objects reachable from the page tree of every pdf are copied with new numbers (stream data is copied
+    as is, in chunks) and its page tree becomes a kid of the page tree of the merged file, so page order
+    is the order of append. Object streams are expanded, encrypted pdfs are not supported.
+    Once a pdf can not be merged the merge has failed (`failed`): the merged file would miss pages, the next
+    appends are refused. `pages` is left to the caller to keep the pages merged, to upload them on their own then.
+
+        merger = PdfMerger(edition_path)
+        for page_pdf in pages:
+            merger.append(page_pdf)  # False if it could not be merged
+        merger.close()  # number of pages
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.f = open(output_path, 'wb')
+        self.f.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+        self.offsets = {}
+        self.next_id = PAGES_ID + 1
+        self.page_trees = []
+        self.page_count = 0
+        self.failed = False
+        self.pages = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    @staticmethod
+    def read_object(structure, number):
+        """ (body without the stream data, (stream offset, length) or None) of an object of the source pdf """
+        if number not in structure.offsets:
+            return structure.get_object(number).strip(), None
+        offset = structure.offsets[number]
+        size = READ_CHUNK
+        while True:
+            data = structure.read(offset, size)
+            header = OBJ_HEADER_RE.match(data)
+            if not header or int(header.group(1)) != number:
+                raise PdfStructureError(f'object {number} not at its xref offset')
+            start = header.end()
+            while data[start:start + 1].isspace():
+                start += 1
+            try:
+                if data[start:start + 2] != b'<<':
+                    return data[start:data.index(b'endobj', start)].strip(), None
+                dictionary, end = read_dict(data, start)
+                after = data[end:end + 16].lstrip()
+                if not after.startswith(b'stream'):
+                    data.index(b'endobj', end)
+                    return data[start:end], None
+                stream_start = data.index(b'stream', end) + len(b'stream')
+                stream_start += 2 if data[stream_start:stream_start + 2] == b'\r\n' else 1
+                break
+            except (PdfStructureError, ValueError):
+                if len(data) < size or size >= MAX_OBJECT_SIZE:
+                    raise PdfStructureError(f'object {number} could not be read')
+                size *= 4
+        length = get_int(dictionary, b'Length')
+        if length is None:
+            length_ref = get_ref(dictionary, b'Length')
+            if length_ref is None:
+                raise PdfStructureError(f'stream {number} without /Length')
+            length = int(structure.get_object(length_ref).split()[0])
+        if b'endstream' not in structure.read(offset + stream_start + length, 32):
+            raise PdfStructureError(f'wrong /Length in stream {number}')
+        return data[start:end], (offset + stream_start, length)
+
+    def collect(self, structure):
+        """ Objects reachable from the page tree of the source pdf: {number: (body, stream)} and page tree root """
+        if structure.encrypted:
+            raise PdfStructureError('encrypted pdf')
+        pages_root = get_ref(structure.get_dict(structure.root), b'Pages')
+        if pages_root is None:
+            raise PdfStructureError('catalog without /Pages')
+        known = structure.offsets.keys() | structure.compressed.keys()
+        objects = {}
+        pending = [pages_root]
+        while pending:
+            number = pending.pop()
+            if number in objects:
+                continue
+            objects[number] = self.read_object(structure, number)
+            pending.extend(reference for reference in find_references(objects[number][0])
+                           if reference in known and reference not in objects)
+        return objects, pages_root
+
+    def write_object(self, number, body, stream=None, source=None):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b'%d 0 obj\n' % number)
+        self.f.write(body)
+        if stream:
+            stream_offset, length = stream
+            self.f.write(b'\nstream\r\n')
+            source.seek(stream_offset)
+            while length > 0:
+                chunk = source.read(min(COPY_CHUNK, length))
+                if not chunk:
+                    raise PdfStructureError('stream data truncated')
+                self.f.write(chunk)
+                length -= len(chunk)
+            self.f.write(b'\r\nendstream')
+        self.f.write(b'\nendobj\n')
+
+    def append(self, fileobj):
+        """
+        Appends the pages of a pdf (file object), False if it could not be merged (or the merge already failed).
+        A pdf failing halfway is rolled back, the merged file is left as it was before it
+        """
+        if self.failed:
+            return False
+        position, next_id = self.f.tell(), self.next_id
+        try:
+            structure = PdfStructure(fileobj)
+            structure.load_xref(structure.check_header_and_trailer())
+            objects, pages_root = self.collect(structure)
+            count = get_int(read_dict(objects[pages_root][0], 0)[0], b'Count')
+            if count is None:
+                raise PdfStructureError('page tree without a direct /Count')
+            numbers = {number: next_id + i for i, number in enumerate(objects)}
+            self.next_id += len(objects)
+            for number, (body, stream) in objects.items():
+                body = renumber_references(body, numbers)
+                if number == pages_root:
+                    body = b'<< /Parent %d 0 R ' % PAGES_ID + body[2:]
+                self.write_object(numbers[number], body, stream, fileobj)
+        except (PdfStructureError, ValueError, IndexError, OSError, zlib.error) as e:
+            logger.warning(f"\tPdf not merged into {os.path.basename(self.output_path)}: {e}")
+            self.rollback(position, next_id)
+            self.failed = True
+            return False
+        self.page_trees.append(numbers[pages_root])
+        self.page_count += count
+        fileobj.seek(0)
+        return True
+
+    def rollback(self, position, next_id):
+        """ Drops the objects written since `position`, numbered from next_id """
+        for number in range(next_id, self.next_id):
+            self.offsets.pop(number, None)
+        self.next_id = next_id
+        self.f.seek(position)
+        self.f.truncate()
+
+    def append_file(self, pdf_path):
+        with open(pdf_path, 'rb') as f:
+            return self.append(f)
+
+    def close(self):
+        """ Writes the page tree, catalog, xref and trailer. Returns the number of pages """
+        if self.f.closed:
+            return self.page_count
+        kids = b' '.join(b'%d 0 R' % number for number in self.page_trees)
+        self.write_object(PAGES_ID, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, self.page_count))
+        self.write_object(CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_ID)
+        xref_offset = self.f.tell()
+        self.f.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for number in range(1, self.next_id):
+            self.f.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.f.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                     % (self.next_id, CATALOG_ID, xref_offset))
+        self.f.close()
+        return self.page_count
+
+    def abort(self):
+        """ Discards the merged file """
+        if not self.f.closed:
+            self.f.close()
+        try:
+            os.remove(self.output_path)
+        except OSError:
+            pass
@@ -0,0 +1,350 @@
+import logging
+import os
+import random
+import re
+import zlib
+
+import PyPDF2
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+HEADER_WINDOW = 1024
+TAIL_WINDOW = 4096
+READ_CHUNK = 64 * 1024
+MAX_OBJECT_SIZE = 4 * 1024 * 1024
+MAX_XREF_SECTIONS = 64
+# share of the pdfs that also get the full PyPDF2 parse
+DEEP_SAMPLE_RATE = getattr(Config, 'PDF_DEEP_VALIDATION_RATE', 0.05)
+
+REF_RE = r'\s+(\d+)\s+(\d+)\s+R'
+INT_RE = r'\s+(\d+)\b(?!\s+\d+\s+R)'
+OBJ_HEADER_RE = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+
+
+class PdfStructureError(ValueError):
+    """ The xref / trailer chain can not be followed without a full parse """
+
+
+def skip_string(data, i):
+    """ Index after the literal string starting at data[i] == '(' """
+    depth = 0
+    while i < len(data):
+        char = data[i:i + 1]
+        if char == b'\\':
+            i += 2
+            continue
+        if char == b'(':
+            depth += 1
+        elif char == b')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise PdfStructureError('unterminated string')
+
+
+def read_dict(data, start):
+    """
+    Dictionary starting at data[start] ('<<'), returns (top level bytes, end index).
+    Nested dictionaries and strings are left out of the top level bytes so their keys can not be mistaken
+    for the ones of the dictionary.
+    """
+    depth = 0
+    i = start
+    top_level = bytearray()
+    while i < len(data):
+        two = data[i:i + 2]
+        if two == b'<<':
+            depth += 1
+            i += 2
+            continue
+        if two == b'>>':
+            depth -= 1
+            i += 2
+            if depth == 0:
+                return bytes(top_level), i
+            continue
+        char = data[i:i + 1]
+        if char == b'(':
+            i = skip_string(data, i)
+            top_level += b' ()'
+            continue
+        if char == b'<':
+            end = data.find(b'>', i)
+            if end < 0:
+                break
+            i = end + 1
+            top_level += b' <>'
+            continue
+        if depth == 1:
+            top_level += char
+        i += 1
+    raise PdfStructureError('unterminated dictionary')
+
+
+def get_ref(dictionary, key):
+    match = re.search(rb'/' + key + REF_RE.encode(), dictionary)
+    return int(match.group(1)) if match else None
+
+
+def get_int(dictionary, key):
+    match = re.search(rb'/' + key + INT_RE.encode(), dictionary)
+    return int(match.group(1)) if match else None
+
+
+def get_int_array(dictionary, key):
+    match = re.search(rb'/' + key + rb'\s*\[([\d\s]*)\]', dictionary)
+    return [int(x) for x in match.group(1).split()] if match else None
+
+
+def png_unpredict(data, columns):
+    """ Reverts the PNG predictors (/Predictor >= 10) of a stream with one byte per pixel """
+    row_size = columns + 1
+    previous = bytearray(columns)
+    output = bytearray()
+    for row_start in range(0, len(data), row_size):
+        filter_type = data[row_start]
+        row = bytearray(data[row_start + 1:row_start + row_size])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            up_left = previous[i - 1] if i else 0
+            if filter_type == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif filter_type == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif filter_type == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif filter_type == 4:
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                predictor = left if pa <= pb and pa <= pc else up if pb <= pc else up_left
+                row[i] = (row[i] + predictor) & 0xFF
+        output += row
+        previous = row
+    return bytes(output)
+
+
+class PdfStructure:
+    """
+    Minimal reader of the pdf structure: header, trailer, cross-reference sections (tables and streams,
+    following /Prev) and the few objects needed to get to the page tree. Page objects are never built.
+    """
+
+    def __init__(self, fileobj):
+        self.f = fileobj
+        self.f.seek(0, os.SEEK_END)
+        self.size = self.f.tell()
+        self.offsets = {}
+        self.compressed = {}
+        self.root = None
+        self.encrypted = False
+        self._object_streams = {}
+
+    def read(self, offset, size):
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def check_header_and_trailer(self):
+        """
+        %PDF header, %%EOF marker and startxref offset, returns the offset. Readers also accept a header after
+        junk bytes or trailing bytes after %%EOF beyond these windows, so a miss is not conclusive
+        (PdfStructureError) and the deep tier decides
+        """
+        if b'%PDF-' not in self.read(0, HEADER_WINDOW):
+            raise PdfStructureError(f'no %PDF- header in the first {HEADER_WINDOW} bytes')
+        tail = self.read(max(0, self.size - TAIL_WINDOW), TAIL_WINDOW)
+        if b'%%EOF' not in tail:
+            raise PdfStructureError(f'no %%EOF in the last {TAIL_WINDOW} bytes')
+        position = tail.rfind(b'startxref')
+        match = STARTXREF_RE.match(tail, position) if position >= 0 else None
+        if not match or int(match.group(1)) >= self.size:
+            raise PdfStructureError('startxref missing or past the end of the file')
+        return int(match.group(1))
+
+    def read_until(self, offset, marker, limit=MAX_OBJECT_SIZE):
+        data = b''
+        while len(data) < limit and offset + len(data) < self.size:
+            data += self.read(offset + len(data), READ_CHUNK)
+            if marker in data:
+                return data
+        raise PdfStructureError(f'{marker!r} not found at {offset}')
+
+    def load_xref(self, startxref):
+        offset = startxref
+        seen = set()
+        while offset is not None and offset not in seen and len(seen) < MAX_XREF_SECTIONS:
+            seen.add(offset)
+            head = self.read(offset, 64)
+            if head.lstrip().startswith(b'xref'):
+                trailer = self.load_xref_table(offset)
+                hybrid = get_int(trailer, b'XRefStm')
+                if hybrid is not None:
+                    self.load_xref_stream(hybrid)
+            else:
+                trailer = self.load_xref_stream(offset)
+            if self.root is None:
+                self.root = get_ref(trailer, b'Root')
+            self.encrypted = self.encrypted or b'/Encrypt' in trailer
+            offset = get_int(trailer, b'Prev')
+        if self.root is None:
+            raise PdfStructureError('no /Root in trailer')
+
+    def load_xref_table(self, offset):
+        data = self.read_until(offset, b'trailer')
+        table, _, rest = data.partition(b'trailer')
+        tokens = table.split()[1:]
+        i = 0
+        while i + 1 < len(tokens):
+            first, count = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for number in range(first, first + count):
+                entry_offset, _, kind = tokens[i:i + 3]
+                i += 3
+                if kind == b'n':
+                    self.offsets.setdefault(number, int(entry_offset))
+        rest_offset = offset + len(table) + len(b'trailer')
+        rest = self.read_until(rest_offset, b'startxref')
+        return read_dict(rest, rest.index(b'<<'))[0]
+
+    def read_stream(self, offset):
+        """ (top level dictionary, decoded data) of the stream object at offset """
+        data = self.read_until(offset, b'stream')
+        dict_start = data.index(b'<<')
+        dictionary, end = read_dict(data, dict_start)
+        stream_start = data.index(b'stream', end) + len(b'stream')
+        stream_start += 2 if data[stream_start:stream_start + 2] == b'\r\n' else 1
+        length = get_int(dictionary, b'Length')
+        if length is None:
+            length_ref = get_ref(dictionary, b'Length')
+            if length_ref is None:
+                raise PdfStructureError('stream without /Length')
+            length = get_int(b'/L ' + self.get_object(length_ref).strip(), b'L')
+        raw = self.read(offset + stream_start, length)
+        if re.search(rb'/Filter\s*\[?\s*/FlateDecode\s*\]?', dictionary):
+            raw = zlib.decompress(raw)
+        elif b'/Filter' in dictionary:
+            raise PdfStructureError('unsupported stream filter')
+        predictor = get_int(data[dict_start:end], b'Predictor')
+        if predictor and predictor >= 10:
+            raw = png_unpredict(raw, get_int(data[dict_start:end], b'Columns') or 1)
+        return dictionary, raw
+
+    def load_xref_stream(self, offset):
+        dictionary, data = self.read_stream(offset)
+        widths = get_int_array(dictionary, b'W')
+        if not widths or len(widths) != 3:
+            raise PdfStructureError('xref stream without /W')
+        index = get_int_array(dictionary, b'Index') or [0, get_int(dictionary, b'Size') or 0]
+        entry_size = sum(widths)
+        position = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for number in range(first, first + count):
+                entry = data[position:position + entry_size]
+                position += entry_size
+                fields, cursor = [], 0
+                for width in widths:
+                    fields.append(int.from_bytes(entry[cursor:cursor + width], 'big'))
+                    cursor += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.offsets.setdefault(number, fields[1])
+                elif kind == 2 and number not in self.offsets:
+                    self.compressed.setdefault(number, (fields[1], fields[2]))
+        return dictionary
+
+    def get_object(self, number):
+        """ Bytes of an object body (after 'N G obj') """
+        if number in self.offsets:
+            data = self.read_until(self.offsets[number], b'endobj')
+            header = OBJ_HEADER_RE.match(data)
+            if not header or int(header.group(1)) != number:
+                raise PdfStructureError(f'object {number} not at its xref offset')
+            return data[header.end():data.index(b'endobj')]
+        if number in self.compressed:
+            stream_number, index = self.compressed[number]
+            objects = self.load_object_stream(stream_number)
+            return objects[index]
+        raise PdfStructureError(f'object {number} not in xref')
+
+    def load_object_stream(self, stream_number):
+        if stream_number not in self._object_streams:
+            if stream_number not in self.offsets:
+                raise PdfStructureError(f'object stream {stream_number} not in xref')
+            dictionary, data = self.read_stream(self.offsets[stream_number])
+            count, first = get_int(dictionary, b'N'), get_int(dictionary, b'First')
+            pairs = [int(x) for x in data[:first].split()[:2 * count]]
+            starts = [first + offset for offset in pairs[1::2]] + [len(data)]
+            self._object_streams[stream_number] = [data[starts[i]:starts[i + 1]] for i in range(count)]
+        return self._object_streams[stream_number]
+
+    def get_dict(self, number):
+        body = self.get_object(number)
+        return read_dict(body, body.index(b'<<'))[0]
+
+    def page_count(self):
+        pages = get_ref(self.get_dict(self.root), b'Pages')
+        if pages is None:
+            raise PdfStructureError('catalog without /Pages')
+        count = get_int(self.get_dict(pages), b'Count')
+        if count is None:
+            raise PdfStructureError('page tree without a direct /Count')
+        return count
+
+
+def fast_page_count(fileobj):
+    """
+    Fast tier: header magic, %%EOF, startxref and the /Count of the page tree read through the xref.
+        0 -> empty file
+        None -> the structure could not be followed (header or %%EOF not where expected, truncated, broken xref,
+                unsupported filter...), needs the deep tier
+    """
+    try:
+        structure = PdfStructure(fileobj)
+        if not structure.size:
+            return 0
+        structure.load_xref(structure.check_header_and_trailer())
+        return structure.page_count()
+    except (PdfStructureError, ValueError, IndexError, zlib.error) as e:
+        logger.debug(f"Fast pdf validation not conclusive: {e}")
+        return None
+    finally:
+        fileobj.seek(0)
+
+
+def deep_page_count(fileobj):
+    """ Deep tier: full PyPDF2 parse, 0 when it can not be read """
+    try:
+        fileobj.seek(0)
+        reader = PyPDF2.PdfReader(fileobj)
+        if reader.is_encrypted:
+            # owner password only (printing/copy restrictions), readable with an empty user password
+            reader.decrypt('')
+        return len(reader.pages)
+    except Exception:
+        return 0
+    finally:
+        fileobj.seek(0)
+
+
+def is_valid_pdf(file_path=None, fileobj=None, deep=False, sample_rate=None):
+    """
+    True if the pdf has at least one page. The fast tier decides unless it is not conclusive,
+    `deep` is requested or the pdf is picked for the deep tier sample (`sample_rate`, Config.PDF_DEEP_VALIDATION_RATE)
+    """
+    if fileobj is None:
+        with open(file_path, 'rb') as f:
+            return is_valid_pdf(fileobj=f, deep=deep, sample_rate=sample_rate)
+    sample_rate = DEEP_SAMPLE_RATE if sample_rate is None else sample_rate
+    pages = fast_page_count(fileobj)
+    if pages == 0:
+        return False
+    if pages is None or deep or random.random() < sample_rate:
+        deep_pages = deep_page_count(fileobj)
+        if pages is not None and deep_pages != pages:
+            logger.warning(f"Fast pdf validation counted {pages} pages, PyPDF2 {deep_pages}")
+        pages = deep_pages
+    return pages > 0
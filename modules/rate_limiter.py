@@ -0,0 +1,149 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+import datetime as dt
+from urllib.parse import urlparse
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+# responses meaning "slow down": the host rate is halved and the host is paused (Retry-After or backoff)
+RATE_LIMITED_STATUSES = (429, 503)
+# requests per second and burst allowed per host, before any 429/503
+HOST_RATE = getattr(Config, 'HOST_RATE', 1 / getattr(Config, 'PAGE_FETCH_HOST_INTERVAL', 0.2))
+HOST_BURST = getattr(Config, 'HOST_BURST', 5)
+HOST_MIN_RATE = getattr(Config, 'HOST_MIN_RATE', 0.1)
+# times a request answered with 429/503 is sent again
+RATE_LIMIT_RETRIES = getattr(Config, 'RATE_LIMIT_RETRIES', 3)
+BACKOFF_BASE = getattr(Config, 'BACKOFF_BASE', 1)
+BACKOFF_CAP = getattr(Config, 'BACKOFF_CAP', 60)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """ Exponential backoff with full jitter: random wait between 0 and base * 2 ** attempt (at most cap) """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """ Seconds to wait from a Retry-After header (seconds or http date), None if missing or not valid """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """ State of a host, only changed with the lock of the limiter held """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.strikes = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(0, now - self.updated) * self.rate)
+        self.updated = now
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket per host shared by every thread: `rate` requests per second with bursts of `burst`.
+    The limiter learns from the responses (observe / feedback):
+        - 429 / 503: the rate of the host is halved (down to min_rate) and the host is paused for the
+          Retry-After of the response or, without it, a jittered exponential backoff
+        - any other response: the rate grows back a tenth of `rate` at a time, up to `rate`
+
+        host_limiter.acquire(url)
+        response = session.get(url)
+        host_limiter.observe(url, response)
+    """
+
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST, min_rate=HOST_MIN_RATE, backoff_base=BACKOFF_BASE,
+                 backoff_cap=BACKOFF_CAP):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host(url):
+        return urlparse(url).netloc or url
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    def acquire(self, url):
+        """ Blocks until a request to the host of url can be sent, returns the seconds waited """
+        host = self.host(url)
+        waited = 0
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                reserved = bucket.blocked_until <= now
+                if reserved:
+                    # the token is taken now, the thread sleeps until the bucket would have had it
+                    bucket.refill(now)
+                    bucket.tokens -= 1
+                    delay = -bucket.tokens / bucket.rate if bucket.tokens < 0 else 0
+                else:
+                    delay = bucket.blocked_until - now
+            if delay > 0:
+                time.sleep(delay)
+                waited += delay
+            if reserved:
+                return waited
+
+    def feedback(self, url, status_code, retry_after=None):
+        """ Adapts the rate of the host to a response, returns the pause applied to the host (0 if none) """
+        host = self.host(url)
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            if status_code not in RATE_LIMITED_STATUSES:
+                bucket.strikes = 0
+                if bucket.rate < self.rate:
+                    bucket.rate = min(self.rate, bucket.rate + self.rate / 10)
+                return 0
+            delay = retry_after if retry_after is not None \
+                else backoff_delay(bucket.strikes, self.backoff_base, self.backoff_cap)
+            bucket.strikes += 1
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.refill(now)
+            bucket.tokens = min(bucket.tokens, 0)
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+            # no tokens are earned while the host is paused
+            bucket.updated = bucket.blocked_until
+        logger.warning(f"\t{host} answered {status_code}, pausing {delay:.1f}s, rate {bucket.rate:.2f} req/s")
+        return delay
+
+    def observe(self, url, response):
+        return self.feedback(url, response.status_code,
+                             parse_retry_after(response.headers.get('Retry-After')))
+
+    def rates(self):
+        """ Current rate of every host seen """
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+host_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from ingestaweb.modules.rate_limiter import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# retries of an exception type: attempts in total (1 = not retried) and backoff, None fields take the defaults
+RetryPolicy = namedtuple('RetryPolicy', ['max_attempts', 'base', 'cap'], defaults=[None, None, None])
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class RetryMetrics:
+    """ Counters of a retried function: calls, attempts, retries, failures and latency of the calls """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.total_time = 0
+        self.max_time = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, attempts, elapsed, failed, error=None):
+        with self._lock:
+            self.calls += 1
+            self.attempts += attempts
+            self.failures += int(failed)
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            if error is not None:
+                self.last_error = repr(error)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.attempts - self.calls,
+                'failures': self.failures,
+                'avg_s': round(self.total_time / self.calls, 3) if self.calls else 0,
+                'max_s': round(self.max_time, 3),
+                'last_error': self.last_error,
+            }
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def get_metrics(name):
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = RetryMetrics(name)
+        return _metrics[name]
+
+
+def retry_metrics():
+    """ {function name: counters} of every retried function called so far """
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    return {metric.name: metric.as_dict() for metric in metrics}
+
+
+def log_retry_metrics():
+    for name, counters in retry_metrics().items():
+        logger.info(f"Retries {name}: {counters}")
+
+
+class RetryState:
+    """ Attempts of a single call: decides if (and how long) to wait before the next one """
+
+    def __init__(self, max_attempts, base, cap, deadline, retry_on, policies):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.retry_on = retry_on
+        self.policies = policies
+        self.start = time.monotonic()
+        if callable(deadline):
+            deadline = deadline()
+        self.deadline = self.start + deadline if deadline is not None else None
+        self.attempts = 0
+
+    def policy(self, error):
+        if error is not None:
+            for exc_type, policy in self.policies.items():
+                if isinstance(error, exc_type):
+                    return policy
+        return RetryPolicy()
+
+    def next_wait(self, error=None):
+        """ Seconds to wait before the next attempt, None if there is no next attempt """
+        if error is not None and not isinstance(error, self.retry_on):
+            return None
+        policy = self.policy(error)
+        max_attempts = policy.max_attempts if policy.max_attempts is not None else self.max_attempts
+        if max_attempts is not None and self.attempts >= max_attempts:
+            return None
+        wait = backoff_delay(self.attempts - 1,
+                             policy.base if policy.base is not None else self.base,
+                             policy.cap if policy.cap is not None else self.cap)
+        if self.deadline is not None and time.monotonic() + wait >= self.deadline:
+            return None
+        return wait
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+
+def retry(max_attempts=3, base=1, cap=60, deadline=None, retry_on=(Exception,), policies=None,
+          retry_if_result=None, name=None):
+    """
+    Decorator to retry a function (or a coroutine function, waits are then asyncio.sleep).
+        max_attempts:    calls in total, the first one included (None: until the deadline)
+        base, cap:       jittered exponential backoff between attempts (rate_limiter.backoff_delay)
+        deadline:        seconds for the whole call, no attempt starts if its wait would end past it
+                         (or a callable returning them when the call starts, e.g. the time left to a deadline)
+        retry_on:        exceptions retried, any other is raised at once
+        policies:        {exception type: RetryPolicy} overriding max_attempts/base/cap for that exception,
+                         e.g. {ftplib.error_perm: NO_RETRY}
+        retry_if_result: callable(result), True to retry on that result (e.g. lambda logged_in: not logged_in)
+    The last exception is raised once there are no attempts left, or the last result is returned.
+    Counters per function in retry_metrics() (`name`, qualified name of the function by default).
+    """
+    if max_attempts is None and deadline is None:
+        raise ValueError('retry needs max_attempts or a deadline')
+    policies = policies or {}
+
+    def retry_decorator(func):
+        metrics = get_metrics(name or func.__qualname__)
+
+        def new_state():
+            return RetryState(max_attempts, base, cap, deadline, retry_on, policies)
+
+        def outcome(state, result=None, error=None):
+            """ Wait before the next attempt or None, logging the failed attempt """
+            wait = state.next_wait(error)
+            reason = f'{type(error).__name__}: {error}' if error is not None else f'result {result!r}'
+            if wait is None:
+                logger.warning(f"\t{metrics.name}: attempt {state.attempts} failed ({reason}), giving up")
+            else:
+                logger.warning(f"\t{metrics.name}: attempt {state.attempts} failed ({reason}), "
+                               f"retrying in {wait:.1f}s")
+            return wait
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def retried_coroutine(*args, **kwargs):
+                state = new_state()
+                while True:
+                    state.attempts += 1
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        wait = outcome(state, error=e)
+                        if wait is None:
+                            metrics.record(state.attempts, state.elapsed, True, e)
+                            raise
+                        await asyncio.sleep(wait)
+                        continue
+                    if retry_if_result is None or not retry_if_result(result):
+                        metrics.record(state.attempts, state.elapsed, False)
+                        return result
+                    wait = outcome(state, result=result)
+                    if wait is None:
+                        metrics.record(state.attempts, state.elapsed, True)
+                        return result
+                    await asyncio.sleep(wait)
+
+            return retried_coroutine
+
+        @wraps(func)
+        def retried_function(*args, **kwargs):
+            state = new_state()
+            while True:
+                state.attempts += 1
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    wait = outcome(state, error=e)
+                    if wait is None:
+                        metrics.record(state.attempts, state.elapsed, True, e)
+                        raise
+                    time.sleep(wait)
+                    continue
+                if retry_if_result is None or not retry_if_result(result):
+                    metrics.record(state.attempts, state.elapsed, False)
+                    return result
+                wait = outcome(state, result=result)
+                if wait is None:
+                    metrics.record(state.attempts, state.elapsed, True)
+                    return result
+                time.sleep(wait)
+
+        return retried_function
+
+    return retry_decorator
+
+
+def is_falsy(result):
+    return not result
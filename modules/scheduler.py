@@ -0,0 +1,262 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ingestaweb.modules.async_http import http_engine, ASYNC_HTTP_TYPES
+from ingestaweb.modules.availability import availability, AVAILABILITY_PROBE, UNAVAILABLE
+from ingestaweb.modules.ftp import FTPUploadPool, get_today_folder
+from ingestaweb.modules.http_cache import http_cache
+from ingestaweb.modules.retrying import log_retry_metrics
+from ingestaweb.modules.supervisor import supervisor, SOURCE_TIMEOUT, LOGIN_DEADLINE
+from ingestaweb.modules.webdriver_pool import WebDriverPool
+from ingestaweb.settings import Config, DownloadStatus
+
+logger = logging.getLogger(__name__)
+
+HTTP_LANE = 'http'
+BROWSER_LANE = 'browser'
+# root sources of the http lane: download types that only make http requests, logged in without the browser
+HTTP_LANE_TYPES = ASYNC_HTTP_TYPES
+HTTP_LANE_LOGIN_TYPES = frozenset(getattr(Config, 'HTTP_LANE_LOGIN_TYPES', ('nologin', 'requests_basic')))
+# seconds a root source may run, the sources not started by then are marked failed
+HTTP_LANE_TIMEOUT = getattr(Config, 'HTTP_LANE_TIMEOUT', 15 * 60)
+BROWSER_LANE_TIMEOUT = getattr(Config, 'BROWSER_LANE_TIMEOUT', 60 * 60)
+# memory taken by a Chrome instance, bounds the browser lane to the memory available
+CHROME_MEMORY_MB = getattr(Config, 'CHROME_MEMORY_MB', 600)
+
+
+def lane_for(root_source):
+    """ HTTP_LANE when neither the login nor the download of the root source drive the browser """
+    download_type = (root_source.download_conf or {}).get('type')
+    login_type = (root_source.login_info or {}).get('type')
+    if download_type in HTTP_LANE_TYPES and login_type in HTTP_LANE_LOGIN_TYPES:
+        return HTTP_LANE
+    return BROWSER_LANE
+
+
+def chrome_capacity(memory_mb=CHROME_MEMORY_MB):
+    """ Chrome instances fitting in half of the available memory, None when it can not be read (not linux) """
+    try:
+        with open('/proc/meminfo') as f:
+            meminfo = dict(line.split(':', 1) for line in f)
+        available_mb = int(meminfo['MemAvailable'].split()[0]) // 1024
+    except (OSError, KeyError, ValueError):
+        return None
+    return max(1, available_mb // 2 // memory_mb)
+
+
+class Lane:
+    """
+    Executor of one kind of root sources: its own workers and queue, a deadline per root source and metrics
+    (time waited in the queue, run time, root sources failed or stopped by the deadline).
+    `run(root_source, deadline)` returns the number of sources skipped because of the deadline.
+    """
+
+    def __init__(self, name, workers, timeout, run):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.run = run
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'{name}-lane')
+        self.futures = {}
+        self._lock = threading.Lock()
+        self.queue_waits = []
+        self.durations = []
+        self.errors = 0
+        self.timed_out = 0
+
+    def submit(self, root_source):
+        self.futures[self.executor.submit(self._run, root_source, time.monotonic())] = root_source
+
+    def _run(self, root_source, queued_at):
+        start = time.monotonic()
+        skipped = 0
+        try:
+            skipped = self.run(root_source, start + self.timeout if self.timeout else None)
+        finally:
+            with self._lock:
+                self.queue_waits.append(start - queued_at)
+                self.durations.append(time.monotonic() - start)
+                self.timed_out += int(bool(skipped))
+
+    def wait(self):
+        for future in as_completed(self.futures):
+            try:
+                future.result()
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.error(f"ROOT_SOURCE: {self.futures[future].name} - Unexpected error: {e}")
+        self.executor.shutdown()
+
+    def report(self):
+        with self._lock:
+            durations, waits = list(self.durations), list(self.queue_waits)
+        return {
+            'workers': self.workers,
+            'root_sources': len(self.futures),
+            'errors': self.errors,
+            'timed_out': self.timed_out,
+            'queue_wait_max_s': round(max(waits), 1) if waits else 0,
+            'run_avg_s': round(sum(durations) / len(durations), 1) if durations else 0,
+            'run_max_s': round(max(durations), 1) if durations else 0,
+        }
+
+
+class DownloadScheduler:
+    """
+    Runs root sources concurrently in two lanes (see lane_for), so cheap http downloads do not wait behind
+    browser sessions:
+        - http lane: download types that only make requests (sent through the async http engine) and need no
+          browser login. Many workers (http_workers), they mostly wait on the network.
+        - browser lane: everything driving Chrome. `workers` workers, at most what the memory can hold
+          (chrome_capacity).
+    Every lane has its own queue, deadline per root source (HTTP_LANE_TIMEOUT, BROWSER_LANE_TIMEOUT) and
+    metrics, logged at the end of the run.
+
+    Each root source is a Scraper, so every worker drives its own requests session and Chrome instance.
+    Uploads go through a shared FTPUploadPool: downloaders queue the pdf and go on with the next source while
+    the pool sessions transfer it in the background. The run ends once every queued upload is finished, a source
+    with an upload out of retries is marked failed (upload_failed), even if it was already recorded as downloaded.
+    Database writes go through Db.set_download_status, which serializes access to Db.session and batches the
+    updates (flushed after every root source).
+    Chrome instances are leased from a shared WebDriverPool, so a browser started for one root source is reused
+    (with a clean profile) by the next ones.
+    Before the login every source is probed (see availability): the ones with nothing published yet are marked
+    unavailable, and a root source left without sources skips the login and the browser altogether.
+    Archive pages are cached for the run (http_cache), emptied when it starts and when it ends.
+    """
+
+    def __init__(self, db, workers=1, upload_pool=None, http_workers=None):
+        self.db = db
+        self.workers = max(1, int(workers))
+        capacity = chrome_capacity()
+        if capacity is not None and capacity < self.workers:
+            logger.warning(f"Browser lane limited to {capacity} workers by the memory available")
+            self.workers = capacity
+        self.http_workers = max(1, int(http_workers or getattr(Config, 'HTTP_LANE_WORKERS', 16)))
+        self.webdriver_pool = WebDriverPool(
+            max_drivers=getattr(Config, 'WEBDRIVER_POOL_SIZE', self.workers),
+            max_uses=getattr(Config, 'WEBDRIVER_MAX_USES', 10)
+        )
+        self.upload_pool = upload_pool or FTPUploadPool(
+            connections=getattr(Config, 'FTP_UPLOAD_CONNECTIONS', max(2, self.workers + 1)),
+            default_path=Config.FTP_DEFAULT_PATH,
+            workdir=get_today_folder(),
+            max_retries=getattr(Config, 'FTP_UPLOAD_RETRIES', 2)
+        )
+        # {dbsource id: reason} of the sources with an upload failed, their status can not be downloaded
+        self.upload_failures = {}
+        self._status_lock = threading.Lock()
+
+    def run(self, root_sources):
+        pending = [root_source for root_source in root_sources if root_source.sources_to_be_downloaded()]
+        lanes = {
+            HTTP_LANE: Lane(HTTP_LANE, self.http_workers, HTTP_LANE_TIMEOUT, self.download_root_source),
+            BROWSER_LANE: Lane(BROWSER_LANE, self.workers, BROWSER_LANE_TIMEOUT, self.download_root_source),
+        }
+        assigned = [(root_source, lane_for(root_source)) for root_source in pending]
+        logger.info(f"ROOT_SOURCES WITH PENDING SOURCES: {len(pending)} - "
+                    + " - ".join(f"{name.upper()} LANE: {sum(1 for _, lane in assigned if lane == name)} "
+                                 f"({lanes[name].workers} workers)" for name in lanes))
+        http_cache.clear()
+        try:
+            for root_source, lane in assigned:
+                root_source.webdriver_pool = self.webdriver_pool
+                lanes[lane].submit(root_source)
+            for lane in lanes.values():
+                lane.wait()
+        finally:
+            for name, lane in lanes.items():
+                lane.executor.shutdown()
+                logger.info(f"{name.upper()} LANE: {lane.report()}")
+            self.upload_pool.close()
+            # uploads failed after the status of their root source was written
+            self.db.flush_status_updates()
+            self.webdriver_pool.close()
+            if http_engine is not None:
+                http_engine.close()
+            log_retry_metrics()
+            logger.info(f"Http cache: {http_cache.stats()}")
+            http_cache.clear()
+
+    def set_download_status(self, source, downloaded, reason=None):
+        """ Status of a source, failed if one of its uploads already failed """
+        with self._status_lock:
+            if downloaded == DownloadStatus.SUCCESS and source.dbsource.id in self.upload_failures:
+                downloaded, reason = DownloadStatus.FAILED, self.upload_failures[source.dbsource.id]
+            self.db.set_download_status(source.dbsource, downloaded,
+                                        reason=reason if downloaded == DownloadStatus.FAILED else None)
+        return downloaded
+
+    def upload_failed(self, source, ftp_path, error):
+        """ Upload of a source out of retries (called by the upload pool): the source is failed """
+        reason = f"ftp: {type(error).__name__}: {error}"
+        logger.error(f"{source.name} - Download status: {DownloadStatus.FAILED}, {ftp_path} not uploaded")
+        with self._status_lock:
+            self.upload_failures[source.dbsource.id] = reason
+            self.db.set_download_status(source.dbsource, DownloadStatus.FAILED, reason=reason)
+
+    def skip_unavailable(self, root_source, sources):
+        """ Marks unavailable the sources whose probe finds nothing published, returns the other ones """
+        if not AVAILABILITY_PROBE:
+            return sources
+        pending = []
+        for source in sources:
+            if availability.check(root_source, source) == UNAVAILABLE:
+                logger.info(f"{source.name} - Download status: {DownloadStatus.UNAVAILABLE} (probe)")
+                self.db.set_download_status(source.dbsource, DownloadStatus.UNAVAILABLE)
+            else:
+                pending.append(source)
+        return pending
+
+    def download_root_source(self, root_source, deadline=None):
+        """ Returns the number of sources not downloaded because the deadline (time.monotonic) was reached """
+        skipped = 0
+        to_be_donwloaded = root_source.sources_to_be_downloaded()
+        logger.info(f"ROOT_SOURCE: {root_source.name} - Sources with pdf to be downloaded: {len(to_be_donwloaded)}")
+        try:
+            to_be_donwloaded = self.skip_unavailable(root_source, to_be_donwloaded)
+            if not to_be_donwloaded:
+                logger.info(f"ROOT_SOURCE: {root_source.name} - Nothing published yet, login skipped")
+                return skipped
+            # the login retries (scraping.Login) stop at the same deadline
+            with supervisor.watch(f"{root_source.name} (login)", root_source, timeout=LOGIN_DEADLINE) as watch:
+                with watch.phase('login'):
+                    root_source.login(root_source.login_info.get('type'))
+            if watch.timed_out:
+                # the browser was killed, the next source starts a new one
+                root_source.logged_in = False
+                root_source.close_webdriver_session()
+            login_status = root_source.handle_login_status()
+            for source in to_be_donwloaded:
+                downloaded = DownloadStatus.FAILED
+                reason = None
+                if deadline is not None and time.monotonic() > deadline:
+                    logger.error(f"{source.name} - Not started, root source deadline reached")
+                    self.db.set_download_status(source.dbsource, downloaded, reason='timeout: root source deadline')
+                    skipped += 1
+                    continue
+                timeout = SOURCE_TIMEOUT if deadline is None else max(1, min(SOURCE_TIMEOUT, deadline - time.monotonic()))
+                with supervisor.watch(source.name, root_source, timeout=timeout) as watch:
+                    try:
+                        logger.info(f"- SOURCE: {source.name}")
+                        # failed, downloaded, unavailable
+                        ftp = self.upload_pool.uploads_of(
+                            lambda ftp_path, error, source=source: self.upload_failed(source, ftp_path, error))
+                        downloaded = root_source.download(root_source.download_conf.get('type'), source, ftp)
+                        logger.info(f"{source.name} - Download status: {downloaded}")
+                    except Exception as e:
+                        reason = f"{type(e).__name__}: {e}"
+                        logger.error(f"\n Failed --> Login --> \n\tError: {e}") if 'failed' in login_status else None
+                        logger.error(f"\n Failed --> Download --> \n\tError: {e}") if downloaded == 'failed' else None
+                if watch.timed_out:
+                    downloaded, reason = DownloadStatus.FAILED, watch.reason
+                    root_source.close_webdriver_session()
+                if self.set_download_status(source, downloaded, reason) == DownloadStatus.SUCCESS:
+                    availability.downloaded(source)
+        finally:
+            root_source.close_webdriver_session()
+            self.db.flush_status_updates()
+        return skipped
@@ -1,34 +1,55 @@
 import os
-import random
 import re
-import time
+import shutil
 
-import PyPDF2
 import requests
 import datetime as dt
 import logging
 from urllib.parse import urlparse
 from lxml import etree
 from requests.auth import HTTPBasicAuth
-from selenium import webdriver
 from selenium.common.exceptions import WebDriverException, NoSuchElementException, TimeoutException
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
-from deep_translator import GoogleTranslator
 
+from ingestaweb.modules.async_http import http_engine, ASYNC_HTTP_TYPES
+from ingestaweb.modules.date_localization import date_localizer
+from ingestaweb.modules.date_template import get_template
+from ingestaweb.modules.download_watcher import DownloadWatcher
+from ingestaweb.modules.http_cache import http_cache
+from ingestaweb.modules.http_stream import stream_to_fileobj, DownloadError, STREAM_TIMEOUT
 from ingestaweb.modules.img_converter import build_pages
+from ingestaweb.modules.page_fetcher import PageFetcher
+from ingestaweb.modules.pdf_merger import PdfMerger
+from ingestaweb.modules.pdf_validator import is_valid_pdf
+from ingestaweb.modules.rate_limiter import host_limiter, RATE_LIMITED_STATUSES, RATE_LIMIT_RETRIES
+from ingestaweb.modules.retrying import retry, is_falsy
 from ingestaweb.modules.utils import parse_date_fmt_to_current_date, convert_date_to_source_fmt, \
-    make_pdf_file,  retry,  delete_files_in_folder, \
-    check_if_file_downloaded_and_rename_file, create_pdf_from_images, remove_jpg_files
+    make_pdf_buffer, \
+    check_if_file_downloaded_and_rename_file, create_pdf_from_images
+from ingestaweb.modules.session_store import session_store
+from ingestaweb.modules.supervisor import supervisor, phase, checkpoint, cancelled, request_timeout, login_deadline
+from ingestaweb.modules.webdriver_pool import build_chrome_driver
+from ingestaweb.modules.workspace import Workspace
 
-from ingestaweb.settings import TEMP_DIR_FILES, TEMP_DIR_IMAGES, Config, DownloadStatus
+from ingestaweb.settings import Config, DownloadStatus
 
 logger = logging.getLogger(__name__)
 
+SELENIUM_COOKIE_KEYS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry', 'sameSite')
+# editions downloaded page by page are uploaded as a single pdf (download_config 'merge_pages' overrides it)
+MERGE_PAGE_PDFS = getattr(Config, 'MERGE_PAGE_PDFS', False)
+# network errors retried by make_request (http answers, 429/503 included, are not exceptions)
+HTTP_RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+HTTP_RETRY_ATTEMPTS = getattr(Config, 'HTTP_RETRY_ATTEMPTS', 3)
+# (connect, read) seconds of the http requests, never past the deadline of the source (supervisor)
+HTTP_TIMEOUT = getattr(Config, 'HTTP_TIMEOUT', (10, 60))
+# pages clicked through at most by the page by page downloaders, in case the last page is never recognised
+MAX_EDITION_PAGES = getattr(Config, 'MAX_EDITION_PAGES', 500)
+
 
 class Login:
 
@@ -41,17 +62,79 @@ class Login:
 
     def perform_login(self, login_type, navigate=True):
         if not login_type == 'nologin':
+            if navigate and self.restore_session(login_type):
+                self.scraper.logged_in = True
+                return
             self.scraper.logged_in = self.types.get(login_type)() if login_type == 'requests_basic' \
                 else self.types.get(login_type)(navigate)
+            if self.scraper.logged_in:
+                self.save_session(login_type)
+
+    def restore_session(self, login_type):
+        """
+        Reuses the cookies saved after the last login (see SessionStore).
+        The session is validated with the login_validation xpath on the page the login flow checks it (the login
+        page, once logged in), or on login_info 'validation_url' when set. Cheaper than a full login.
+        """
+        root_source_id = getattr(self.scraper, 'id', None)
+        validation_xpath = self.scraper.login_info.get('login_validation')
+        validation_url = self.scraper.login_info.get('validation_url') or self.scraper.login_info.get('login_url')
+        if root_source_id is None or not validation_xpath or not validation_url:
+            return False
+        cookies = session_store.load(root_source_id, login_type)
+        if not cookies:
+            return False
+        is_valid = False
+        try:
+            if login_type == 'requests_basic':
+                self.scraper.create_session()
+                for cookie in cookies:
+                    self.scraper.remote_session.cookies.set(
+                        cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+                html_tree = self.scraper.extract_html_from_page(validation_url, cache=False)
+                is_valid = html_tree is not None and bool(html_tree.xpath(validation_xpath))
+            else:
+                self.scraper.is_webdriver_up(root_source_name=self.scraper.name)
+                self.scraper.chrome.get(validation_url)
+                for cookie in cookies:
+                    try:
+                        self.scraper.chrome.add_cookie(
+                            {key: value for key, value in cookie.items() if key in SELENIUM_COOKIE_KEYS})
+                    except WebDriverException:
+                        pass
+                self.scraper.chrome.get(validation_url)
+                is_valid = self.scraper.page_validation(validation_xpath, timeout=10)
+        except Exception as e:
+            logger.warning(f"\tImpossible to restore session: {e}")
+        if is_valid:
+            logger.info("\tSession restored")
+        else:
+            session_store.delete(root_source_id)
+        return is_valid
+
+    def save_session(self, login_type):
+        root_source_id = getattr(self.scraper, 'id', None)
+        if root_source_id is None or not session_store.enabled:
+            return
+        try:
+            if login_type == 'requests_basic':
+                cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                            'path': cookie.path, 'expiry': cookie.expires} for cookie in self.scraper.remote_session.cookies]
+            else:
+                cookies = self.scraper.chrome.get_cookies()
+            session_store.save(root_source_id, login_type, cookies)
+        except Exception as e:
+            logger.warning(f"\tImpossible to save session: {e}")
 
-    @retry(max_retries=3, wait_time=10)
+    @retry(max_attempts=3, base=10, deadline=login_deadline, retry_if_result=is_falsy)
     def requests_basic(self):
         is_logged_in = False
         try:
             self.scraper.create_session()
             response = self.scraper.remote_session.post(
                 self.scraper.login_info.get('login_url'),
-                data=self.scraper.login_info.get('payload')
+                data=self.scraper.login_info.get('payload'),
+                timeout=request_timeout(HTTP_TIMEOUT)
             )
 
             if response.ok:
@@ -64,7 +147,7 @@ class Login:
         finally:
             return is_logged_in
 
-    @retry(max_retries=1, wait_time=10)
+    @retry(max_attempts=2, base=10, deadline=login_deadline, retry_if_result=is_falsy)
     def selenium_basic(self, navigate=True):
         """
         1 -  navigate to login page
@@ -86,34 +169,31 @@ class Login:
             elif self.scraper.login_info.get('xpath_button_login_1'):
                 self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_button_login_1')).click()
                 self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_button_login_2')).click()
-            time.sleep(random.uniform(1, 2))
+            # every step waits for its field or button to be clickable, the form may be rendered after the click
             iframe_after_login_xpath = self.scraper.login_info.get('xpath_iframe_login_form')
             self.scraper.move_to_iframe(iframe_after_login_xpath)
             multistep = self.scraper.login_info.get('xpath_button_submit_1')
 
             # User
-            self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_box_user')) \
+            self.scraper.wait_clickable(self.scraper.login_info.get('xpath_box_user')) \
                 .send_keys(self.scraper.login_info.get('user'))
 
             # Submit if multistep
             if multistep:
-                self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_button_submit_1')).click()
-            time.sleep(random.uniform(2, 4))
+                self.scraper.wait_clickable(self.scraper.login_info.get('xpath_button_submit_1')).click()
             # Password
-            self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_box_pass')) \
-                .send_keys(self.scraper.login_info.get('password'))
-            time.sleep(random.uniform(2, 4))
+            password_box = self.scraper.wait_clickable(self.scraper.login_info.get('xpath_box_pass'))
+            password_box.send_keys(self.scraper.login_info.get('password'))
 
             # Submit
             if navigate:
                 if self.scraper.login_info.get('keys'):
-                    self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_box_pass')) \
-                        .send_keys(Keys.ENTER)
+                    password_box.send_keys(Keys.ENTER)
                 else:
-                    self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_button_submit')).click()
+                    self.scraper.wait_clickable(self.scraper.login_info.get('xpath_button_submit')).click()
             else:
-                self.scraper.search_element_by_path(self.scraper.login_info.get('xpath_button_submit_relogin')).click()
-            time.sleep(random.uniform(2, 4))
+                self.scraper.wait_clickable(self.scraper.login_info.get('xpath_button_submit_relogin')).click()
+            self.scraper.wait_for_navigation(password_box)
             self.scraper.accept_notifications(self.scraper.login_info.get('cookies'), sleep=5)
             if self.scraper.login_info.get('login_validation'):
                 self.scraper.chrome.switch_to.default_content()
@@ -132,6 +212,7 @@ class Login:
 class Download:
     def __init__(self, scraper):
         self.scraper = scraper
+        self.workspace = None
         self.d_types = {
             "standard_requests": self.download_pdf_content,
             "argia": self.argia,
@@ -163,7 +244,9 @@ class Download:
         try:
             if not self.scraper.remote_session:
                 self.scraper.create_session()
-            download = self.d_types.get(download_type)(source, ftp)
+            # every source run gets its own temp directory (files, images, browser downloads)
+            with Workspace(source.dirname) as self.workspace:
+                download = self.d_types.get(download_type)(source, ftp)
         finally:
             return download
 
@@ -179,13 +262,8 @@ class Download:
         post = True if self.scraper.download_conf.get('post') else False
         url = None
         try:
-            if source.edition:
-                url = parse_date_fmt_to_current_date(
-                    url=self.scraper.download_conf.get('url').replace("{edition}", source.edition))
-            else:
-                url = parse_date_fmt_to_current_date(
-                    url=self.scraper.download_conf.get('url')
-                )
+            url = parse_date_fmt_to_current_date(url=self.scraper.download_conf.get('url'),
+                                                 edition=source.edition or None)
             if self.scraper.name == 'Viva':
                 url = self.uppercase_between_words(url)
         except Exception as e:
@@ -194,42 +272,39 @@ class Download:
             return url, post
 
     @staticmethod
-    def check_pdf_is_valid(file_path):
-        with open(file_path, 'rb') as f:
-            try:
-                reader = PyPDF2.PdfReader(f)
-                num_pages = len(reader.pages)
-                if num_pages > 0:
-                    return True
-                else:
-                    return False
-            except Exception as e:
-                return False
+    def check_pdf_is_valid(file_path=None, fileobj=None, deep=False):
+        """
+        Validates a pdf file, or an open file object (left at the start).
+        Structural check (header, %%EOF, xref, page count); the full PyPDF2 parse only runs for a sample
+        of the pdfs, when the structure can not be followed or when deep=True (see pdf_validator)
+        """
+        try:
+            return is_valid_pdf(file_path=file_path, fileobj=fileobj, deep=deep)
+        except OSError as e:
+            logger.error(f"\tImpossible to read pdf {file_path}: {e}")
+            return False
 
     def download_pdf_content(self, source, ftp, url=None, filename=None, is_post_request=False, payload=None,
-                             edition=False):
+                             edition=False, merger=None):
+        """ With a merger the pdf is appended to the edition instead of uploaded (uploaded if it can not be merged) """
         downloaded = DownloadStatus.FAILED
         try:
             if not filename:
                 filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            # output_file_path = os.path.join(DOWNLOAD_DIR, self.scraper.name, f'{source.name}', filename)
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
             if self.scraper.download_conf.get('type') == 'standard_requests':
                 url, is_post_request = self.url_preprocess(source)
-            pdf_content = self.scraper.make_request(url, is_post_request=is_post_request, payload=payload)
+            # streamed, validated and uploaded from the buffer, the pdf never touches the download folder
+            with phase('fetch'):
+                pdf_buffer = self.scraper.stream_request(url, is_post_request=is_post_request, payload=payload)
 
-            if pdf_content:
+            if pdf_buffer:
                 try:
-                    created_file = make_pdf_file(pdf_content, output_file_path)
-                    is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
-                    if created_file and is_pdf_valid:
+                    if self.check_pdf_is_valid(fileobj=pdf_buffer):
                         downloaded = DownloadStatus.SUCCESS
-                        ftp.upload_file(
-                            local_file_path=os.path.dirname(output_file_path),
-                            ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
-                            filename=filename
-                        )
-                    delete_files_in_folder(os.path.dirname(output_file_path))
+                        with phase('upload'):
+                            self.add_page(merger, source, ftp, filename, fileobj=pdf_buffer)
+                    else:
+                        pdf_buffer.close()
                 except Exception as e:
                     logger.error(f"\tError while trying to save pdf \n Error:{e}")
             elif edition:
@@ -237,9 +312,71 @@ class Download:
                 downloaded = "failed"
             else:
                 downloaded = "unavailable"
+        except DownloadError as e:
+            logger.error(f"\tError while trying to download pdf \n Error: {e}")
         finally:
             return downloaded
 
+    def page_merger(self, source):
+        """ PdfMerger for the pages of the edition, None when the root source uploads one pdf per page """
+        if not self.scraper.download_conf.get('merge_pages', MERGE_PAGE_PDFS):
+            return None
+        # outside workspace.files, where the browser downloads are watched
+        return PdfMerger(os.path.join(self.workspace.path, f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'))
+
+    def add_page(self, merger, source, ftp, filename, fileobj=None, file_path=None):
+        """
+        Appends a page pdf (open file object, taken over, or file) to the merged edition, uploads it on its own
+        without merger. Once a page can not be merged the pages merged so far are uploaded on their own too,
+        and so are the next ones: the edition is never uploaded with pages missing
+        """
+        ftp_file_path = f"{self.scraper.dirname}/{source.dirname}"
+        if merger is not None and not merger.failed:
+            if merger.append(fileobj) if fileobj is not None else merger.append_file(file_path):
+                if file_path is None:
+                    # kept on disk until the edition is uploaded
+                    pages_dir = os.path.join(self.workspace.path, 'pages')
+                    os.makedirs(pages_dir, exist_ok=True)
+                    file_path = os.path.join(pages_dir, filename)
+                    with open(file_path, 'wb') as f:
+                        shutil.copyfileobj(fileobj, f)
+                    fileobj.close()
+                merger.pages.append((file_path, filename))
+                return True
+            logger.warning(f"\t{source.name} - Pages not merged, {len(merger.pages) + 1} pages uploaded on their own")
+            for page_path, page_filename in merger.pages:
+                ftp.upload_file(os.path.dirname(page_path), ftp_file_path, page_filename)
+            merger.pages = []
+        if fileobj is not None:
+            return ftp.upload_fileobj(fileobj, ftp_file_path=ftp_file_path, filename=filename)
+        return ftp.upload_file(local_file_path=os.path.dirname(file_path), ftp_file_path=ftp_file_path,
+                               filename=filename)
+
+    def upload_merged_pages(self, merger, source, ftp):
+        """
+        Closes the merged edition and uploads it. False if pages were merged but could not be uploaded.
+        Nothing to upload when the merge failed, the pages went on their own (see add_page)
+        """
+        try:
+            if merger.failed:
+                merger.abort()
+                return True
+            with phase('assemble'):
+                if not merger.close():
+                    return True
+                if not self.check_pdf_is_valid(file_path=merger.output_path):
+                    return False
+            with phase('upload'):
+                return ftp.upload_file(
+                    local_file_path=os.path.dirname(merger.output_path),
+                    ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
+                    filename=os.path.basename(merger.output_path)
+                )
+        except Exception as e:
+            logger.error(f"\tError while trying to merge pages of {source.name} \n Error:{e}")
+            merger.abort()
+            return False
+
     def set_download_path(self, file_path):
         params = {'behavior': 'allow', 'downloadPath': os.path.dirname(file_path)}
         self.scraper.chrome.execute_cdp_cmd('Page.setDownloadBehavior', params)
@@ -251,6 +388,21 @@ class Download:
             'outputFile': file_path
         })
 
+    def download_pages(self, page_url, output_dir=None):
+        """
+        Download every page image of an edition, page_url(c) returns the url of page c.
+        Returns the paths of the downloaded pages (empty list when there is no edition)
+        """
+        watch = supervisor.current()
+
+        def fetch(url):
+            # pages are fetched by the threads of the PageFetcher, under the deadlines of the source
+            with supervisor.attach(watch):
+                return self.scraper.make_request(url, return_content=False, throttle=False, return_errors=True)
+
+        with phase('fetch'):
+            return PageFetcher(fetch=fetch, page_url=page_url).download(output_dir or self.workspace.images)
+
     def issuu(self, source, ftp):
         downloaded = DownloadStatus.FAILED
         editions_list = []
@@ -270,8 +422,7 @@ class Download:
 
             library_html_tree = issuu_get_library_html()
             date_format = '%B %#d, %Y'
-            formatted_date = convert_date_to_source_fmt(date_format)
-            formatted_date_en = self.scraper.translate_date_to_source_lang(self.scraper, formatted_date)
+            formatted_date_en = self.scraper.localize_date_to_source_lang(self.scraper, date_format)
             xpath_today_edition = self.scraper.download_conf.get('url_edition').replace('{format_date}', formatted_date_en)
             if source.edition:
                 xpath_today_edition = xpath_today_edition.replace('{edition}', source.edition)
@@ -285,35 +436,23 @@ class Download:
                 for edition in editions_list:
                     edition_url = f'https://issuu.com{edition}'
                     endpoint = get_endpoint_form_url(edition_url)
-                    time.sleep(3)
+                    host_limiter.acquire(edition_url)
                     self.scraper.navigate_to_page(edition_url)
-                    time.sleep(3)
+                    self.scraper.wait_for_page_load()
                     html_edition = self.scraper.chrome.page_source
                     html_tree = etree.fromstring(html_edition, parser=etree.HTMLParser())
                     secure_url = html_tree.xpath("//meta[@property='og:image:secure_url']/@content")
                     if secure_url:
-                        limit = False
                         secure_url = secure_url[0]
-                        c = 1
-                        while not limit:
-                            print(f"Retrieving page {c}")
-                            page_resp = self.scraper.make_request(secure_url.replace("page_1.jpg", f"page_{c}.jpg"),
-                                                                  return_content=False)
-                            if page_resp:  # page_resp.ok
-                                with open(os.path.join(TEMP_DIR_IMAGES, f"page_{c:03d}.jpg"), 'wb') as img:
-                                    img.write(page_resp.content)
-                            else:
-                                limit = True
-                            c += 1
+                        self.download_pages(lambda c: secure_url.replace("page_1.jpg", f"page_{c}.jpg"))
                         # filename = f"issuu_{endpoint.replace('/', '_')}.pdf"
                         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-                        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+                        output_file_path = self.workspace.file_path(filename)
 
                         create_pdf_from_images(
-                            images_directory=TEMP_DIR_IMAGES,
+                            images_directory=self.workspace.images,
                             pdf_path=output_file_path)
 
-                        remove_jpg_files(TEMP_DIR_IMAGES)
                         # downloaded_files.append(check_if_file_exists(output_file_path))
                         # downloaded = all(downloaded_files)
                         is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, rename_raw_file=False)
@@ -322,7 +461,6 @@ class Download:
                             ftp.upload_file(os.path.dirname(output_file_path), f"{self.scraper.dirname}/{source.dirname}",
                                             filename)
                             downloaded = DownloadStatus.SUCCESS
-                            delete_files_in_folder(os.path.dirname(output_file_path))
             else:
                 downloaded = "unavailable"
         finally:
@@ -333,7 +471,7 @@ class Download:
         try:
             self.scraper.navigate(url=self.scraper.login_info.get('url'))
             filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+            output_file_path = self.workspace.file_path(filename)
 
             current_date = convert_date_to_source_fmt(self.scraper.download_conf.get('date_fmt'))
             current_date = re.sub(r'[^0-9a-zA-Z]*([a-zA-Z])', lambda x: x.group(0).upper(), current_date, count=1)
@@ -372,7 +510,7 @@ class Download:
                                 page_resp = self.scraper.make_request(url_page_elem, return_content=False)
                                 if page_resp:  # page_resp.ok
                                     extension = '_fg.png' if 'fg' in url_page_elem else '_bg.jpeg'
-                                    with open(os.path.join(TEMP_DIR_IMAGES, f'page{page:03d}{extension}'), 'wb') as img:
+                                    with open(os.path.join(self.workspace.images, f'page{page:03d}{extension}'), 'wb') as img:
                                         img.write(page_resp.content)
                         else:
                             page_is_rendered = False
@@ -380,16 +518,11 @@ class Download:
                         if page == total_pages + 1:
                             page_is_rendered = False
                     has_next = False if page >= total_pages else True
-                status = build_pages(total_pages, os.path.join(TEMP_DIR_IMAGES, 'mounted_images'))
-                if status:
-                    create_pdf_from_images(os.path.join(TEMP_DIR_IMAGES, 'mounted_images'), output_file_path)
-                    remove_jpg_files(os.path.join(TEMP_DIR_IMAGES))
-                    remove_jpg_files(os.path.join(TEMP_DIR_IMAGES, 'mounted_images'))
+                build_pages(total_pages, output_file_path, images_path=self.workspace.images)
                 is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, rename_raw_file=False)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(os.path.dirname(output_file_path), f"{self.scraper.dirname}/{source.dirname}", filename)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
                     downloaded = DownloadStatus.SUCCESS
             else:
                 downloaded = "unavailable"
@@ -400,14 +533,13 @@ class Download:
         downloaded = DownloadStatus.FAILED
         try:
             filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+            output_file_path = self.workspace.file_path(filename)
 
             html_tree = self.scraper.extract_html_from_page(
                 url=self.scraper.login_info.get('hemeroteca_url'),
                 scope='webdriver',
                 cookies=self.scraper.login_info.get('cookies')
             )
-            time.sleep(3)
 
             tmp_edition = parse_date_fmt_to_current_date(self.scraper.download_conf.get('url_edition'))
             edition = html_tree.xpath(tmp_edition)
@@ -417,22 +549,10 @@ class Download:
                 html_edition = self.scraper.extract_html_from_page(url=url)
                 page = html_edition.xpath(self.scraper.download_conf.get('page_url_format'))[0]
                 if page:
-                    limit = False
-                    c = 1
-                    while not limit:
-                        print(f"Retrieving page {c}")
-                        page_resp = self.scraper.make_request(page.replace("p1.jpg", f"p{c}.jpg"),
-                                                              return_content=False)
-                        if page_resp:  # page_resp.ok
-                            with open(os.path.join(TEMP_DIR_IMAGES, f'page_{c:03d}.jpg'), 'wb') as img:
-                                img.write(page_resp.content)
-                        else:  # elif page_resp.status_code == 403
-                            limit = True
-                        c += 1
+                    self.download_pages(lambda c: page.replace("p1.jpg", f"p{c}.jpg"))
                     create_pdf_from_images(
-                        images_directory=TEMP_DIR_IMAGES,
+                        images_directory=self.workspace.images,
                         pdf_path=output_file_path)
-                    remove_jpg_files(TEMP_DIR_IMAGES)
 
                     # downloaded_files.append(check_if_file_exists(output_file_path))
                     # downloaded = all(downloaded_files)
@@ -441,7 +561,6 @@ class Download:
                     if is_downloaded and is_pdf_valid:
                         ftp.upload_file(os.path.dirname(output_file_path), f"{self.scraper.dirname}/{source.dirname}",
                                         filename)
-                        delete_files_in_folder(os.path.dirname(output_file_path))
                         downloaded = "downloaded"
             else:
                 downloaded = "unavailable"
@@ -451,15 +570,16 @@ class Download:
     def lamanana(self, source, ftp):
         downloaded = DownloadStatus.FAILED
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
 
         self.set_download_path(output_file_path)
         try:
             url = parse_date_fmt_to_current_date(self.scraper.download_conf.get('url_pdf'))
             edition = self.scraper.find_elements_on_page(url)
             if edition:
+                watcher = DownloadWatcher(os.path.dirname(output_file_path))
                 edition.click()
-                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(
@@ -467,8 +587,6 @@ class Download:
                         ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
                         filename=filename
                     )
-                    time.sleep(3)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
                     downloaded = DownloadStatus.SUCCESS
             else:
                 downloaded = "unavailable"
@@ -481,41 +599,22 @@ class Download:
     def diariandorra(self, source, ftp):
 
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
         downloaded = DownloadStatus.FAILED
 
         try:
-            c = 1
             page = self.scraper.download_conf.get('url')
-            edition = self.scraper.make_request(page.replace('{page}', f'{c}'), return_content=False)
+            edition = self.download_pages(lambda c: page.replace("{page}", f"{c}"))
             if edition:
-                limit = False
-                page = self.scraper.download_conf.get('url')
-                while not limit:
-                    print(f"Retrieving page {c}")
-                    if c != 1:
-                        page_resp = self.scraper.make_request(page.replace("{page}", f"{c}"),
-                                                              return_content=False)
-                    else:
-                        page_resp = edition
-                    if page_resp:  # page_resp.ok
-                        with open(os.path.join(TEMP_DIR_IMAGES, f'page_{c:03d}.jpg'), 'wb') as img:
-                            img.write(page_resp.content)
-                    else:  # elif page_resp.status_code == 403
-                        limit = True
-                    c += 1
-                    time.sleep(random.randint(0, 3))
                 create_pdf_from_images(
-                    images_directory=TEMP_DIR_IMAGES,
+                    images_directory=self.workspace.images,
                     pdf_path=output_file_path)
-                remove_jpg_files(TEMP_DIR_IMAGES)
 
                 is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, rename_raw_file=False)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(os.path.dirname(output_file_path), f"{self.scraper.dirname}/{source.dirname}",
                                     filename)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
                     downloaded = "downloaded"
             else:
                 downloaded = "unavailable"
@@ -548,7 +647,7 @@ class Download:
         downloaded = DownloadStatus.FAILED
         try:
             filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+            output_file_path = self.workspace.file_path(filename)
             self.set_download_path(output_file_path)
 
             url_edition = parse_date_fmt_to_current_date(self.scraper.download_conf.get('url_edition'))
@@ -565,9 +664,10 @@ class Download:
                 if not_available is not None:
                     downloaded = DownloadStatus.UNAVAILABLE
                 else:
+                    watcher = DownloadWatcher(os.path.dirname(output_file_path))
                     self.scraper.search_element_by_path(xpath, clicable=True)
                     self.scraper.search_element_by_path(xpath_complete_edition, clicable=True)
-                    is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                    is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                     is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                     if is_downloaded and is_pdf_valid:
                         downloaded = DownloadStatus.SUCCESS
@@ -576,7 +676,6 @@ class Download:
                             ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
                             filename=filename
                         )
-                        delete_files_in_folder(os.path.dirname(output_file_path))
 
         except:
             downloaded = DownloadStatus.FAILED
@@ -654,14 +753,14 @@ class Download:
         count_downloaded = []
         page = 0
         next = DownloadStatus.SUCCESS
+        merger = self.page_merger(source)
         try:
+            # compiled once, every page rendered with the same date
+            url_template = get_template(self.scraper.download_conf.get('url'))
+            today = dt.datetime.now()
             while next == DownloadStatus.SUCCESS:
                 page += 1
-                url = parse_date_fmt_to_current_date(
-                    (self.scraper.download_conf.get('url')
-                     ).replace('{edition}', source.edition
-                               ).replace('{P}', f'{str(page).zfill(2)}')
-                )
+                url = url_template.render(date=today, edition=source.edition, page=page)
 
                 # output_file_name = os.path.join(DOWNLOAD_DIR, self.scraper.name, source.name,
                 #                 f'{source.name}_{dt.datetime.now():%d%m%Y}_{str(page).zfill(leading_zero)}.pdf')
@@ -670,18 +769,22 @@ class Download:
                     source,
                     ftp=ftp,
                     url=url,
-                    filename=filename
+                    filename=filename,
+                    merger=merger
                 )
                 if next == DownloadStatus.SUCCESS:
                     count_downloaded.append(next)
-                time.sleep(2)
             if len(count_downloaded) == 0:
                 downloaded = DownloadStatus.UNAVAILABLE
             else:
                 downloaded = DownloadStatus.SUCCESS
+            if merger and not self.upload_merged_pages(merger, source, ftp):
+                downloaded = DownloadStatus.FAILED
         except:
             downloaded = DownloadStatus.FAILED
         finally:
+            if merger:
+                merger.abort()
             return downloaded
 
     def gentedigital(self, source, ftp):
@@ -752,7 +855,9 @@ class Download:
         downloaded = DownloadStatus.FAILED
         try:
             filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+            output_file_path = self.workspace.file_path(filename)
+            # fresh browser for this source
+            self.scraper.close_webdriver_session()
             self.scraper.create_webdriver_session()
             self.set_download_path(output_file_path)
             self.scraper.navigate(self.scraper.login_info.get('hemeroteca_url'))
@@ -760,10 +865,10 @@ class Download:
 
             # library_html = self.scraper.extract_html_from_page(self.scraper.login_info.get('hemeroteca_url'))
             # if library_html is not None:
-            formatted_date = self.scraper.translate_date_to_source_lang(
+            formatted_date = self.scraper.localize_date_to_source_lang(
                 self.scraper,
-                convert_date_to_source_fmt(self.scraper.download_conf.get('date_fmt')).capitalize()
-            )
+                self.scraper.download_conf.get('date_fmt')
+            ).capitalize()
             xpath_edition_current_date = self.scraper.download_conf.get('url').replace('{format_date}', formatted_date).replace("'", "’")
             # raw_edition_url = self.scraper.get_xpath_field_from_html(library_html, xpath_edition_current_date)
             raw_edition_url = self.scraper.find_elements_on_page(
@@ -778,8 +883,9 @@ class Download:
                 edition = self.scraper.find_elements_on_page(self.scraper.download_conf.get('url_pdf'))
 
                 if edition:
+                    watcher = DownloadWatcher(os.path.dirname(output_file_path))
                     edition.click()
-                    is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                    is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                     is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                     if is_downloaded and is_pdf_valid:
                         ftp.upload_file(
@@ -787,8 +893,6 @@ class Download:
                             ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
                             filename=filename
                         )
-                        time.sleep(2)
-                        delete_files_in_folder(os.path.dirname(output_file_path))
                         downloaded = DownloadStatus.SUCCESS
 
                     else:
@@ -830,10 +934,9 @@ class Download:
         try:
             library_html_tree = self.scraper.extract_html_from_page(self.scraper.login_info.get('hemeroteca_url'))
             if library_html_tree:
-                formatted_date_raw = convert_date_to_source_fmt(self.scraper.download_conf.get('date_fmt'))
-                formatted_date = self.scraper.translate_date_to_source_lang(
+                formatted_date = self.scraper.localize_date_to_source_lang(
                     self.scraper,
-                    formatted_date_raw
+                    self.scraper.download_conf.get('date_fmt')
                 )
                 edition_xpath = self.scraper.download_conf.get('unformatted_xpath').replace('{format_date}', formatted_date)
                 edition_url = self.scraper.get_xpath_field_from_html(library_html_tree, edition_xpath)
@@ -865,18 +968,19 @@ class Download:
         downloaded = DownloadStatus.FAILED
         try:
             filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-            output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+            output_file_path = self.workspace.file_path(filename)
             self.set_download_path(output_file_path)
             # library_html_tree = self.scraper.extract_html_from_page(self.scraper.login_info.get('hemeroteca_url'))
             # if library_html_tree:
-            formatted_date_raw = convert_date_to_source_fmt(self.scraper.download_conf.get('date_fmt'))
-            formatted_date = self.scraper.translate_date_to_source_lang(self.scraper, formatted_date_raw)
+            formatted_date = self.scraper.localize_date_to_source_lang(
+                self.scraper, self.scraper.download_conf.get('date_fmt'))
             xpath_today_edition = self.scraper.download_conf.get('url').replace('{format_date}', formatted_date)
             # url_pdf = self.scraper.get_xpath_field_from_html(library_html_tree, xpath_today_edition)
             edition = self.scraper.find_elements_on_page(xpath_today_edition)
             if edition:
+                watcher = DownloadWatcher(os.path.dirname(output_file_path))
                 edition.click()
-                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(
@@ -885,8 +989,6 @@ class Download:
                         filename=filename
                     )
                     downloaded = DownloadStatus.SUCCESS
-                    time.sleep(2)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
             else:
                 downloaded = "unavailable"
         finally:
@@ -1069,7 +1171,7 @@ class Download:
 
         downloaded = DownloadStatus.FAILED
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
 
         self.set_download_path(output_file_path)
         # delete_file_extension(os.path.dirname(output_file_path), '.crdownload')
@@ -1078,20 +1180,18 @@ class Download:
                 parse_date_fmt_to_current_date(self.scraper.download_conf.get('click_edicion'))
             ).replace('{edition}', source.edition)
             if self.scraper.chrome.current_url != self.scraper.login_info.get('hemeroteca_url'):
-                time.sleep(1)
                 self.scraper.navigate_to_page(
                     self.scraper.login_info.get('hemeroteca_url'),
                     validation=self.scraper.download_conf.get('selected_source')
                 )
-            time.sleep(1)
-            self.scraper.search_element_by_path(self.scraper.download_conf.get('selected_source')).click()
-            time.sleep(1)
+            self.scraper.wait_clickable(self.scraper.download_conf.get('selected_source')).click()
+            # no edition element (waited for) -> unavailable
             edition_element = self.scraper.search_element_by_path(xpath_current_date_edition)
             if edition_element:
-                edition_element.click()
-                time.sleep(2)
-                self.scraper.search_element_by_path(self.scraper.download_conf.get('url_pdf')).click()
-                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                self.scraper.wait_clickable(xpath_current_date_edition).click()
+                watcher = DownloadWatcher(os.path.dirname(output_file_path))
+                self.scraper.wait_clickable(self.scraper.download_conf.get('url_pdf')).click()
+                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(
@@ -1100,8 +1200,6 @@ class Download:
                         filename=filename
                     )
                     downloaded = DownloadStatus.SUCCESS
-                    time.sleep(2)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
             else:
                 downloaded = DownloadStatus.UNAVAILABLE
         except Exception as e:
@@ -1124,13 +1222,13 @@ class Download:
         downloaded = DownloadStatus.FAILED
 
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
 
         self.set_download_path(output_file_path)
         # delete_file_extension(os.path.dirname(output_file_path), '.crdownload')
         try:
-            custom_date = convert_date_to_source_fmt(self.scraper.download_conf.get('date_fmt'))
-            custom_date = self.scraper.translate_date_to_source_lang(custom_date)
+            custom_date = self.scraper.localize_date_to_source_lang(
+                self.scraper, self.scraper.download_conf.get('date_fmt'))
             xpath_current_date = source.date.replace('{format_date}', custom_date)
             self.scraper.navigate_to_page(
                 self.scraper.download_conf.get('url'),
@@ -1141,12 +1239,13 @@ class Download:
             edition = self.scraper.search_element_by_path(xpath_current_date)
             if edition:
                 edition.click()
+                watcher = DownloadWatcher(os.path.dirname(output_file_path))
                 self.scraper.search_element_by_path(self.scraper.download_conf.get('url_pdf')).click()
                 # confirm_down = self.scraper.find_elements_on_page(self.scraper.download_conf.get('confirm_download'),
                 #                                                   single_element=True)
                 # if confirm_down:
                 #     confirm_down.click()
-                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(
@@ -1155,8 +1254,6 @@ class Download:
                         filename=filename
                     )
                     downloaded = DownloadStatus.SUCCESS
-                    time.sleep(2)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
             else:
                 downloaded = DownloadStatus.UNAVAILABLE
                 return False
@@ -1185,7 +1282,7 @@ class Download:
         downloaded = DownloadStatus.FAILED
 
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
 
         self.set_download_path(output_file_path)
         # delete_file_extension(os.path.dirname(output_file_path), '.crdownload')
@@ -1193,7 +1290,8 @@ class Download:
             if self.scraper.chrome.current_url != self.scraper.login_info.get('hemeroteca_url'):
                 self.scraper.navigate_to_page(
                     self.scraper.login_info.get('hemeroteca_url'))
-            time.sleep(5)
+            # the iframes are waited for by move_to_iframe
+            self.scraper.wait_for_page_load()
             if self.scraper.name == "Barron's":
                 self.scraper.move_to_iframe(self.scraper.download_conf.get('main_iframes'))
                 self.scraper.search_element_by_path(self.scraper.download_conf.get('edition_button')).click()
@@ -1219,10 +1317,11 @@ class Download:
                     self.scraper.move_to_iframe(self.scraper.download_conf.get('main_iframes'))
 
                 self.scraper.search_element_by_path(self.scraper.download_conf.get('pages')).click()
+                watcher = DownloadWatcher(os.path.dirname(output_file_path))
                 self.scraper.search_element_by_path(
                     self.scraper.download_conf.get('complete_edition_pdf')).click()
 
-                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
+                is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                 is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                 if is_downloaded and is_pdf_valid:
                     ftp.upload_file(
@@ -1230,8 +1329,6 @@ class Download:
                         ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
                         filename=filename)
                     downloaded = DownloadStatus.SUCCESS
-                    time.sleep(3)
-                    delete_files_in_folder(os.path.dirname(output_file_path))
             else:
                 downloaded = DownloadStatus.UNAVAILABLE
         except Exception as e:
@@ -1250,7 +1347,9 @@ class Download:
                 .move_by_offset(0, -total_scroll_height) \
                 .release() \
                 .perform()
-            time.sleep(2)
+            # the pages scrolled into view are rendered one after the other
+            self.scraper.wait_until_stable(
+                lambda: len(self.scraper.chrome.find_elements(By.XPATH, "//div[@data-page-container='true']")))
             status = 0
         except:
             pass
@@ -1295,8 +1394,9 @@ class Download:
         status_downloads = []
         reached_edition_url = False
         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}.pdf'
-        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
+        output_file_path = self.workspace.file_path(filename)
         self.set_download_path(output_file_path)
+        merger = self.page_merger(source)
 
         try:
             action = ActionChains(self.scraper.chrome)
@@ -1307,10 +1407,9 @@ class Download:
                 )
             # self.scraper.navigate(self.scraper.login_info.get('hemeroteca_url'),
             #                       validation=self.scraper.download_conf.get('validation_editions_page'))
-            url_today_edition = (parse_date_fmt_to_current_date(
-                self.scraper.download_conf.get('url_pdf_edition')
+            url_today_edition = parse_date_fmt_to_current_date(
+                self.scraper.download_conf.get('url_pdf_edition'), edition=source.edition
             )
-            ).replace('{edition}', source.edition)
 
             self.scraper.navigate_to_page(url_today_edition)
             if self.scraper.chrome.current_url == url_today_edition and self.scraper.chrome.title != '404 Not Found':
@@ -1319,10 +1418,10 @@ class Download:
             elif self.scraper.chrome.title == '404 Not Found':
                 downloaded = DownloadStatus.UNAVAILABLE
             else:
-                time.sleep(3)
                 web_login = self.scraper.find_elements_on_page(
                     self.scraper.download_conf.get('check_if_loged_in'),
-                    single_element=False
+                    single_element=False,
+                    sleep=3
                 )
                 if web_login:
                     self.scraper.login(login_type=self.scraper.login_info.get('type'), navigate=False)
@@ -1343,10 +1442,11 @@ class Download:
                 count_pages = 0
                 still_pages = True
                 while still_pages:
+                    checkpoint()
+                    if count_pages >= MAX_EDITION_PAGES:
+                        raise Exception(f"Last page {total_pages} not reached after {count_pages} pages")
                     # click to open popup to download each page.
-                    time.sleep(2)
-                    download_button = self.scraper.search_element_by_path(
-                        self.scraper.download_conf.get('download_button'))
+                    download_button = self.scraper.wait_clickable(self.scraper.download_conf.get('download_button'))
                     # action = ActionChains(self.scraper.chrome)
 
                     # perform the operation
@@ -1357,29 +1457,28 @@ class Download:
                         self.scraper.download_conf.get('pages_download_elems'), single_element=False, sleep=2)
 
                     for page in pages:
+                        watcher = DownloadWatcher(self.workspace.files)
                         page.click()
                         filename = f'{source.name}_{dt.datetime.now():%d%m%Y}_{str(count_pages + 1).zfill(3)}.pdf'
-                        output_file_path = os.path.join(TEMP_DIR_FILES, filename)
-                        is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path)
-                        time.sleep(1)
+                        output_file_path = self.workspace.file_path(filename)
+                        is_downloaded = check_if_file_downloaded_and_rename_file(output_file_path, watcher=watcher)
                         is_pdf_valid = self.check_pdf_is_valid(file_path=output_file_path)
                         if is_downloaded and is_pdf_valid:
-                            ftp.upload_file(
-                                local_file_path=os.path.dirname(output_file_path),
-                                ftp_file_path=f"{self.scraper.dirname}/{source.dirname}",
-                                filename=filename
-                            )
+                            self.add_page(merger, source, ftp, filename, file_path=output_file_path)
                             downloaded = DownloadStatus.SUCCESS
                         count_pages += 1
                     download_button.send_keys(Keys.ESCAPE)
                     if self.scraper.chrome.current_url.split('/')[-2] != total_pages:
+                        page_url = self.scraper.chrome.current_url
                         action.send_keys(Keys.ARROW_RIGHT).perform()
+                        # the next page has its own url, its download button is not the one of this page
+                        WebDriverWait(self.scraper.chrome, 10).until(EC.url_changes(page_url))
                     else:
                         still_pages = False
-                    time.sleep(1)
                     status_downloads.append(downloaded)
                 downloaded = DownloadStatus.SUCCESS if all([status for status in status_downloads]) else DownloadStatus.FAILED
-                delete_files_in_folder(os.path.dirname(output_file_path))
+                if merger and not self.upload_merged_pages(merger, source, ftp):
+                    downloaded = DownloadStatus.FAILED
 
             else:
                 downloaded = DownloadStatus.UNAVAILABLE
@@ -1387,13 +1486,16 @@ class Download:
             logger.error("\tError trying to get pdf file"
                          f" source: {source.name} \n Error: {e}")
         finally:
+            if merger:
+                merger.abort()
             return downloaded
 
 
 class Scraper:
 
-    def __init__(self, webdriver=False, headless=False):
+    def __init__(self, webdriver=False, headless=False, webdriver_pool=None):
         self.headless = headless
+        self.webdriver_pool = webdriver_pool
         self.chrome = self.create_webdriver_session() if webdriver else None
         self.remote_session = None
         self.logged_in = False
@@ -1406,6 +1508,10 @@ class Scraper:
         download = Download(self)
         return download.perform_download(download_type, source, ftp)
 
+    def download_url(self, source):
+        """ (url, post) of the download of a source, as standard_requests builds it """
+        return Download(self).url_preprocess(source)
+
     def is_webdriver_up(self, root_source_name):
         if not self.chrome:
             self.create_webdriver_session(root_source_name=root_source_name)
@@ -1431,55 +1537,23 @@ class Scraper:
 
     def close_webdriver_session(self):
         try:
-            self.chrome.quit()
-            self.webdriver = False
+            if self.chrome is not None:
+                if self.webdriver_pool is not None:
+                    self.webdriver_pool.release(self.chrome)
+                else:
+                    self.chrome.quit()
         except:
             pass
+        finally:
+            self.chrome = None
 
     def create_webdriver_session(self, root_source_name=None):
-        service = Service()
-        chrome_options = webdriver.ChromeOptions()
-        # chrome_options = Options()
-        # download_directory = {
-        #     "download.default_directory": f'{os.path.join(DOWNLOAD_DIR, root_source_name)}'}
-        # chrome_options.add_experimental_option(
-        #     "prefs", {
-        #         "download.default_directory": f'{os.path.join(DOWNLOAD_DIR, root_source_name)}',
-        #         "plugins.always_open_pdf_externally": True
-        #     }
-        # )
-        user_agent = Config.USER_AGENT
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.page_load_strategy = 'eager'
-        chrome_options.add_argument(f'user-agent={user_agent}')
-        chrome_options.add_argument("--disable-notifications")
-        chrome_options.add_argument("disable-infobars")
-        chrome_options.add_argument("start-maximized")
-        chrome_options.add_argument('--ignore-certificate-errors')
-        chrome_options.add_argument('--ignore-ssl-errors')
-        chrome_options.add_argument('--disable-extensions')
-        chrome_options.add_experimental_option(
-            "excludeSwitches",
-            ["enable-automation", "enable-logging", "disable-popup-blocking"]
-        )
-        if self.headless:
-            chrome_options.add_argument("--headless")
-
-        # driver = webdriver.Chrome(
-        #     executable_path=ChromeDriverManager().install(),
-        #     options=chrome_options
-        # )
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.chrome = driver
-
-        # from selenium import webdriver
-        # from selenium.webdriver.chrome.service import Service
-        #
-        # service = Service()
-        # options = webdriver.ChromeOptions()
-        # driver = webdriver.Chrome(service=service, options=options)
-        # # ...
-        # driver.quit()
+        """ Leases a warm driver from the webdriver pool when there is one, otherwise starts a new Chrome """
+        if self.webdriver_pool is not None:
+            self.chrome = self.webdriver_pool.acquire()
+        else:
+            self.chrome = build_chrome_driver(self.headless)
+        return self.chrome
 
     def set_cookies_from_browser(self, session):
         for cookie in self.chrome.get_cookies():
@@ -1509,10 +1583,10 @@ class Scraper:
             print(e)
             return False
 
-    def page_validation(self, validation_xpath):
+    def page_validation(self, validation_xpath, timeout=20):
         is_page_reached = False
         try:
-            element_present = WebDriverWait(self.chrome, 20) \
+            element_present = WebDriverWait(self.chrome, timeout) \
                 .until(EC.presence_of_element_located((By.XPATH, validation_xpath)))
             if element_present:
                 is_page_reached = True
@@ -1521,6 +1595,45 @@ class Scraper:
         finally:
             return is_page_reached
 
+    def wait_clickable(self, xpath, timeout=10):
+        """ Element of the xpath once it can be clicked (or typed in), TimeoutException if it never can """
+        return WebDriverWait(self.chrome, timeout).until(EC.element_to_be_clickable((By.XPATH, xpath)))
+
+    def wait_for_navigation(self, element, timeout=10):
+        """ Waits for the page holding element to be replaced and loaded, False if it stays (single page forms) """
+        try:
+            WebDriverWait(self.chrome, timeout).until(EC.staleness_of(element))
+        except TimeoutException:
+            return False
+        return self.wait_for_page_load()
+
+    def wait_until_stable(self, value, timeout=10, poll=0.5):
+        """ Waits until value() (e.g. a number of elements) is the same in two polls in a row, returns it """
+        last = []
+
+        def stable(driver):
+            current = value()
+            if last and last[-1] == current:
+                return True
+            last.append(current)
+            return False
+
+        try:
+            WebDriverWait(self.chrome, timeout, poll_frequency=poll).until(stable)
+        except TimeoutException:
+            pass
+        return value()
+
+    def wait_for_page_load(self, timeout=20):
+        """ Waits until the document of the current page is loaded, False on timeout """
+        try:
+            WebDriverWait(self.chrome, timeout).until(
+                lambda driver: driver.execute_script('return document.readyState') == 'complete')
+            return True
+        except TimeoutException:
+            logger.warning(f'\tPage not loaded after {timeout}s: {self.chrome.current_url}')
+            return False
+
     def navigate(self, url, cookies=None, validation=None, iframe_before_cookies=None):
         try:
             self.is_webdriver_up('default_folder')
@@ -1529,7 +1642,7 @@ class Scraper:
                 self.move_to_iframe(iframe_before_cookies)
             if cookies:
                 self.accept_notifications(cookies)
-            time.sleep(3)
+            self.wait_for_page_load()
             if validation:
                 page_reached = self.page_validation(validation)
                 assert page_reached is True
@@ -1575,7 +1688,8 @@ class Scraper:
         element = None
         try:
             if sleep:
-                time.sleep(sleep)
+                # up to `sleep` seconds for the element to show up
+                WebDriverWait(self.chrome, sleep).until(EC.presence_of_element_located((By.XPATH, xpath)))
             if single_element:
                 element = self.chrome.find_element(By.XPATH, xpath)
             else:
@@ -1602,16 +1716,46 @@ class Scraper:
             if iframe_xpath:
                 if back_to_default_content:
                     self.chrome.switch_to.default_content()
-                time.sleep(3)
-                iframe = self.chrome.find_element(By.XPATH, iframe_xpath)
-                self.chrome.switch_to.frame(iframe)
+                WebDriverWait(self.chrome, 10).until(
+                    EC.frame_to_be_available_and_switch_to_it((By.XPATH, iframe_xpath)))
                 return self.chrome
         except Exception as e:
             print(e)
 
-    def make_request(self, url, is_post_request=False, payload=None, auth=None, return_content=True):
-        response = self.remote_session.post(url=url, data=payload, auth=auth) if is_post_request \
-            else self.remote_session.get(url, auth=auth)
+    @retry(max_attempts=HTTP_RETRY_ATTEMPTS, retry_on=HTTP_RETRY_ERRORS, name='http.send')
+    def send(self, url, is_post_request=False, payload=None, auth=None):
+        checkpoint()
+        session = self.http_session()
+        timeout = request_timeout(HTTP_TIMEOUT)
+        return session.post(url=url, data=payload, auth=auth, timeout=timeout) if is_post_request \
+            else session.get(url, auth=auth, timeout=timeout)
+
+    def http_session(self):
+        """
+        Session for the http requests of the scraper: the async engine (async_http) for the download types that
+        never need the browser, the requests session otherwise. Both share the cookies of remote_session
+        """
+        download_conf = getattr(self, 'download_conf', None) or {}
+        if http_engine is not None and download_conf.get('type') in ASYNC_HTTP_TYPES:
+            return http_engine.session(self.remote_session)
+        return self.remote_session
+
+    def make_request(self, url, is_post_request=False, payload=None, auth=None, return_content=True, throttle=True,
+                     return_errors=False):
+        """
+        Requests go through the per host limiter, 429/503 answers are sent again once the host pause is over.
+        throttle=False when the caller already acquired the limiter (PageFetcher)
+        return_errors=True returns the response whatever its status, for the caller to tell a missing page from an error
+        """
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if throttle or attempt:
+                host_limiter.acquire(url)
+            response = self.send(url, is_post_request, payload, auth)
+            host_limiter.observe(url, response)
+            if response.status_code not in RATE_LIMITED_STATUSES:
+                break
+        if return_errors and not return_content:
+            return response
         if response.ok:
             if return_content:
                 return response.content
@@ -1620,18 +1764,52 @@ class Scraper:
         print(f'status_code: {response.status_code}')
         return None
 
-    def extract_html_from_page(self, url, scope='etree', auth=None, cookies=None):
+    def stream_request(self, url, is_post_request=False, payload=None, auth=None):
+        """
+        Streams a pdf into a buffer (in memory, spooled to disk when big) instead of loading response.content.
+        None if the server has no file (error status), DownloadError if the download failed: dropped, incomplete
+        or not a pdf (see http_stream.stream_to_fileobj)
+        """
+        pdf_buffer = make_pdf_buffer()
+        try:
+            sha256 = stream_to_fileobj(self.http_session(), url, pdf_buffer, is_post_request=is_post_request,
+                                       payload=payload, auth=auth, rate_limiter=host_limiter,
+                                       timeout=request_timeout(STREAM_TIMEOUT), cancelled=cancelled)
+        except Exception:
+            pdf_buffer.close()
+            raise
+        if sha256 is None:
+            pdf_buffer.close()
+            return None
+        logger.debug(f"\t{url} downloaded, sha256 {sha256}")
+        return pdf_buffer
+
+    def extract_html_from_page(self, url, scope='etree', auth=None, cookies=None, cache=True):
+        """
+        lxml tree of a page (requests, or the browser with scope='webdriver'), None if it can not be fetched.
+        Pages are cached for the run per root source (see http_cache): the editions of a root source share
+        one fetch and parse of the archive. cache=False for pages that must be fetched again (login checks)
+        """
         html_tree = None
+        key = http_cache.key(url, auth=auth, scope=scope, namespace=getattr(self, 'name', None))
         try:
-            if scope == "webdriver":
-                self.navigate(url)
-                if cookies:
-                    self.accept_notifications(cookies)
-                html = self.chrome.page_source
-                # self.close_webdriver_session()
-            else:
-                html = self.make_request(url, auth=auth)
+            entry = http_cache.get(key) if cache else None
+            if entry is not None:
+                logger.debug(f"\t{url} from the http cache")
+                html_tree = entry.tree
+                return html_tree
+            with phase('discovery'):
+                if scope == "webdriver":
+                    self.navigate(url)
+                    if cookies:
+                        self.accept_notifications(cookies)
+                    html = self.chrome.page_source
+                    # self.close_webdriver_session()
+                else:
+                    html = self.make_request(url, auth=auth)
             html_tree = etree.fromstring(html, parser=etree.HTMLParser())
+            if cache and html_tree is not None:
+                http_cache.put(key, html, html_tree)
         finally:
             return html_tree
 
@@ -1652,17 +1830,16 @@ class Scraper:
         return None
 
     @staticmethod
-    def translate_date_to_source_lang(root_source, format_date):
-        translated = GoogleTranslator(source='auto', target=root_source.download_conf.get('lang')).translate(
-            format_date)
-        return translated
+    def localize_date_to_source_lang(root_source, date_fmt, date=None):
+        """ Today (or date) formatted with the month and weekday names of the source language, offline """
+        return date_localizer.localize(date_fmt, root_source.download_conf.get('lang'), date)
 
     def move_to_new_browser_tab(self, window_number):
         p = self.chrome.current_window_handle
         parent = self.chrome.window_handles[0]
         chld = self.chrome.window_handles[window_number]
         self.chrome.switch_to.window(chld)
-        time.sleep(3)
+        self.wait_for_page_load()
         return self.chrome
 
     @staticmethod
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+from ingestaweb.settings import ROOT_DIR, Config
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = os.path.join(ROOT_DIR, 'ingestaweb', 'data', 'sessions')
+
+
+class SessionStore:
+    """
+    Cookies of the logged in sessions, one file per root source id, encrypted at rest (Fernet, key in
+    Config.SESSION_STORE_KEY). Sessions older than `ttl` seconds are discarded.
+    Without a key (or without cryptography installed) the store is disabled and every run performs a full login.
+    """
+
+    def __init__(self, directory=SESSIONS_DIR, key=None, ttl=None):
+        self.directory = directory
+        key = key or getattr(Config, 'SESSION_STORE_KEY', None)
+        if key and Fernet is None:
+            logger.warning("cryptography is not installed, sessions are not stored")
+        self.fernet = Fernet(key) if key and Fernet is not None else None
+        self.ttl = ttl or getattr(Config, 'SESSION_TTL', 12 * 3600)
+
+    @property
+    def enabled(self):
+        return self.fernet is not None
+
+    def _path(self, root_source_id):
+        return os.path.join(self.directory, f'{root_source_id}.session')
+
+    def save(self, root_source_id, login_type, cookies):
+        if not self.enabled:
+            return False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            data = json.dumps({'login_type': login_type, 'cookies': cookies, 'saved_at': time.time()})
+            token = self.fernet.encrypt(data.encode('utf-8'))
+            tmp_path = f'{self._path(root_source_id)}.tmp'
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(token)
+            os.replace(tmp_path, self._path(root_source_id))
+            return True
+        except Exception as e:
+            logger.warning(f"\tImpossible to save session of {root_source_id}: {e}")
+            return False
+
+    def load(self, root_source_id, login_type):
+        """ Stored cookies not expired yet, None if there is no valid session """
+        if not self.enabled or not os.path.isfile(self._path(root_source_id)):
+            return None
+        try:
+            with open(self._path(root_source_id), 'rb') as f:
+                data = json.loads(self.fernet.decrypt(f.read(), ttl=self.ttl))
+        except (InvalidToken, ValueError):
+            # expired, tampered or encrypted with another key
+            self.delete(root_source_id)
+            return None
+        if data.get('login_type') != login_type:
+            return None
+        now = time.time()
+        cookies = [cookie for cookie in data.get('cookies', []) if not cookie.get('expiry') or cookie['expiry'] > now]
+        return cookies or None
+
+    def delete(self, root_source_id):
+        try:
+            os.remove(self._path(root_source_id))
+        except OSError:
+            pass
+
+
+session_store = SessionStore()
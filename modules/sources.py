@@ -47,6 +47,7 @@ class RootSource(Scraper):
         self.login_info = rsource.get('login')
         # self.sources = {}
         self.sources = self.set_sources(rsource.get('sources'))
+        self.sources_by_name = {source.name: source for source in self.sources}
         self.download_conf = rsource.get('download_config')
 
     @staticmethod
@@ -54,7 +55,10 @@ class RootSource(Scraper):
         return [Source(raw_source) for raw_source in raw_sources]
 
     def get_source_by_name(self, source_name):
-        return next(filter(lambda x: x.name == source_name, self.sources), None)
+        return self.sources_by_name.get(source_name)
+
+    def sources_to_be_downloaded(self):
+        return [source for source in self.sources if source.has_to_be_downloaded()]
 
     def get_source_by_id(self, source_id):
         return self.sources.get(source_id)
@@ -100,3 +104,35 @@ class RootSource(Scraper):
             print(e)
             logger.error(f'Failed navigate to url {url}. \n Error: {e}')
             
+
+
+class SourceRegistry:
+    """
+    Index of the sources of all root sources by name, built once after loading the config:
+        registry.get(source_name) -> (root_source, source), (None, None) when unknown
+        registry.get_all(source_name) -> [(root_source, source), ...]
+    A name used in several root sources maps to all of them, a database row updates every source of its name.
+    """
+
+    def __init__(self, root_sources):
+        self.root_sources = root_sources
+        self._by_name = {}
+        for root_source in root_sources:
+            for source in root_source.sources:
+                self._by_name.setdefault(source.name, []).append((root_source, source))
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, source_name):
+        return source_name in self._by_name
+
+    def get(self, source_name):
+        matches = self._by_name.get(source_name)
+        return matches[0] if matches else (None, None)
+
+    def get_all(self, source_name):
+        return self._by_name.get(source_name, [])
+
+    def sources(self):
+        return [source for matches in self._by_name.values() for _, source in matches]
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('login', 'discovery', 'fetch', 'assemble', 'upload')
+# seconds a source may take (download of one source, the login of its root source has its own deadline)
+SOURCE_TIMEOUT = getattr(Config, 'SOURCE_TIMEOUT', 15 * 60)
+# seconds allowed for a login, retries included (the login phase never ends before it)
+LOGIN_DEADLINE = getattr(Config, 'LOGIN_DEADLINE', 5 * 60)
+PHASE_TIMEOUTS = {**{'login': LOGIN_DEADLINE, 'discovery': 3 * 60, 'fetch': 10 * 60, 'assemble': 5 * 60,
+                     'upload': 5 * 60},
+                  **getattr(Config, 'PHASE_TIMEOUTS', {})}
+PHASE_TIMEOUTS['login'] = max(PHASE_TIMEOUTS['login'], LOGIN_DEADLINE)
+SUPERVISOR_INTERVAL = getattr(Config, 'SUPERVISOR_INTERVAL', 1)
+
+
+class SourceTimeout(Exception):
+    """ Raised by checkpoint() in the worker of a source whose deadline expired """
+
+
+class Watch:
+    """
+    Deadlines of the source run by a worker thread: the whole source and the phase it is in (phases nest,
+    every open phase keeps its own deadline). Once one is reached the supervisor cancels the watch.
+    """
+
+    def __init__(self, name, scraper=None, timeout=SOURCE_TIMEOUT):
+        self.name = name
+        self.scraper = scraper
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout if timeout else None
+        self.phases = []
+        self.cancelled = threading.Event()
+        self.reason = None
+
+    @property
+    def timed_out(self):
+        return self.cancelled.is_set()
+
+    @property
+    def phase_name(self):
+        return self.phases[-1][0] if self.phases else None
+
+    @contextmanager
+    def phase(self, name, timeout=None):
+        timeout = timeout or PHASE_TIMEOUTS.get(name)
+        entry = (name, time.monotonic(), time.monotonic() + timeout if timeout else None)
+        self.phases.append(entry)
+        try:
+            self.checkpoint()
+            yield self
+        finally:
+            self.phases.remove(entry)
+
+    def expired(self, now):
+        """ Reason of the expiry, None while every deadline is ahead """
+        if self.deadline is not None and now > self.deadline:
+            return f'timeout: source over {self.deadline - self.start:.0f}s (in {self.phase_name or "download"})'
+        for name, started, deadline in list(self.phases):
+            if deadline is not None and now > deadline:
+                return f'timeout: {name} over {deadline - started:.0f}s'
+        return None
+
+    def remaining(self):
+        """ Seconds until the nearest deadline, None without deadlines """
+        deadlines = [deadline for _, _, deadline in list(self.phases) if deadline is not None]
+        if self.deadline is not None:
+            deadlines.append(self.deadline)
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+    def checkpoint(self):
+        if self.cancelled.is_set():
+            raise SourceTimeout(self.reason)
+
+
+class Supervisor:
+    """
+    Watchdog of the running sources: a thread checks the deadlines of every watch each `interval` seconds.
+    On expiry the watch is cancelled (checkpoint() raises SourceTimeout in its worker), the Chrome of the
+    scraper is killed so a worker blocked in a webdriver call gets an error right away, and its requests
+    session is closed. Http requests are bounded by request_timeout() (the time left to the deadline).
+
+        with supervisor.watch(source.name, root_source) as watch:
+            with phase('fetch'):
+                ...
+        watch.timed_out, watch.reason
+    """
+
+    def __init__(self, interval=SUPERVISOR_INTERVAL):
+        self.interval = interval
+        self._watches = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='supervisor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                watches = [watch for watch in self._watches if not watch.timed_out]
+            for watch in watches:
+                reason = watch.expired(now)
+                if reason:
+                    self.cancel(watch, reason)
+
+    def cancel(self, watch, reason):
+        watch.reason = reason
+        watch.cancelled.set()
+        logger.error(f"{watch.name} - {reason}, cancelled")
+        scraper = watch.scraper
+        if scraper is None:
+            return
+        chrome = getattr(scraper, 'chrome', None)
+        if chrome is not None:
+            self.kill_browser(chrome)
+        session = getattr(scraper, 'remote_session', None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def kill_browser(chrome):
+        """ Kills chromedriver (and its browser): the pending webdriver commands fail at once """
+        try:
+            process = chrome.service.process
+            if process is not None:
+                process.kill()
+                return
+        except AttributeError:
+            pass
+        try:
+            chrome.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def watch(self, name, scraper=None, timeout=SOURCE_TIMEOUT):
+        watch = Watch(name, scraper, timeout)
+        with self._lock:
+            self._watches.add(watch)
+        self._start()
+        try:
+            with self.attach(watch):
+                yield watch
+        finally:
+            with self._lock:
+                self._watches.discard(watch)
+
+    @contextmanager
+    def attach(self, watch):
+        """ Makes `watch` the watch of this thread, for the helper threads of a source (page downloads) """
+        previous = getattr(self._local, 'watch', None)
+        self._local.watch = watch
+        try:
+            yield watch
+        finally:
+            self._local.watch = previous
+
+    def current(self):
+        """ Watch of the source run by this thread, None outside a watch """
+        return getattr(self._local, 'watch', None)
+
+
+supervisor = Supervisor()
+
+
+@contextmanager
+def phase(name, timeout=None):
+    """ Phase of the source run by this thread (no deadline outside a watch) """
+    watch = supervisor.current()
+    if watch is None:
+        yield None
+        return
+    with watch.phase(name, timeout):
+        yield watch
+
+
+def checkpoint():
+    """ Raises SourceTimeout if the source run by this thread was cancelled """
+    watch = supervisor.current()
+    if watch is not None:
+        watch.checkpoint()
+
+
+def cancelled():
+    watch = supervisor.current()
+    return watch is not None and watch.timed_out
+
+
+def bounded_timeout(timeout):
+    """ timeout (seconds) limited to the time left to the deadline of the current source """
+    watch = supervisor.current()
+    remaining = watch.remaining() if watch is not None else None
+    if remaining is None:
+        return timeout
+    return min(timeout, remaining) if timeout is not None else remaining
+
+
+def login_deadline():
+    """ Seconds left for the login retries: LOGIN_DEADLINE, bounded by the login phase (or source) deadline """
+    return bounded_timeout(LOGIN_DEADLINE)
+
+
+def request_timeout(timeout):
+    """ requests timeout ((connect, read) or seconds) limited to the time left to the deadline """
+    if isinstance(timeout, (tuple, list)):
+        return tuple(max(0.1, bounded_timeout(value)) for value in timeout)
+    return max(0.1, bounded_timeout(timeout))
@@ -1,39 +1,24 @@
-from functools import wraps
-import time
 import unicodedata
 from lxml import etree
 import re
 import datetime as dt
 import os.path
 import glob
-from PIL import Image
 from datetime import datetime
 import os
+import io
+import tempfile
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
-from ingestaweb.settings import date_format_conf, ROOT_DIR, TEMP_DIR_FILES
+from ingestaweb.modules.date_template import render_template
+from ingestaweb.modules.download_watcher import DownloadWatcher
+from ingestaweb.modules.pdf_builder import PdfStreamWriter
+from ingestaweb.modules.supervisor import phase, bounded_timeout
+from ingestaweb.settings import ROOT_DIR, TEMP_DIR_FILES, Config
 
-
-def retry(max_retries, wait_time=2):
-    """
-    Decorator to retry any functions 'max_retries' times.
-    """
-
-    def retry_decorator(func):
-        @wraps(func)
-        def retried_function(*args, **kwargs):
-            for i in range(max_retries):
-                try:
-                    values = func(*args, **kwargs)
-                    return values
-                except Exception as e:
-                    print(f"Retrying...Attempt number {i + 1} - {e}")
-                    time.sleep(wait_time)
-            func(*args, **kwargs)
-
-        return retried_function
-
-    return retry_decorator
+DOWNLOAD_TIMEOUT = getattr(Config, 'DOWNLOAD_TIMEOUT', 300)
+# pdfs up to this size are kept in memory, bigger ones are spooled to a temp file
+PDF_MEMORY_LIMIT = getattr(Config, 'PDF_MEMORY_LIMIT', 64 * 1024 * 1024)
 
 
 def remove_accents(input_str):
@@ -47,13 +32,10 @@ def create_folder_name(raw_name):
     return aux_name.replace(" ", "_").replace("'", "").lower()
 
 
-def parse_date_fmt_to_current_date(url, offset=0):
+def parse_date_fmt_to_current_date(url, offset=0, date=None, **placeholders):
+    """ Date formats of the url/xpath replaced by the date (now by default) minus offset days, see DateTemplate """
     try:
-        for pattern in date_format_conf['dt_format']:
-            url = re.sub("{"f"{pattern}""}",
-                         (dt.datetime.now() - dt.timedelta(days=offset))
-                         .strftime(f"{date_format_conf['dt_format'].get(pattern)}"), url)
-        return url
+        return render_template(url, date=date, offset=offset, **placeholders)
     except:
         print('Error while parsing url')
         return None
@@ -87,17 +69,6 @@ def check_if_file_exists(path):
     return os.path.isfile(path)
 
 
-def wait_until_downloaded(download_path, extensions):
-    # seconds = 0
-    dl_wait = True
-    while dl_wait:
-        time.sleep(1)
-        any_tmp_file = any([True if fname.endswith(extensions) else False for fname in os.listdir(download_path)])
-        if any_tmp_file:
-            dl_wait = False
-            time.sleep(1)
-
-
 def make_pdf_file(pdf_content, output_file_path):
     downloaded = False
     try:
@@ -111,27 +82,54 @@ def make_pdf_file(pdf_content, output_file_path):
         return downloaded
 
 
-def get_last_filename_and_rename(new_filename):
+def make_pdf_buffer(pdf_content=None, max_size=PDF_MEMORY_LIMIT):
+    """
+    File object to validate and upload a pdf without writing it to the download folder:
+    BytesIO up to max_size bytes, SpooledTemporaryFile (rolled over to disk) above it.
+    Without content, an empty SpooledTemporaryFile to stream a download into.
+    """
+    if pdf_content is not None and len(pdf_content) <= max_size:
+        return io.BytesIO(pdf_content)
+    os.makedirs(TEMP_DIR_FILES, exist_ok=True)
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_size, dir=TEMP_DIR_FILES)
+    if pdf_content:
+        buffer.write(pdf_content)
+        buffer.seek(0)
+    return buffer
+
+
+def get_last_filename_and_rename(new_filename, downloaded_file_path=None):
     try:
-        save_folder = os.path.dirname(new_filename)
-        files = [file for file in glob.glob(save_folder + '/*') for extension in ['.pdf', '.zip'] if file.endswith(extension)]
-        if files:
+        if downloaded_file_path is None:
+            save_folder = os.path.dirname(new_filename)
+            files = [file for file in glob.glob(save_folder + '/*') for extension in ['.pdf', '.zip'] if file.endswith(extension)]
             # ruta completa archivo original
-            downloaded_file_path = max(files, key=os.path.getctime)
+            downloaded_file_path = max(files, key=os.path.getctime) if files else None
+        if downloaded_file_path:
             # extensión archivo original: ex: ".pdf"
             extension = os.path.splitext(downloaded_file_path)[1]
             os.rename(downloaded_file_path, os.path.splitext(new_filename)[0] + extension)
-            time.sleep(1)
     except Exception as e:
         print(e)
 
 
-def check_if_file_downloaded_and_rename_file(filename, rename_raw_file=True):
+def check_if_file_downloaded_and_rename_file(filename, rename_raw_file=True, watcher=None, timeout=None):
+    """
+    Waits for the browser download and renames it to filename.
+    watcher: DownloadWatcher created before starting the download, so the exact downloaded file is renamed.
+    """
     status = False
     try:
-        wait_until_downloaded(os.path.dirname(filename), extensions=('.pdf', '.zip'))
-        if rename_raw_file:
-            get_last_filename_and_rename(filename)
+        if not rename_raw_file:
+            return os.path.isfile(filename)
+        if watcher is None:
+            watcher = DownloadWatcher(os.path.dirname(filename), ignore_existing=False)
+        with phase('fetch'):
+            # never past the deadline of the source
+            downloaded_file_path = watcher.wait(bounded_timeout(timeout or DOWNLOAD_TIMEOUT))
+        if downloaded_file_path is None:
+            raise Exception(f"Download of {os.path.basename(filename)} not finished")
+        get_last_filename_and_rename(filename, downloaded_file_path)
         status = True
     except Exception as e:
         print(e)
@@ -166,20 +164,31 @@ def remove_jpg_files(directory):
 
 
 def create_pdf_from_images(images_directory, pdf_path):
+    """
+    Pages are added to the pdf one by one (see PdfStreamWriter), jpegs are embedded without re-encoding.
+    """
+    status = False
     try:
         images = [
-            Image.open(os.path.join(images_directory, f))
+            os.path.join(images_directory, f)
             for f in sorted(os.listdir(images_directory))
             if f.endswith('.jpg') or f.endswith(".png")
         ]
-
-        images[0].save(
-            pdf_path, "PDF", resolution=100.0, save_all=True, append_images=images[1:]
-        )
+        if not images:
+            raise Exception("No images found")
+        with phase('assemble') as watch, PdfStreamWriter(pdf_path, resolution=100.0) as pdf:
+            for image_path in images:
+                if watch:
+                    watch.checkpoint()
+                pdf.add_image_file(image_path)
         print(f"PDF guardado con éxito: {pdf_path}")
-
+        status = True
     except Exception as e:
         print(f"Imposible guardar PDF. {e}")
+        if os.path.exists(pdf_path):
+            remove_file(pdf_path)
+    finally:
+        return status
 
 
 def create_daily_base_directories(root_source, ftp):
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+
+from ingestaweb.settings import Config
+
+logger = logging.getLogger(__name__)
+
+
+def build_chrome_driver(headless=False):
+    service = Service()
+    chrome_options = webdriver.ChromeOptions()
+    user_agent = Config.USER_AGENT
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.page_load_strategy = 'eager'
+    chrome_options.add_argument(f'user-agent={user_agent}')
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("disable-infobars")
+    chrome_options.add_argument("start-maximized")
+    chrome_options.add_argument('--ignore-certificate-errors')
+    chrome_options.add_argument('--ignore-ssl-errors')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_experimental_option(
+        "excludeSwitches",
+        ["enable-automation", "enable-logging", "disable-popup-blocking"]
+    )
+    if headless:
+        chrome_options.add_argument("--headless")
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+
+class WebDriverPool:
+    """
+    Keeps warm Chrome instances to be leased by root sources, at most `max_drivers` running at once.
+    On release the driver gets a clean context (extra tabs closed, cookies, cache and storage cleared, blank page)
+    and goes back to the pool. Drivers are recycled (quit) after `max_uses` leases, when they crashed or when
+    the clean up failed.
+
+        with pool.lease() as driver:
+            ...
+    """
+
+    def __init__(self, max_drivers=2, max_uses=10, headless=False, factory=None):
+        self.max_drivers = max_drivers
+        self.max_uses = max_uses
+        self.factory = factory or (lambda: build_chrome_driver(headless))
+        self._slots = threading.BoundedSemaphore(max_drivers)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._uses = {}
+        self.startup_times = []
+        self.lease_wait_times = []
+        self.recycled = 0
+
+    def _start_driver(self):
+        start = time.monotonic()
+        driver = self.factory()
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._uses[driver] = 0
+            self.startup_times.append(elapsed)
+        logger.info(f"Chrome started in {elapsed:.1f}s")
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(driver, None)
+            self.recycled += 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def is_alive(driver):
+        try:
+            driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    @staticmethod
+    def visited_origins(driver):
+        """ http(s) origins in the session history of the current tab """
+        origins = set()
+        for entry in driver.execute_cdp_cmd('Page.getNavigationHistory', {}).get('entries', []):
+            url = urlparse(entry.get('url', ''))
+            if url.scheme in ('http', 'https') and url.netloc:
+                origins.add(f'{url.scheme}://{url.netloc}')
+        return origins
+
+    @staticmethod
+    def cookie_origins(driver):
+        origins = set()
+        for cookie in driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', []):
+            domain = cookie.get('domain', '').lstrip('.')
+            if domain:
+                origins.update({f'https://{domain}', f'http://{domain}'})
+        return origins
+
+    @classmethod
+    def reset(cls, driver):
+        """
+        Leaves the driver as a clean profile: one blank tab, no cookies, cache or storage. Storage is cleared
+        origin by origin, for the origins in the history of the tabs and of the cookies.
+        False if any step failed: the driver may keep data of the previous root source, it is not reused
+        """
+        try:
+            handles = driver.window_handles
+            origins = set()
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                origins |= cls.visited_origins(driver)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.switch_to.default_content()
+            origins |= cls.visited_origins(driver) | cls.cookie_origins(driver)
+            driver.delete_all_cookies()
+            commands = [('Network.clearBrowserCookies', {}), ('Network.clearBrowserCache', {})]
+            commands += [('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+                         for origin in sorted(origins)]
+            for command, params in commands:
+                driver.execute_cdp_cmd(command, params)
+            driver.get('about:blank')
+            return True
+        except WebDriverException as e:
+            logger.warning(f"\tWebdriver not reset, it is restarted: {e}")
+            return False
+
+    def acquire(self, timeout=None):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No webdriver available after {timeout}s")
+        try:
+            driver = None
+            while driver is None:
+                with self._lock:
+                    candidate = self._idle.pop() if self._idle else None
+                if candidate is None:
+                    driver = self._start_driver()
+                elif self.is_alive(candidate):
+                    driver = candidate
+                else:
+                    self._discard(candidate)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._uses[driver] += 1
+            self.lease_wait_times.append(time.monotonic() - start)
+        return driver
+
+    def release(self, driver):
+        try:
+            with self._lock:
+                uses = self._uses.get(driver, self.max_uses)
+            if uses >= self.max_uses or not self.reset(driver):
+                self._discard(driver)
+            else:
+                with self._lock:
+                    self._idle.append(driver)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def report(self):
+        with self._lock:
+            startup, waits = list(self.startup_times), list(self.lease_wait_times)
+        return {
+            'drivers_started': len(startup),
+            'drivers_recycled': self.recycled,
+            'startup_avg_s': round(sum(startup) / len(startup), 2) if startup else 0,
+            'startup_max_s': round(max(startup), 2) if startup else 0,
+            'leases': len(waits),
+            'lease_wait_avg_s': round(sum(waits) / len(waits), 2) if waits else 0,
+            'lease_wait_max_s': round(max(waits), 2) if waits else 0,
+        }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        logger.info(f"Webdriver pool: {self.report()}")
@@ -0,0 +1,50 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from ingestaweb.settings import TEMP_DIR_FILES
+
+logger = logging.getLogger(__name__)
+
+
+class Workspace:
+    """
+    Temporary directory owned by a single source download run, removed with everything inside on exit.
+    Downloads of different sources never share (or clean) each other's files, so they can run in parallel.
+
+        with Workspace(source.dirname) as workspace:
+            workspace.files   -> pdfs (browser downloads are pointed here)
+            workspace.images  -> page images
+    """
+
+    def __init__(self, name, base_dir=TEMP_DIR_FILES):
+        self.name = name
+        self.base_dir = base_dir
+        self.path = None
+        self.files = None
+        self.images = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cleanup()
+
+    def open(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f'{self.name}_', dir=self.base_dir)
+        self.files = os.path.join(self.path, 'files')
+        self.images = os.path.join(self.path, 'images')
+        os.makedirs(self.files)
+        os.makedirs(self.images)
+        return self
+
+    def file_path(self, filename):
+        return os.path.join(self.files, filename)
+
+    def cleanup(self):
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+            logger.debug(f"Workspace {self.path} removed")
+            self.path = None
@@ -9,6 +9,7 @@ from common.basic_utils import setup_logger
 from ingestaweb.modules.db import Db
 from ingestaweb.modules.gsheets import GSheetsWorkbook
 from ingestaweb.modules.main_helpers import load_root_sources_from_config
+from ingestaweb.modules.sources import SourceRegistry
 from ingestaweb.settings import sources_config, ROOT_DIR, Config
 
 
@@ -62,7 +63,7 @@ if __name__ == "__main__":
         db = Db()
 
         root_sources = load_root_sources_from_config(sources_config, create_base_directories=False)
-        sources_to_report = db.get_sources_filtered_report(root_sources)
+        sources_to_report = db.get_sources_filtered_report(SourceRegistry(root_sources))
         ingesta_report, status_count_report = data_cleansing_process(sources_to_report)
 
         workbook = GSheetsWorkbook(Config.SPREADSHEET_MASTER_INGESTA_ID, "key")
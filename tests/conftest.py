@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are imported as the ingestaweb package, the parent of the repository has to be in the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,78 @@
+import hashlib
+import io
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+pytest.importorskip('aiohttp')
+
+from ingestaweb.modules.async_http import AsyncHttpEngine
+from ingestaweb.modules.http_stream import stream_to_fileobj
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 400 + b'\n%%EOF\n'
+HALF = len(PDF) // 2
+
+
+class Handler(BaseHTTPRequestHandler):
+    ranges_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.ranges_seen.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        start = int(match.group(1)) if match else 0
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Length', str(len(PDF) - start))
+        self.send_header('ETag', '"v1"')
+        if match:
+            self.send_header('Content-Range', f'bytes {start}-{len(PDF) - 1}/{len(PDF)}')
+        self.end_headers()
+        if match:
+            self.wfile.write(PDF[start:])
+        else:
+            # the connection drops halfway
+            self.wfile.write(PDF[:HALF])
+            self.close_connection = True
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def engine():
+    engine = AsyncHttpEngine(connections=4, per_host=2)
+    yield engine
+    engine.close()
+
+
+def test_dropped_connection_keeps_the_bytes_received(engine, base_url):
+    with requests.Session() as session:
+        response = engine.session(session).get(f'{base_url}/edition.pdf', stream=True, timeout=5)
+        received = b''
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            for chunk in response.iter_content(4096):
+                received += chunk
+    assert received == PDF[:HALF]
+
+
+def test_dropped_connection_is_resumed_after_the_bytes_received(engine, base_url):
+    Handler.ranges_seen.clear()
+    fileobj = io.BytesIO()
+    with requests.Session() as session:
+        sha256 = stream_to_fileobj(engine.session(session), f'{base_url}/edition.pdf', fileobj,
+                                   chunk_size=4096, timeout=5)
+    assert Handler.ranges_seen == [None, f'bytes={HALF}-']
+    assert sha256 == hashlib.sha256(PDF).hexdigest()
+    fileobj.seek(0)
+    assert fileobj.read() == PDF
@@ -0,0 +1,122 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from ingestaweb.modules.availability import AvailabilityChecker, Probe, AVAILABLE, UNAVAILABLE, UNKNOWN
+from ingestaweb.modules.sources import RootSource
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, body=b'', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        Handler.requests_seen.append((self.command, self.path, self.headers.get('Cookie'),
+                                      self.headers.get('If-None-Match')))
+        if self.path == '/missing.pdf':
+            self.answer(404)
+        elif self.path == '/private.pdf':
+            # 404 unless logged in, as some kiosks do
+            self.answer(200 if 'session=ok' in (self.headers.get('Cookie') or '') else 404)
+        elif self.path == '/archive.html':
+            self.answer(200, b'<html><body><a class="edition" href="/edition.pdf">today</a></body></html>')
+        elif self.headers.get('If-None-Match') == '"v1"':
+            self.answer(304)
+        else:
+            self.answer(200, headers={'ETag': '"v1"'})
+
+    do_HEAD = do_GET
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def checker(tmp_path):
+    return AvailabilityChecker(state_path=str(tmp_path / 'availability.json'))
+
+
+def root_source(name, download_config):
+    return RootSource({
+        'id': None, 'name': name, 'is_active': True, 'login': {'type': 'nologin'},
+        'download_config': download_config,
+        'sources': [{'name': f'{name} daily', 'weekdays': list(range(1, 8)), 'frequency': 'daily'}]
+    })
+
+
+def test_probe_url_is_the_download_url():
+    root = root_source('Viva', {'type': 'standard_requests', 'url': 'http://kiosk/diarios/viva.pdf'})
+    probe = Probe.for_source(root, root.sources[0])
+    assert probe.url == root.download_url(root.sources[0])[0] == 'http://kiosk/DIARIOS/VIVA.pdf'
+    assert probe.method == 'HEAD' and not probe.configured
+
+
+def test_no_probe_for_post_downloads_or_when_disabled():
+    root = root_source('post', {'type': 'standard_requests', 'url': 'http://kiosk/edition', 'post': {'a': 1}})
+    assert Probe.for_source(root, root.sources[0]) is None
+    root = root_source('off', {'type': 'standard_requests', 'url': 'http://kiosk/edition.pdf', 'probe': False})
+    assert Probe.for_source(root, root.sources[0]) is None
+    root = root_source('issuu', {'type': 'issuu'})
+    assert Probe.for_source(root, root.sources[0]) is None
+
+
+def test_missing_edition_of_a_configured_probe_is_unavailable(base_url, checker):
+    root = root_source('configured', {'type': 'issuu', 'probe': {'url': f'{base_url}/missing.pdf'}})
+    assert checker.check(root, root.sources[0]) == UNAVAILABLE
+    Handler.requests_seen.clear()
+    # trusted for the probe interval, not probed again
+    assert checker.check(root, root.sources[0]) == UNAVAILABLE
+    assert Handler.requests_seen == []
+
+
+def test_missing_edition_of_a_derived_probe_is_inconclusive(base_url, checker):
+    root = root_source('derived', {'type': 'standard_requests', 'url': f'{base_url}/missing.pdf'})
+    assert checker.check(root, root.sources[0]) == UNKNOWN
+
+
+def test_probe_uses_the_session_of_the_download(base_url, checker):
+    root = root_source('private', {'type': 'standard_requests', 'url': f'{base_url}/private.pdf'})
+    root.remote_session = requests.Session()
+    root.remote_session.cookies.set('session', 'ok')
+    assert checker.check(root, root.sources[0]) == AVAILABLE
+    assert Handler.requests_seen[-1][2] == 'session=ok'
+
+
+def test_archive_xpath(base_url, checker):
+    root = root_source('archive', {'type': 'issuu', 'probe': {
+        'url': f'{base_url}/archive.html', 'xpath': '//a[@class="edition"]'}})
+    assert checker.check(root, root.sources[0]) == AVAILABLE
+    root = root_source('archive', {'type': 'issuu', 'probe': {
+        'url': f'{base_url}/archive.html', 'xpath': '//a[@class="other"]'}})
+    assert checker.check(root, root.sources[0]) == UNAVAILABLE
+
+
+def test_edition_already_downloaded_answers_not_modified(base_url, checker):
+    root = root_source('monthly', {'type': 'standard_requests', 'url': f'{base_url}/monthly.pdf'})
+    source = root.sources[0]
+    assert checker.check(root, source) == AVAILABLE
+    checker.downloaded(source)
+    assert checker.check(root, source) == UNAVAILABLE
+    assert Handler.requests_seen[-1][3] == '"v1"'
+    # the state is kept in the json file
+    assert AvailabilityChecker(state_path=checker.state_path).entry(source.name)['downloaded']['etag'] == '"v1"'
@@ -0,0 +1,76 @@
+import datetime as dt
+
+import pytest
+
+from ingestaweb.modules.date_localization import DateLocalizer, localize_date
+
+MONTHS = {
+    'es': 'enero febrero marzo abril mayo junio julio agosto septiembre octubre noviembre diciembre',
+    'ca': 'gener febrer març abril maig juny juliol agost setembre octubre novembre desembre',
+    'eu': 'urtarrila otsaila martxoa apirila maiatza ekaina uztaila abuztua iraila urria azaroa abendua',
+    'gl': 'xaneiro febreiro marzo abril maio xuño xullo agosto setembro outubro novembro decembro',
+    'fr': 'janvier février mars avril mai juin juillet août septembre octobre novembre décembre',
+    'en': 'January February March April May June July August September October November December',
+    'pt': 'janeiro fevereiro março abril maio junho julho agosto setembro outubro novembro dezembro',
+}
+# 15/04/2024 is a monday
+WEEKDAYS = {
+    'es': 'lunes martes miércoles jueves viernes sábado domingo',
+    'ca': 'dilluns dimarts dimecres dijous divendres dissabte diumenge',
+    'eu': 'astelehena asteartea asteazkena osteguna ostirala larunbata igandea',
+    'gl': 'luns martes mércores xoves venres sábado domingo',
+    'fr': 'lundi mardi mercredi jeudi vendredi samedi dimanche',
+    'en': 'Monday Tuesday Wednesday Thursday Friday Saturday Sunday',
+    'pt': 'segunda-feira terça-feira quarta-feira quinta-feira sexta-feira sábado domingo',
+}
+
+
+@pytest.mark.parametrize('lang', sorted(MONTHS))
+def test_month_names(lang):
+    names = [localize_date('%B', lang, dt.date(2024, month, 1)) for month in range(1, 13)]
+    assert names == MONTHS[lang].split()
+    assert localize_date('%b', lang, dt.date(2024, 1, 1)) == MONTHS[lang].split()[0][:3]
+
+
+@pytest.mark.parametrize('lang', sorted(WEEKDAYS))
+def test_weekday_names(lang):
+    names = [localize_date('%A', lang, dt.date(2024, 4, 15 + day)) for day in range(7)]
+    assert names == WEEKDAYS[lang].split()
+
+
+@pytest.mark.parametrize('date, expected', [
+    (dt.date(2024, 4, 18), "18 d'abril de 2024"),
+    (dt.date(2024, 8, 1), "1 d'agost de 2024"),
+    (dt.date(2024, 10, 5), "5 d'octubre de 2024"),
+    (dt.date(2024, 5, 18), '18 de maig de 2024'),
+    (dt.date(2024, 3, 2), '2 de març de 2024'),
+])
+def test_catalan_elision(date, expected):
+    assert localize_date('%-d de %B de %Y', 'ca', date) == expected
+
+
+def test_elision_only_in_catalan():
+    assert localize_date('%d de %B', 'es', dt.date(2024, 4, 18)) == '18 de abril'
+
+
+@pytest.mark.parametrize('date_format, expected', [
+    ('%#d', '5'), ('%-d', '5'), ('%d', '05'), ('%#m', '3'), ('%-m', '3'), ('%m', '03'),
+    ('%B %#d, %Y', 'March 5, 2024'), ('%d/%m/%y', '05/03/24'),
+])
+def test_days_without_leading_zeros(date_format, expected):
+    assert localize_date(date_format, 'en', dt.date(2024, 3, 5)) == expected
+
+
+@pytest.mark.parametrize('lang', ['ca_ES', 'ca-ES', 'CA'])
+def test_language_tags(lang):
+    assert localize_date('%B', lang, dt.date(2024, 3, 5)) == 'març'
+
+
+def test_localizer_cache(tmp_path):
+    path = tmp_path / 'cache.json'
+    date = dt.datetime.now()
+    month = MONTHS['gl'].split()[date.month - 1]
+    assert DateLocalizer(cache_path=str(path)).localize('%#d %B', 'gl', date) == f'{date.day} {month}'
+    assert path.exists()
+    # unknown languages fall back to strftime
+    assert DateLocalizer(cache_path=str(path), persist=False).localize('%Y', 'xx', date) == f'{date:%Y}'
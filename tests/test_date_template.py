@@ -0,0 +1,39 @@
+import datetime as dt
+
+from ingestaweb.modules.date_template import DateTemplate, get_template, render_template
+
+DATE = dt.datetime(2024, 3, 7)
+FORMATS = {'DD': '%d', 'MM': '%m', 'YYYY': '%Y', 'YYYYMMDD': '%Y%m%d', 'DD-MM-YYYY': '%d-%m-%Y'}
+
+
+def test_longest_format_wins():
+    template = DateTemplate('http://kiosk/{YYYYMMDD}/{DD-MM-YYYY}/{DD}.pdf', date_formats=FORMATS)
+    assert template.render(date=DATE) == 'http://kiosk/20240307/07-03-2024/07.pdf'
+
+
+def test_offset_days():
+    template = DateTemplate('{YYYY}/{MM}/{DD}', date_formats=FORMATS)
+    assert template.render(date=DATE, offset=7) == '2024/02/29'
+
+
+def test_placeholders():
+    template = DateTemplate('/{edition}/{DD}/page-{P}-{page}.jpg', date_formats=FORMATS)
+    assert template.render(date=DATE, edition='madrid', page=3) == '/madrid/07/page-03-3.jpg'
+    assert template.render(date=DATE, edition='madrid', page=3, page_width=3) == '/madrid/07/page-003-3.jpg'
+
+
+def test_missing_and_unknown_placeholders_are_kept():
+    template = DateTemplate('/{edition}/{unknown}/{DD}', date_formats=FORMATS)
+    assert template.render(date=DATE) == '/{edition}/{unknown}/07'
+
+
+def test_plain_text():
+    assert DateTemplate('//a[@class="pdf"]', date_formats=FORMATS).render(date=DATE) == '//a[@class="pdf"]'
+
+
+def test_templates_are_compiled_once():
+    assert get_template('/{YYYYMMDD}.pdf') is get_template('/{YYYYMMDD}.pdf')
+
+
+def test_formats_of_the_config():
+    assert render_template('/{YYYYMMDD}/{DDMMYY}.pdf', date=DATE) == '/20240307/070324.pdf'
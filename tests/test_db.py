@@ -0,0 +1,58 @@
+import datetime as dt
+
+import pytest
+
+from ingestaweb.modules.db import Db, DbSource
+from ingestaweb.modules.sources import Source
+from ingestaweb.settings import DownloadStatus
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Db, 'db_path', str(tmp_path / 'descargaweb.db'))
+    with Db(status_batch_size=3) as db:
+        db.load_sources([Source({'name': f'source {i}', 'weekdays': list(range(1, 8)), 'frequency': 'daily'})
+                         for i in range(5)])
+        yield db
+
+
+def statuses(db):
+    db.session.expire_all()
+    return {row.source_name: row.downloaded for row in db.session.query(DbSource)}
+
+
+def test_rows_of_today(db):
+    rows = db.get_sources_to_be_downloaded(dt.datetime.now().date())
+    assert sorted(row.source_name for row in rows) == [f'source {i}' for i in range(5)]
+
+
+def test_status_updates_are_batched(db):
+    rows = sorted(db.get_sources_to_be_downloaded(dt.datetime.now().date()), key=lambda row: row.source_name)
+    db.set_download_status(rows[0], DownloadStatus.SUCCESS)
+    db.set_download_status(rows[1], DownloadStatus.FAILED, reason='timeout: fetch over 600s')
+    assert set(statuses(db).values()) == {DownloadStatus.DEFAULT}
+    # the third update fills the batch
+    db.set_download_status(rows[2], DownloadStatus.UNAVAILABLE)
+    assert db.pending_status_updates == []
+    written = statuses(db)
+    assert written['source 0'] == DownloadStatus.SUCCESS
+    assert written['source 1'] == DownloadStatus.FAILED
+    assert written['source 2'] == DownloadStatus.UNAVAILABLE
+    downloaded = db.session.query(DbSource).filter_by(source_name='source 0').one()
+    assert downloaded.downloaded_at is not None and downloaded.failure_reason is None
+    failed = db.session.query(DbSource).filter_by(source_name='source 1').one()
+    assert failed.downloaded_at is None and failed.failure_reason == 'timeout: fetch over 600s'
+    # only the pending rows are left to download
+    pending = db.get_sources_to_be_downloaded(dt.datetime.now().date())
+    assert sorted(row.source_name for row in pending) == ['source 1', 'source 2', 'source 3', 'source 4']
+
+
+def test_pending_updates_written_on_flush_and_close(db):
+    rows = sorted(db.get_sources_to_be_downloaded(dt.datetime.now().date()), key=lambda row: row.source_name)
+    db.set_download_status(rows[3], DownloadStatus.SUCCESS)
+    db.flush_status_updates()
+    assert statuses(db)['source 3'] == DownloadStatus.SUCCESS
+    db.set_download_status(rows[4], DownloadStatus.SUCCESS)
+    db.close()
+    with Db() as reopened:
+        assert statuses(reopened)['source 4'] == DownloadStatus.SUCCESS
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+from ingestaweb.modules.download_watcher import DownloadWatcher
+
+
+def write(path, content=b''):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_existing_files_are_ignored(tmp_path):
+    write(tmp_path / 'old.pdf', b'%PDF-1.4')
+    assert DownloadWatcher(str(tmp_path)).wait(timeout=0.5) is None
+
+
+def test_empty_placeholder_is_not_finished(tmp_path):
+    watcher = DownloadWatcher(str(tmp_path))
+    write(tmp_path / 'edition.pdf')
+    assert watcher.wait(timeout=0.5) is None
+
+
+def test_partial_file_is_not_finished(tmp_path):
+    watcher = DownloadWatcher(str(tmp_path))
+    write(tmp_path / 'edition.pdf', b'%PDF-1.4')
+    write(tmp_path / 'edition.pdf.crdownload', b'%PDF-1.4')
+    assert watcher.wait(timeout=0.5) is None
+
+
+def test_chrome_download_is_detected_once_renamed(tmp_path):
+    watcher = DownloadWatcher(str(tmp_path))
+    final_path = tmp_path / 'edition.pdf'
+
+    def download():
+        # chrome: empty placeholder, partial file, partial file renamed over the placeholder
+        write(final_path)
+        time.sleep(0.2)
+        write(tmp_path / 'edition.pdf.crdownload', b'%PDF-1.4' * 100)
+        time.sleep(0.2)
+        os.replace(tmp_path / 'edition.pdf.crdownload', final_path)
+
+    thread = threading.Thread(target=download)
+    thread.start()
+    file_path = watcher.wait(timeout=5)
+    thread.join()
+    assert file_path == str(final_path)
+    assert os.path.getsize(file_path) == 800
+
+
+def test_polling_without_inotify(tmp_path):
+    watcher = DownloadWatcher(str(tmp_path), poll_interval=0.05)
+    watcher.close()
+    write(tmp_path / 'edition.pdf', b'%PDF-1.4')
+    assert watcher.wait(timeout=2) == str(tmp_path / 'edition.pdf')
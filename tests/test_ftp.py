@@ -0,0 +1,175 @@
+import datetime as dt
+import io
+from collections import namedtuple
+import threading
+
+import pytest
+
+from ingestaweb.modules import scheduler as scheduler_module
+from ingestaweb.modules.db import Db, DbSource
+from ingestaweb.modules.ftp import FTPClient, FTPUploadPool
+from ingestaweb.modules.scheduler import DownloadScheduler
+from ingestaweb.modules.sources import Source
+from ingestaweb.settings import DownloadStatus
+
+pytest.importorskip('pyftpdlib')
+from pyftpdlib.authorizers import DummyAuthorizer  # noqa: E402
+from pyftpdlib.handlers import FTPHandler  # noqa: E402
+from pyftpdlib.servers import ThreadedFTPServer  # noqa: E402
+
+USER, PASSWORD = 'user', 'secret'
+FtpRoot = namedtuple('FtpRoot', ['path', 'port'])
+
+
+class DroppingHandler(FTPHandler):
+    """ Drops the connection on the first `drops` STOR commands """
+    drops = 0
+    lock = threading.Lock()
+
+    def ftp_STOR(self, file, mode='w'):
+        with DroppingHandler.lock:
+            drop = DroppingHandler.drops > 0
+            DroppingHandler.drops -= int(drop)
+        if drop:
+            self.close()
+            return
+        return super().ftp_STOR(file, mode)
+
+
+@pytest.fixture
+def ftp_root(tmp_path):
+    root = tmp_path / 'ftp'
+    (root / 'today' / 'root source').mkdir(parents=True)
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(USER, PASSWORD, str(root), perm='elradfmw')
+    DroppingHandler.authorizer = authorizer
+    DroppingHandler.drops = 0
+    server = ThreadedFTPServer(('127.0.0.1', 0), DroppingHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'timeout': 0.1}, daemon=True)
+    thread.start()
+    yield FtpRoot(root, server.address[1])
+    server.close_all()
+    thread.join()
+
+
+def make_pool(ftp_root, connections=2, max_retries=2):
+    return FTPUploadPool(
+        connections=connections, workdir='today', max_retries=max_retries, spool_dir=str(ftp_root.path.parent / 'spool'),
+        client_factory=lambda: FTPClient(default_path='/', host='127.0.0.1', user=USER, password=PASSWORD,
+                                         port=ftp_root.port, retry_for=5))
+
+
+def test_files_are_spooled_and_uploaded(ftp_root, tmp_path):
+    local_file = tmp_path / 'edition.pdf'
+    local_file.write_bytes(b'%PDF-1.4 file')
+    with make_pool(ftp_root) as pool:
+        assert pool.upload_file(str(tmp_path), 'root source', 'edition.pdf')
+        # the queued file is a spooled copy, the download folder can be cleaned right away
+        local_file.unlink()
+        assert pool.upload_fileobj(io.BytesIO(b'%PDF-1.4 buffer'), 'root source', 'buffer.pdf')
+    assert (ftp_root.path / 'today' / 'root source' / 'edition.pdf').read_bytes() == b'%PDF-1.4 file'
+    assert (ftp_root.path / 'today' / 'root source' / 'buffer.pdf').read_bytes() == b'%PDF-1.4 buffer'
+    assert pool.report()['uploaded'] == 2 and not pool.failed
+    assert not any((ftp_root.path.parent / 'spool').iterdir())
+
+
+def test_upload_is_retried_after_a_dropped_connection(ftp_root):
+    DroppingHandler.drops = 1
+    with make_pool(ftp_root, connections=1) as pool:
+        pool.upload_fileobj(io.BytesIO(b'%PDF-1.4'), 'root source', 'edition.pdf')
+    assert DroppingHandler.drops == 0
+    assert (ftp_root.path / 'today' / 'root source' / 'edition.pdf').read_bytes() == b'%PDF-1.4'
+    assert pool.uploaded == ['root source/edition.pdf'] and not pool.failed
+
+
+def test_permanent_error_is_not_retried(ftp_root):
+    with make_pool(ftp_root, connections=1) as pool:
+        pool.upload_fileobj(io.BytesIO(b'%PDF-1.4'), 'missing folder', 'edition.pdf')
+    assert pool.failed == ['missing folder/edition.pdf']
+
+
+def test_close_waits_for_every_queued_upload(ftp_root):
+    pool = make_pool(ftp_root, connections=2)
+    for i in range(20):
+        pool.upload_fileobj(io.BytesIO(b'%PDF-1.4' * 1000), 'root source', f'page_{i}.pdf')
+    pool.close()
+    assert len(pool.uploaded) == 20
+    assert len(list((ftp_root.path / 'today' / 'root source').iterdir())) == 20
+
+
+class BlockedClient:
+    """ Client whose transfers wait until `release` is set """
+    release = threading.Event()
+
+    def __init__(self):
+        self.session = None
+
+    def store_fileobj(self, fileobj, ftp_path):
+        BlockedClient.release.wait(5)
+
+    def quit(self):
+        pass
+
+
+def test_queue_is_bounded(tmp_path):
+    BlockedClient.release.clear()
+    pool = FTPUploadPool(connections=1, max_queued=1, spool_dir=str(tmp_path / 'spool'), client_factory=BlockedClient)
+    # the first upload is taken by the connection, the second one waits in the queue
+    pool.upload_fileobj(io.BytesIO(b'%PDF-1.4'), 'root source', 'page_1.pdf')
+    pool.upload_fileobj(io.BytesIO(b'%PDF-1.4'), 'root source', 'page_2.pdf')
+    producer = threading.Thread(
+        target=pool.upload_fileobj, args=(io.BytesIO(b'%PDF-1.4'), 'root source', 'page_3.pdf'), daemon=True)
+    producer.start()
+    producer.join(0.3)
+    assert producer.is_alive()
+    BlockedClient.release.set()
+    producer.join(5)
+    assert not producer.is_alive()
+    pool.close()
+    assert len(pool.uploaded) == 3
+
+
+class UploadingRootSource:
+    """ Root source whose downloads only queue an upload to `folder` and succeed """
+    name = 'root source'
+    download_conf = {'type': 'fake'}
+    login_info = {'type': 'nologin'}
+    webdriver_pool = None
+
+    def __init__(self, sources, folder):
+        self.sources = sources
+        self.folder = folder
+
+    def sources_to_be_downloaded(self):
+        return self.sources
+
+    def login(self, login_type):
+        pass
+
+    def handle_login_status(self):
+        return 'No login needed'
+
+    def close_webdriver_session(self):
+        pass
+
+    def download(self, download_type, source, ftp):
+        ftp.upload_fileobj(io.BytesIO(b'%PDF-1.4'), self.folder, f'{source.name}.pdf')
+        return DownloadStatus.SUCCESS
+
+
+@pytest.mark.parametrize('folder, status', [('root source', DownloadStatus.SUCCESS),
+                                            ('missing folder', DownloadStatus.FAILED)])
+def test_failed_upload_fails_the_source(ftp_root, tmp_path, monkeypatch, folder, status):
+    monkeypatch.setattr(scheduler_module, 'AVAILABILITY_PROBE', False)
+    monkeypatch.setattr(scheduler_module.availability, 'persist', False)
+    monkeypatch.setattr(Db, 'db_path', str(tmp_path / 'descargaweb.db'))
+    with Db() as db:
+        db.load_sources([Source({'name': 'edition', 'weekdays': list(range(1, 8)), 'frequency': 'daily'})])
+        source = Source({'name': 'edition', 'weekdays': list(range(1, 8)), 'frequency': 'daily'})
+        source.dbsource = db.get_sources_to_be_downloaded(dt.datetime.now().date())[0]
+        DownloadScheduler(db, upload_pool=make_pool(ftp_root, connections=1)).run([UploadingRootSource([source], folder)])
+        db.session.expire_all()
+        row = db.session.query(DbSource).one()
+    assert row.downloaded == status
+    if status == DownloadStatus.FAILED:
+        assert row.failure_reason.startswith('ftp: error_perm: 550')
@@ -0,0 +1,123 @@
+import pytest
+from requests.auth import HTTPBasicAuth
+
+from ingestaweb.modules import http_cache as http_cache_module
+from ingestaweb.modules import scraping as scraping_module
+from ingestaweb.modules.http_cache import HttpCache
+from ingestaweb.modules.scraping import Scraper
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_cache_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_entry_expires_after_the_ttl(clock):
+    cache = HttpCache(ttl=60)
+    cache.put('page', '<html/>', 'tree')
+    clock.advance(59)
+    assert cache.get('page').tree == 'tree'
+    clock.advance(1)
+    assert cache.get('page') is None
+    assert cache.stats() == {'entries': 0, 'bytes': 0, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_put_again_renews_the_ttl(clock):
+    cache = HttpCache(ttl=60)
+    cache.put('page', 'old', 'old tree')
+    clock.advance(50)
+    cache.put('page', 'new', 'new tree')
+    clock.advance(50)
+    assert cache.get('page').content == 'new'
+    assert cache.stats()['bytes'] == len('new')
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = HttpCache(max_entries=2)
+    cache.put('a', 'a', None)
+    cache.put('b', 'b', None)
+    assert cache.get('a') is not None
+    cache.put('c', 'c', None)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.evictions == 1
+
+
+def test_eviction_by_bytes(clock):
+    cache = HttpCache(max_bytes=10)
+    cache.put('a', 'x' * 4, None)
+    cache.put('b', 'x' * 4, None)
+    cache.put('c', 'x' * 4, None)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 8
+    # a page larger than the cache is not kept
+    cache.put('d', 'x' * 11, None)
+    assert cache.get('d') is None and cache.get('b') is not None
+
+
+def test_key_hides_the_credentials():
+    key = HttpCache.key('https://example.com/', auth=HTTPBasicAuth('user', 'secret'), namespace='diario')
+    assert key[:3] == ('diario', 'etree', 'https://example.com/')
+    assert 'secret' not in repr(key)
+    assert key != HttpCache.key('https://example.com/', auth=HTTPBasicAuth('user', 'other'), namespace='diario')
+    assert key == HttpCache.key('https://example.com/', auth=('user', 'secret'), namespace='diario')
+
+
+class CountingScraper(Scraper):
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.requests = 0
+
+    def make_request(self, url, auth=None, **kwargs):
+        self.requests += 1
+        return f'<html><body><p>{url} {self.requests}</p></body></html>'
+
+
+@pytest.fixture
+def cache(monkeypatch, clock):
+    cache = HttpCache(ttl=60)
+    monkeypatch.setattr(scraping_module, 'http_cache', cache)
+    return cache
+
+
+def text(tree):
+    return tree.xpath('//p/text()')[0]
+
+
+def test_pages_are_shared_within_a_root_source(cache, clock):
+    scraper = CountingScraper('diario')
+    first = scraper.extract_html_from_page('https://example.com/hemeroteca')
+    assert scraper.extract_html_from_page('https://example.com/hemeroteca') is first
+    assert scraper.requests == 1
+    clock.advance(60)
+    assert text(scraper.extract_html_from_page('https://example.com/hemeroteca')).endswith(' 2')
+
+
+def test_cache_key_of_extract_html_from_page(cache):
+    scraper = CountingScraper('diario')
+    other = CountingScraper('revista')
+    url = 'https://example.com/hemeroteca'
+    scraper.extract_html_from_page(url)
+    # another root source, other credentials, the browser or cache=False fetch the page again
+    other.extract_html_from_page(url)
+    scraper.extract_html_from_page(url, auth=('user', 'secret'))
+    scraper.extract_html_from_page(url, cache=False)
+    assert (scraper.requests, other.requests) == (3, 1)
+    assert set(cache._entries) == {('diario', 'etree', url, None), ('revista', 'etree', url, None),
+                                   HttpCache.key(url, auth=('user', 'secret'), namespace='diario')}
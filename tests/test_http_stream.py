@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import io
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from ingestaweb.modules.http_stream import stream_to_fileobj, DownloadError
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 400 + b'\n%%EOF\n'
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, status=200, length=None, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body) if length is None else length))
+        self.send_header('ETag', '"v1"')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        Handler.requests_seen.append((self.path, self.headers.get('Range')))
+        if self.path == '/edition.pdf':
+            self.send_body(PDF)
+        elif self.path == '/missing.pdf':
+            self.send_body(b'not found', status=404)
+        elif self.path == '/error_page.pdf':
+            self.send_body(b'<html>' + b' ' * 2000 + b'</html>')
+        elif self.path == '/bad_digest.pdf':
+            digest = base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+            self.send_body(PDF, headers={'Digest': f'sha-256={digest}'})
+        elif self.path == '/truncated.pdf':
+            # always closes the connection halfway
+            self.send_body(PDF[:len(PDF) // 2], length=len(PDF))
+            self.close_connection = True
+        elif self.path == '/dropped_once.pdf':
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+            if match:
+                start = int(match.group(1))
+                self.send_body(PDF[start:], status=206,
+                               headers={'Content-Range': f'bytes {start}-{len(PDF) - 1}/{len(PDF)}'})
+            else:
+                self.send_body(PDF[:len(PDF) // 2], length=len(PDF))
+                self.close_connection = True
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+
+def stream(session, url, **kwargs):
+    fileobj = io.BytesIO()
+    return stream_to_fileobj(session, url, fileobj, chunk_size=4096, timeout=5, **kwargs), fileobj
+
+
+def test_pdf_is_streamed(session, base_url):
+    sha256, fileobj = stream(session, f'{base_url}/edition.pdf')
+    assert sha256 == hashlib.sha256(PDF).hexdigest()
+    assert fileobj.read() == PDF
+
+
+def test_error_status_is_no_file(session, base_url):
+    assert stream(session, f'{base_url}/missing.pdf')[0] is None
+
+
+def test_html_instead_of_pdf_fails(session, base_url):
+    with pytest.raises(DownloadError, match='not a pdf'):
+        stream(session, f'{base_url}/error_page.pdf')
+
+
+def test_digest_mismatch_fails(session, base_url):
+    with pytest.raises(DownloadError, match='sha256 mismatch'):
+        stream(session, f'{base_url}/bad_digest.pdf')
+
+
+def test_dropped_connection_is_resumed_with_a_range(session, base_url):
+    Handler.requests_seen.clear()
+    sha256, fileobj = stream(session, f'{base_url}/dropped_once.pdf')
+    assert fileobj.read() == PDF
+    assert sha256 == hashlib.sha256(PDF).hexdigest()
+    assert Handler.requests_seen[-1][1] is not None
+
+
+def test_truncated_download_fails_once_the_resumes_run_out(session, base_url):
+    with pytest.raises(DownloadError):
+        stream(session, f'{base_url}/truncated.pdf', max_resumes=1)
+
+
+def test_cancelled_download_fails(session, base_url):
+    with pytest.raises(DownloadError, match='cancelled'):
+        stream(session, f'{base_url}/edition.pdf', cancelled=lambda: True)
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from ingestaweb.modules import retrying
+from ingestaweb.modules.page_fetcher import PageFetcher, PageFetchError
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+        self.ok = status_code < 400
+
+
+class NoLimit:
+
+    def acquire(self, url):
+        pass
+
+
+class Edition:
+    """ fetch of an edition of `pages` pages, `errors` {page: statuses (or exceptions) answered first} """
+
+    def __init__(self, pages, errors=None):
+        self.pages = pages
+        self.errors = {page: list(answers) for page, answers in (errors or {}).items()}
+        self.requested = []
+
+    def __call__(self, url):
+        page = int(url.rsplit('/', 1)[1])
+        self.requested.append(page)
+        if self.errors.get(page):
+            answer = self.errors[page].pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return FakeResponse(answer)
+        if page > self.pages:
+            return FakeResponse(404)
+        return FakeResponse(200, b'page %d' % page)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retrying.time, 'sleep', lambda seconds: None)
+
+
+def fetcher(edition, **kwargs):
+    return PageFetcher(fetch=edition, page_url=lambda page: f'http://kiosk/page/{page}', rate_limiter=NoLimit(),
+                       **kwargs)
+
+
+@pytest.mark.parametrize('pages', [0, 1, 2, 3, 7, 8, 9, 31, 100])
+def test_probe_finds_the_last_page(pages):
+    edition = Edition(pages)
+    assert fetcher(edition).probe_page_count() == pages
+    # exponential then binary search, far fewer requests than pages
+    assert len(edition.requested) <= 2 * max(1, pages).bit_length() + 1
+
+
+def test_max_pages_caps_the_probe():
+    edition = Edition(5000)
+    assert fetcher(edition, max_pages=40).probe_page_count() == 40
+    assert max(edition.requested) <= 41
+
+
+@pytest.mark.parametrize('error', [503, 429, ConnectionError('reset')])
+def test_transient_error_does_not_shorten_the_edition(error):
+    # page 16 fails once while probing an edition of 20 pages
+    edition = Edition(20, errors={16: [error]})
+    assert fetcher(edition).probe_page_count() == 20
+
+
+def test_persistent_error_raises():
+    edition = Edition(20, errors={16: [503] * 3})
+    with pytest.raises(PageFetchError):
+        fetcher(edition, attempts=3).probe_page_count()
+
+
+def test_missing_page_callback():
+    # a kiosk answering 403 to pages beyond the edition
+    edition = Edition(5, errors={page: [403] for page in range(6, 20)})
+    assert fetcher(edition, is_missing=lambda response: response.status_code in (403, 404)).probe_page_count() == 5
+
+
+def test_probed_pages_are_not_requested_again(tmp_path):
+    edition = Edition(10)
+    paths = fetcher(edition).download(str(tmp_path))
+    assert [os.path.basename(path) for path in paths] == [f'page_{page:03d}.jpg' for page in range(1, 11)]
+    assert open(paths[9], 'rb').read() == b'page 10'
+    # every page requested once, plus the first missing ones
+    assert sorted(page for page in edition.requested if page <= 10) == list(range(1, 11))
+
+
+def test_page_failing_while_downloading_fails_the_edition(tmp_path):
+    edition = Edition(10, errors={3: [503] * 6})
+    with pytest.raises(PageFetchError):
+        fetcher(edition, attempts=2).download(str(tmp_path))
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader
+
+from ingestaweb.modules.pdf_builder import PdfStreamWriter, read_jpeg_info
+from ingestaweb.modules.pdf_validator import fast_page_count
+
+
+def jpeg(size, mode='RGB', progressive=False):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'white' if mode != 'CMYK' else (0, 0, 0, 0)).save(buffer, 'JPEG', progressive=progressive)
+    return buffer.getvalue()
+
+
+def png(size):
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 128)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('mode, components', [('L', 1), ('RGB', 3), ('CMYK', 4)])
+def test_read_jpeg_info(mode, components):
+    width, height, read_components, is_adobe = read_jpeg_info(jpeg((120, 80), mode))
+    assert (width, height, read_components) == (120, 80, components)
+    assert is_adobe == (mode == 'CMYK')
+
+
+def test_read_progressive_jpeg_info():
+    assert read_jpeg_info(jpeg((64, 48), progressive=True))[:3] == (64, 48, 3)
+
+
+@pytest.mark.parametrize('data', [b'\xff\xd8\xff\xd9', b'\xff\xd8\xff', b'\xff\xd8\xff\xe0\x00\x10JFIF',
+                                  b'\xff\xd8\xff\xc0\x00\x11\x08\x00'])
+def test_invalid_jpeg(data):
+    with pytest.raises(ValueError):
+        read_jpeg_info(data)
+
+
+def test_pages_of_every_image(tmp_path):
+    pdf_path = tmp_path / 'edition.pdf'
+    with PdfStreamWriter(str(pdf_path), resolution=72.0) as pdf:
+        pdf.add_image_bytes(jpeg((200, 300)))
+        pdf.add_image_bytes(png((100, 50)))
+        image_path = tmp_path / 'page.jpg'
+        image_path.write_bytes(jpeg((40, 40), 'L'))
+        pdf.add_image_file(str(image_path))
+    reader = PdfReader(str(pdf_path))
+    sizes = [(float(page.mediabox.width), float(page.mediabox.height)) for page in reader.pages]
+    assert sizes == [(200, 300), (100, 50), (40, 40)]
+    with open(pdf_path, 'rb') as f:
+        assert fast_page_count(f) == 3
+
+
+def test_jpeg_embedded_as_it_is(tmp_path):
+    data = jpeg((30, 20))
+    pdf_path = tmp_path / 'edition.pdf'
+    with PdfStreamWriter(str(pdf_path)) as pdf:
+        pdf.add_jpeg(data)
+    image = PdfReader(str(pdf_path)).pages[0]['/Resources']['/XObject']['/Im0'].get_object()
+    assert image['/Filter'] == '/DCTDecode'
+    assert image.get_data() == data
+
+
+def test_file_closed_without_trailer_on_error(tmp_path):
+    pdf_path = tmp_path / 'edition.pdf'
+    with pytest.raises(ValueError):
+        with PdfStreamWriter(str(pdf_path)) as pdf:
+            pdf.add_image_bytes(b'\xff\xd8 not a jpeg')
+    assert pdf.file.closed
+    assert b'%%EOF' not in pdf_path.read_bytes()
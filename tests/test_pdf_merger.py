@@ -0,0 +1,179 @@
+import io
+import zlib
+
+import PyPDF2
+import pytest
+
+from ingestaweb.modules.pdf_merger import PdfMerger
+from ingestaweb.modules.pdf_validator import PdfStructureError
+from ingestaweb.modules.scraping import Download
+from ingestaweb.modules.workspace import Workspace
+
+
+def text_objects(text):
+    content = b'BT /F1 12 Tf 20 100 Td (%s) Tj ET' % text.encode()
+    return {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        3: b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] /Contents 4 0 R '
+           b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        4: b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+        5: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+
+
+def text_pdf(text):
+    """ Page pdf with a classic xref table """
+    objects = text_objects(text)
+    data = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for number, body in objects.items():
+        offsets[number] = len(data)
+        data += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010d 00000 n \n' % offsets[number] for number in sorted(objects))
+    data += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(data)
+
+
+def object_stream_pdf(text):
+    """ Page pdf with its dictionaries in an object stream (6) and an xref stream (7) """
+    objects = text_objects(text)
+    compressed = [1, 2, 3, 5]
+    bodies, pairs, position = b'', [], 0
+    for number in compressed:
+        pairs.append(b'%d %d' % (number, position))
+        bodies += objects[number] + b'\n'
+        position = len(bodies)
+    header = b' '.join(pairs) + b'\n'
+    object_stream = zlib.compress(header + bodies)
+    data = bytearray(b'%PDF-1.5\n')
+    offsets = {4: len(data)}
+    data += b'4 0 obj\n%s\nendobj\n' % objects[4]
+    offsets[6] = len(data)
+    data += (b'6 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n'
+             % (len(compressed), len(header), len(object_stream)) + object_stream + b'\nendstream\nendobj\n')
+    offsets[7] = len(data)
+    entries = b'\x00\x00\x00\x00\x00\xff\xff'
+    for number in range(1, 8):
+        if number in compressed:
+            entries += b'\x02' + (6).to_bytes(4, 'big') + compressed.index(number).to_bytes(2, 'big')
+        else:
+            entries += b'\x01' + offsets[number].to_bytes(4, 'big') + b'\x00\x00'
+    xref_stream = zlib.compress(entries)
+    data += (b'7 0 obj\n<< /Type /XRef /Size 8 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode /Length %d >>\n'
+             b'stream\n' % len(xref_stream) + xref_stream + b'\nendstream\nendobj\n')
+    data += b'startxref\n%d\n%%%%EOF\n' % offsets[7]
+    return bytes(data)
+
+
+def merged_texts(path):
+    reader = PyPDF2.PdfReader(str(path))
+    return [page.extract_text().strip() for page in reader.pages]
+
+
+@pytest.mark.parametrize('make_pdf', [text_pdf, object_stream_pdf])
+def test_pages_are_merged_in_order(tmp_path, make_pdf):
+    path = tmp_path / 'edition.pdf'
+    with PdfMerger(str(path)) as merger:
+        for page in range(1, 4):
+            assert merger.append(io.BytesIO(make_pdf(f'Page {page}')))
+    assert merger.page_count == 3
+    assert merged_texts(path) == ['Page 1', 'Page 2', 'Page 3']
+
+
+def test_pdfs_of_both_kinds(tmp_path):
+    path = tmp_path / 'edition.pdf'
+    merger = PdfMerger(str(path))
+    assert merger.append(io.BytesIO(text_pdf('Page 1')))
+    assert merger.append(io.BytesIO(object_stream_pdf('Page 2')))
+    assert merger.close() == 2
+    assert merged_texts(path) == ['Page 1', 'Page 2']
+
+
+def test_corrupt_page_fails_the_merge(tmp_path):
+    merger = PdfMerger(str(tmp_path / 'edition.pdf'))
+    assert merger.append(io.BytesIO(text_pdf('Page 1')))
+    assert not merger.append(io.BytesIO(text_pdf('Page 2')[:200]))
+    assert merger.failed
+    # the merged file would miss a page, the next ones are refused
+    assert not merger.append(io.BytesIO(text_pdf('Page 3')))
+    merger.abort()
+
+
+def test_page_failing_halfway_is_rolled_back(tmp_path, monkeypatch):
+    path = tmp_path / 'edition.pdf'
+    merger = PdfMerger(str(path))
+    assert merger.append(io.BytesIO(text_pdf('Page 1')))
+    write_object = merger.write_object
+    written = []
+
+    def truncated_after_two_objects(number, *args):
+        if len(written) == 2:
+            raise PdfStructureError('stream data truncated')
+        written.append(number)
+        write_object(number, *args)
+
+    monkeypatch.setattr(merger, 'write_object', truncated_after_two_objects)
+    assert not merger.append(io.BytesIO(text_pdf('Page 2')))
+    monkeypatch.setattr(merger, 'write_object', write_object)
+    # no object of the failed page is left in the xref
+    assert merger.close() == 1
+    assert merged_texts(path) == ['Page 1']
+
+
+class RecordingFtp:
+
+    def __init__(self):
+        self.uploads = []
+
+    def upload_file(self, local_file_path, ftp_file_path, filename):
+        with open(f'{local_file_path}/{filename}', 'rb') as f:
+            self.uploads.append((filename, f.read()))
+        return True
+
+    def upload_fileobj(self, fileobj, ftp_file_path, filename):
+        fileobj.seek(0)
+        self.uploads.append((filename, fileobj.read()))
+        return True
+
+
+class FakeScraper:
+    dirname = 'root'
+    download_conf = {'merge_pages': True}
+
+
+class FakeSource:
+    name = 'edition'
+    dirname = 'edition'
+
+
+@pytest.fixture
+def download(tmp_path):
+    download = Download(FakeScraper())
+    with Workspace('edition', base_dir=str(tmp_path)) as download.workspace:
+        yield download
+
+
+def test_every_page_uploaded_on_its_own_when_one_can_not_be_merged(download):
+    ftp = RecordingFtp()
+    merger = download.page_merger(FakeSource())
+    pages = [text_pdf('Page 1'), text_pdf('Page 2'), text_pdf('Page 3')[:200], text_pdf('Page 4')]
+    for number, page in enumerate(pages, 1):
+        download.add_page(merger, FakeSource(), ftp, f'page_{number}.pdf', fileobj=io.BytesIO(page))
+    assert download.upload_merged_pages(merger, FakeSource(), ftp)
+    assert ftp.uploads == [(f'page_{number}.pdf', page) for number, page in enumerate(pages, 1)]
+
+
+def test_merged_edition_uploaded_alone(download):
+    ftp = RecordingFtp()
+    merger = download.page_merger(FakeSource())
+    for number in range(1, 3):
+        page = io.BytesIO(text_pdf(f'Page {number}'))
+        download.add_page(merger, FakeSource(), ftp, f'page_{number}.pdf', fileobj=page)
+    assert ftp.uploads == []
+    assert download.upload_merged_pages(merger, FakeSource(), ftp)
+    [(filename, data)] = ftp.uploads
+    assert filename.startswith('edition_')
+    assert [page.extract_text().strip() for page in PyPDF2.PdfReader(io.BytesIO(data)).pages] == ['Page 1', 'Page 2']
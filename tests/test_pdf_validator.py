@@ -0,0 +1,52 @@
+import io
+
+import PyPDF2
+import pytest
+
+from ingestaweb.modules.pdf_validator import fast_page_count, deep_page_count, is_valid_pdf
+
+
+def make_pdf(pages=3):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def validate(data, **kwargs):
+    return is_valid_pdf(fileobj=io.BytesIO(data), sample_rate=0, **kwargs)
+
+
+def test_fast_tier_counts_the_pages():
+    assert fast_page_count(io.BytesIO(make_pdf(pages=3))) == 3
+    assert deep_page_count(io.BytesIO(make_pdf(pages=3))) == 3
+
+
+@pytest.mark.parametrize('deep', [False, True])
+def test_valid_pdf(deep):
+    assert validate(make_pdf(), deep=deep)
+
+
+def test_trailing_bytes_after_eof_are_left_to_the_deep_tier():
+    data = make_pdf() + b'\0' * 8192
+    assert fast_page_count(io.BytesIO(data)) is None
+    assert validate(data)
+
+
+def test_junk_before_the_header_is_left_to_the_deep_tier():
+    data = b' ' * 2048 + make_pdf()
+    assert fast_page_count(io.BytesIO(data)) is None
+    assert validate(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'<html><body>Not found</body></html>', make_pdf()[:300]])
+def test_invalid_pdf(data):
+    assert not validate(data)
+
+
+def test_fileobj_is_left_at_the_start():
+    fileobj = io.BytesIO(make_pdf())
+    assert is_valid_pdf(fileobj=fileobj, sample_rate=0)
+    assert fileobj.tell() == 0
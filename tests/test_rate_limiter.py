@@ -0,0 +1,53 @@
+import email.utils
+import time
+
+import pytest
+
+from ingestaweb.modules.rate_limiter import AdaptiveRateLimiter, backoff_delay, parse_retry_after
+
+URL = 'https://example.com/edition.pdf'
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=1, cap=5) <= min(5, 2 ** attempt)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= parse_retry_after(retry_at) <= 31
+
+
+def test_burst_then_rate():
+    limiter = AdaptiveRateLimiter(rate=20, burst=3)
+    start = time.monotonic()
+    waits = [limiter.acquire(URL) for _ in range(5)]
+    assert waits[:3] == [0, 0, 0]
+    # two requests beyond the burst at 20 req/s
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+
+def test_hosts_are_limited_separately():
+    limiter = AdaptiveRateLimiter(rate=1, burst=1)
+    limiter.acquire(URL)
+    assert limiter.acquire('https://other.example.com/') == 0
+
+
+def test_rate_limited_answer_halves_the_rate_and_pauses_the_host():
+    limiter = AdaptiveRateLimiter(rate=10, burst=1, min_rate=1)
+    assert limiter.feedback(URL, 429, retry_after=0.2) == 0.2
+    assert limiter.rates()['example.com'] == 5
+    assert limiter.acquire(URL) >= 0.15
+
+
+def test_rate_recovers_with_successful_answers():
+    limiter = AdaptiveRateLimiter(rate=10, burst=1, min_rate=1)
+    limiter.feedback(URL, 503, retry_after=0)
+    limiter.feedback(URL, 503, retry_after=0)
+    assert limiter.rates()['example.com'] == 2.5
+    for _ in range(10):
+        assert limiter.feedback(URL, 200) == 0
+    assert limiter.rates()['example.com'] == 10
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from ingestaweb.modules.retrying import retry, retry_metrics, is_falsy, RetryPolicy, NO_RETRY
+
+
+class Flaky:
+    """ Raises (or returns the failures) the first `failures` calls """
+
+    def __init__(self, failures, error=ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error(f'call {self.calls}')
+        return 'ok'
+
+
+def test_retries_until_success():
+    flaky = Flaky(2)
+    assert retry(max_attempts=3, base=0.001, name='test.success')(flaky.__call__)() == 'ok'
+    assert flaky.calls == 3
+    counters = retry_metrics()['test.success']
+    assert counters['calls'] == 1 and counters['attempts'] == 3 and counters['retries'] == 2
+    assert counters['failures'] == 0
+
+
+def test_last_error_raised_when_attempts_run_out():
+    flaky = Flaky(5)
+    with pytest.raises(ConnectionError, match='call 3'):
+        retry(max_attempts=3, base=0.001, name='test.exhausted')(flaky.__call__)()
+    assert flaky.calls == 3
+    assert retry_metrics()['test.exhausted']['failures'] == 1
+
+
+def test_other_exceptions_are_not_retried():
+    flaky = Flaky(1, error=KeyError)
+    with pytest.raises(KeyError):
+        retry(max_attempts=3, base=0.001, retry_on=(ConnectionError,))(flaky.__call__)()
+    assert flaky.calls == 1
+
+
+def test_policies_by_exception():
+    flaky = Flaky(5, error=PermissionError)
+    with pytest.raises(PermissionError):
+        retry(max_attempts=3, base=0.001, policies={PermissionError: NO_RETRY})(flaky.__call__)()
+    assert flaky.calls == 1
+    flaky = Flaky(5, error=TimeoutError)
+    with pytest.raises(TimeoutError):
+        retry(max_attempts=2, base=0.001, policies={TimeoutError: RetryPolicy(max_attempts=4)})(flaky.__call__)()
+    assert flaky.calls == 4
+
+
+def test_retry_on_result():
+    results = iter([False, None, True])
+    assert retry(max_attempts=3, base=0.001, retry_if_result=is_falsy)(lambda: next(results))() is True
+    results = iter([False, False, True])
+    assert retry(max_attempts=2, base=0.001, retry_if_result=is_falsy)(lambda: next(results))() is False
+
+
+def test_deadline_stops_the_retries():
+    flaky = Flaky(100)
+    start = time.monotonic()
+    with pytest.raises(ConnectionError):
+        retry(max_attempts=None, base=0.05, cap=0.05, deadline=0.3)(flaky.__call__)()
+    assert time.monotonic() - start < 0.3
+    assert 1 < flaky.calls < 100
+
+
+def test_callable_deadline_is_read_when_the_call_starts():
+    deadlines = iter([0.0, 10])
+    flaky = Flaky(1)
+    retried = retry(max_attempts=3, base=0.001, deadline=lambda: next(deadlines))(flaky.__call__)
+    with pytest.raises(ConnectionError):
+        retried()
+    flaky.calls = 0
+    assert retried() == 'ok'
+
+
+def test_needs_attempts_or_deadline():
+    with pytest.raises(ValueError):
+        retry(max_attempts=None)
+
+
+def test_coroutine_functions():
+    flaky = Flaky(2)
+
+    @retry(max_attempts=3, base=0.001)
+    async def fetch():
+        return flaky()
+
+    assert asyncio.run(fetch()) == 'ok'
+    assert flaky.calls == 3
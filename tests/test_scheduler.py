@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+
+from ingestaweb.modules import scheduler as scheduler_module
+from ingestaweb.modules import supervisor as supervisor_module
+from ingestaweb.modules.scheduler import DownloadScheduler, Lane, lane_for, HTTP_LANE, BROWSER_LANE
+from ingestaweb.modules.supervisor import Supervisor, checkpoint, cancelled
+from ingestaweb.settings import DownloadStatus
+
+
+class FakeDb:
+
+    def __init__(self, events):
+        self.events = events
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def set_download_status(self, dbsource, status, reason=None):
+        with self._lock:
+            self.statuses[dbsource.id] = (status, reason)
+            self.events.append(('status', dbsource.id, status))
+
+    def flush_status_updates(self):
+        self.events.append(('flush',))
+
+
+class FakeUploadPool:
+    """ Keeps the failure callbacks, `fail_on_close` uploads fail while the pool finishes its queue """
+
+    def __init__(self, events, fail_on_close=False):
+        self.events = events
+        self.fail_on_close = fail_on_close
+        self.on_failures = []
+
+    def uploads_of(self, on_failure):
+        self.on_failures.append(on_failure)
+        return self
+
+    def close(self):
+        if self.fail_on_close:
+            for on_failure in self.on_failures:
+                on_failure('today/edition.pdf', OSError('connection lost'))
+        self.events.append(('pool closed',))
+
+
+class DbSource:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeSource:
+    def __init__(self, id):
+        self.name = f'source {id}'
+        self.dbsource = DbSource(id)
+
+
+class FakeRootSource:
+    """ Root source whose downloads run `download_source(source)` and record the worker thread """
+    webdriver_pool = None
+
+    def __init__(self, name, sources, download_type='standard_requests', login_type='nologin',
+                 download_source=None):
+        self.name = name
+        self.sources = sources
+        self.download_conf = {'type': download_type}
+        self.login_info = {'type': login_type}
+        self.download_source = download_source or (lambda source: DownloadStatus.SUCCESS)
+        self.threads = []
+        self.closed_sessions = 0
+        self.chrome = None
+        self.remote_session = None
+
+    def sources_to_be_downloaded(self):
+        return self.sources
+
+    def login(self, login_type):
+        pass
+
+    def handle_login_status(self):
+        return 'No login needed'
+
+    def close_webdriver_session(self):
+        self.closed_sessions += 1
+
+    def download(self, download_type, source, ftp):
+        self.threads.append(threading.current_thread().name)
+        return self.download_source(source)
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def scheduler(monkeypatch, events):
+    monkeypatch.setattr(scheduler_module, 'AVAILABILITY_PROBE', False)
+    monkeypatch.setattr(scheduler_module.availability, 'downloaded', lambda source: None)
+    monkeypatch.setattr(scheduler_module, 'http_engine', None)
+    monkeypatch.setattr(scheduler_module, 'chrome_capacity', lambda: None)
+    supervisor = Supervisor(interval=0.02)
+    monkeypatch.setattr(scheduler_module, 'supervisor', supervisor)
+    monkeypatch.setattr(supervisor_module, 'supervisor', supervisor)
+    return DownloadScheduler(FakeDb(events), workers=2, upload_pool=FakeUploadPool(events), http_workers=4)
+
+
+def test_lane_for():
+    assert lane_for(FakeRootSource('a', [])) == HTTP_LANE
+    assert lane_for(FakeRootSource('b', [], login_type='requests_basic')) == HTTP_LANE
+    assert lane_for(FakeRootSource('c', [], login_type='selenium_basic')) == BROWSER_LANE
+    assert lane_for(FakeRootSource('d', [], download_type='calameo')) == BROWSER_LANE
+
+
+def test_root_sources_run_in_their_lane(scheduler):
+    http_root = FakeRootSource('http', [FakeSource(1)])
+    browser_root = FakeRootSource('browser', [FakeSource(2)], login_type='selenium_basic')
+    idle_root = FakeRootSource('idle', [])
+    scheduler.run([http_root, browser_root, idle_root])
+    assert http_root.threads[0].startswith('http-lane')
+    assert browser_root.threads[0].startswith('browser-lane')
+    assert not idle_root.threads
+    assert scheduler.db.statuses == {1: (DownloadStatus.SUCCESS, None), 2: (DownloadStatus.SUCCESS, None)}
+    assert http_root.webdriver_pool is scheduler.webdriver_pool
+
+
+@pytest.mark.parametrize('capacity, workers', [(2, 2), (None, 6), (10, 6)])
+def test_chrome_capacity_caps_browser_workers(monkeypatch, events, capacity, workers):
+    monkeypatch.setattr(scheduler_module, 'chrome_capacity', lambda: capacity)
+    assert DownloadScheduler(FakeDb(events), workers=6, upload_pool=FakeUploadPool(events)).workers == workers
+
+
+def test_browser_lane_runs_at_most_capacity_root_sources(scheduler):
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def download_source(source):
+        with lock:
+            running.append(source)
+            most.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(source)
+        return DownloadStatus.SUCCESS
+
+    roots = [FakeRootSource(f'browser {i}', [FakeSource(i)], login_type='selenium_basic',
+                            download_source=download_source) for i in range(6)]
+    scheduler.run(roots)
+    assert max(most) == scheduler.workers == 2
+
+
+def wait_for_the_deadline(source):
+    while not cancelled():
+        time.sleep(0.01)
+    checkpoint()
+
+
+def test_source_deadline_fails_it_and_closes_the_browser(scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'SOURCE_TIMEOUT', 0.1)
+    root = FakeRootSource('browser', [FakeSource(1), FakeSource(2)], login_type='selenium_basic',
+                          download_source=lambda source: wait_for_the_deadline(source) if source.dbsource.id == 1
+                          else DownloadStatus.SUCCESS)
+    assert scheduler.download_root_source(root) == 0
+    status, reason = scheduler.db.statuses[1]
+    assert status == DownloadStatus.FAILED and reason.startswith('timeout: source over')
+    assert scheduler.db.statuses[2] == (DownloadStatus.SUCCESS, None)
+    # once when the source timed out, once at the end of the root source
+    assert root.closed_sessions == 2
+
+
+def test_sources_after_the_root_source_deadline_are_not_started(scheduler):
+    root = FakeRootSource('http', [FakeSource(1), FakeSource(2)],
+                          download_source=lambda source: time.sleep(0.2) or DownloadStatus.SUCCESS)
+    lane = Lane(HTTP_LANE, 1, 0.1, scheduler.download_root_source)
+    lane.submit(root)
+    lane.wait()
+    assert scheduler.db.statuses == {1: (DownloadStatus.SUCCESS, None),
+                                     2: (DownloadStatus.FAILED, 'timeout: root source deadline')}
+    assert root.threads == [root.threads[0]]
+    assert lane.report()['timed_out'] == 1
+
+
+def test_upload_failures_are_flushed_after_the_pool_closes(monkeypatch, events):
+    monkeypatch.setattr(scheduler_module, 'AVAILABILITY_PROBE', False)
+    monkeypatch.setattr(scheduler_module.availability, 'downloaded', lambda source: None)
+    monkeypatch.setattr(scheduler_module, 'http_engine', None)
+    scheduler = DownloadScheduler(FakeDb(events), upload_pool=FakeUploadPool(events, fail_on_close=True))
+    scheduler.run([FakeRootSource('http', [FakeSource(1)])])
+    assert scheduler.db.statuses[1] == (DownloadStatus.FAILED, 'ftp: OSError: connection lost')
+    assert events[-3:] == [('status', 1, DownloadStatus.FAILED), ('pool closed',), ('flush',)]
+
+
+def test_status_is_flushed_when_a_root_source_fails(scheduler, events):
+    root = FakeRootSource('http', [FakeSource(1)])
+    root.login = lambda login_type: 1 / 0
+    scheduler.run([root])
+    assert events[-1] == ('flush',)
+    assert ('flush',) in events[:-2]
+    assert scheduler.db.statuses == {}
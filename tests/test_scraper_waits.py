@@ -0,0 +1,86 @@
+import pytest
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+from ingestaweb.modules.scraping import Scraper
+
+
+class FakeElement:
+    """ Goes stale once the page it belongs to is replaced """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.page = driver.page
+
+    def is_enabled(self):
+        if self.page != self.driver.page:
+            raise StaleElementReferenceException('stale')
+        return True
+
+    def is_displayed(self):
+        return self.is_enabled()
+
+
+class FakeDriver:
+
+    def __init__(self, pages_after=None):
+        self.page = 0
+        self.polls = 0
+        # number of polls before the page is replaced, never when None
+        self.pages_after = pages_after
+
+    def find_element(self, by, xpath):
+        return FakeElement(self)
+
+    def execute_script(self, script):
+        self.polls += 1
+        return 'complete'
+
+    def tick(self):
+        self.polls += 1
+        if self.pages_after is not None and self.polls >= self.pages_after:
+            self.page = 1
+
+
+def scraper(driver):
+    scraper = Scraper()
+    scraper.chrome = driver
+    return scraper
+
+
+class TickingElement(FakeElement):
+
+    def is_enabled(self):
+        self.driver.tick()
+        return super().is_enabled()
+
+
+def test_wait_for_navigation():
+    driver = FakeDriver(pages_after=2)
+    assert scraper(driver).wait_for_navigation(TickingElement(driver), timeout=2)
+
+
+def test_wait_for_navigation_on_a_page_that_stays():
+    driver = FakeDriver()
+    assert not scraper(driver).wait_for_navigation(TickingElement(driver), timeout=0.3)
+
+
+def test_wait_clickable():
+    driver = FakeDriver()
+    assert isinstance(scraper(driver).wait_clickable('//button'), FakeElement)
+
+
+class EmptyDriver(FakeDriver):
+
+    def find_element(self, by, xpath):
+        raise NoSuchElementException(xpath)
+
+
+def test_wait_clickable_times_out():
+    driver = EmptyDriver()
+    with pytest.raises(TimeoutException):
+        scraper(driver).wait_clickable('//button', timeout=0.3)
+
+
+def test_wait_until_stable():
+    counts = iter([1, 4, 9, 9, 9])
+    assert scraper(FakeDriver()).wait_until_stable(lambda: next(counts), poll=0.01) == 9
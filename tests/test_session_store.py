@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from ingestaweb.modules import session_store as session_store_module
+from ingestaweb.modules.session_store import SessionStore
+
+fernet = pytest.importorskip('cryptography.fernet')
+
+COOKIES = [{'name': 'sid', 'value': 'abc', 'domain': 'example.com', 'path': '/'}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(directory=str(tmp_path), key=fernet.Fernet.generate_key(), ttl=60)
+
+
+def test_save_and_load(store):
+    assert store.save(7, 'selenium_basic', COOKIES)
+    assert store.load(7, 'selenium_basic') == COOKIES
+
+
+def test_other_login_type_is_not_restored(store):
+    store.save(7, 'selenium_basic', COOKIES)
+    assert store.load(7, 'requests_basic') is None
+
+
+def test_expired_cookies_are_dropped(store):
+    store.save(7, 'selenium_basic', [dict(COOKIES[0], expiry=time.time() - 1)])
+    assert store.load(7, 'selenium_basic') is None
+
+
+def test_file_encrypted_with_another_key_is_deleted(store, tmp_path):
+    store.save(7, 'selenium_basic', COOKIES)
+    other = SessionStore(directory=str(tmp_path), key=fernet.Fernet.generate_key())
+    assert other.load(7, 'selenium_basic') is None
+    assert not (tmp_path / '7.session').exists()
+
+
+def test_disabled_without_key(tmp_path, monkeypatch):
+    monkeypatch.delattr(session_store_module.Config, 'SESSION_STORE_KEY', raising=False)
+    store = SessionStore(directory=str(tmp_path))
+    assert not store.enabled
+    assert not store.save(7, 'selenium_basic', COOKIES)
+    assert store.load(7, 'selenium_basic') is None
+
+
+def test_disabled_without_cryptography(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store_module, 'Fernet', None)
+    store = SessionStore(directory=str(tmp_path), key=b'not used')
+    assert not store.enabled
@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+from ingestaweb.modules.main_helpers import set_sources_to_be_donwloaded
+from ingestaweb.modules.sources import RootSource, SourceRegistry
+
+DbSource = namedtuple('DbSource', ['id', 'source_name'])
+
+
+def root_source(root_id, *names):
+    return RootSource({
+        'id': root_id, 'name': f'root {root_id}', 'is_active': True, 'login': {'type': 'nologin'},
+        'download_config': {'type': 'standard_requests'},
+        'sources': [{'name': name, 'weekdays': list(range(1, 8)), 'frequency': 'daily'} for name in names]
+    })
+
+
+class FakeDb:
+
+    def __init__(self, *rows):
+        self.rows = rows
+
+    def get_sources_by_recurrence(self, source_recurrence, sources):
+        return list(self.rows)
+
+
+def test_registry_lookup():
+    first, second = root_source(1, 'a', 'b'), root_source(2, 'c')
+    registry = SourceRegistry([first, second])
+    assert len(registry) == 3
+    assert 'c' in registry and 'd' not in registry
+    assert registry.get('c') == (second, second.sources[0])
+    assert registry.get('d') == (None, None)
+    assert registry.get_all('d') == []
+
+
+def test_duplicated_names_keep_every_source():
+    first, second = root_source(1, 'a'), root_source(2, 'a')
+    registry = SourceRegistry([first, second])
+    assert [root for root, _ in registry.get_all('a')] == [first, second]
+    assert len(registry.sources()) == 2
+
+
+def test_database_row_is_set_on_every_source_with_its_name():
+    first, second = root_source(1, 'a', 'b'), root_source(2, 'a')
+    row = DbSource(10, 'a')
+    set_sources_to_be_donwloaded([first, second], 'all', FakeDb(row))
+    assert first.sources_to_be_downloaded() == [first.sources[0]]
+    assert first.sources[0].dbsource is row and second.sources[0].dbsource is row
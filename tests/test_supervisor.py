@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from ingestaweb.modules import supervisor as supervisor_module
+from ingestaweb.modules.supervisor import Supervisor, SourceTimeout, Watch
+
+
+class FakeProcess:
+    killed = False
+
+    def kill(self):
+        self.killed = True
+
+
+class FakeService:
+    def __init__(self):
+        self.process = FakeProcess()
+
+
+class FakeChrome:
+    def __init__(self):
+        self.service = FakeService()
+
+
+class FakeScraper:
+    def __init__(self):
+        self.chrome = FakeChrome()
+        self.remote_session = None
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    supervisor = Supervisor(interval=0.05)
+    # phase(), checkpoint() and bounded_timeout() use the module supervisor
+    monkeypatch.setattr(supervisor_module, 'supervisor', supervisor)
+    return supervisor
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_source_deadline_cancels_and_kills_the_browser(supervisor):
+    scraper = FakeScraper()
+    with supervisor.watch('source', scraper, timeout=0.1) as watch:
+        assert wait_for(lambda: watch.timed_out)
+        with pytest.raises(SourceTimeout):
+            supervisor_module.checkpoint()
+    assert watch.reason.startswith('timeout: source over')
+    assert scraper.chrome.service.process.killed
+
+
+def test_phase_deadline(supervisor):
+    with supervisor.watch('source', timeout=None) as watch:
+        with supervisor_module.phase('fetch', timeout=0.1):
+            assert wait_for(lambda: watch.timed_out)
+    assert watch.reason == 'timeout: fetch over 0s'
+
+
+def test_finished_phase_does_not_expire(supervisor):
+    with supervisor.watch('source', timeout=None) as watch:
+        with supervisor_module.phase('fetch', timeout=0.1):
+            pass
+        time.sleep(0.2)
+    assert not watch.timed_out
+
+
+def test_timeouts_are_bounded_by_the_deadline(supervisor):
+    assert supervisor_module.bounded_timeout(60) == 60
+    assert supervisor_module.request_timeout((10, 60)) == (10, 60)
+    with supervisor.watch('source', timeout=5):
+        assert 4 < supervisor_module.bounded_timeout(60) <= 5
+        connect, read = supervisor_module.request_timeout((10, 60))
+        assert 4 < connect <= 5 and 4 < read <= 5
+        with supervisor_module.phase('login', timeout=2):
+            assert supervisor_module.login_deadline() <= 2
+
+
+def test_login_phase_lasts_at_least_the_login_deadline():
+    assert supervisor_module.PHASE_TIMEOUTS['login'] >= supervisor_module.LOGIN_DEADLINE
+
+
+def test_watch_remaining_without_deadlines():
+    watch = Watch('source', timeout=None)
+    assert watch.remaining() is None
+    assert watch.expired(time.monotonic()) is None
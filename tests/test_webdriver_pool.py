@@ -0,0 +1,136 @@
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from ingestaweb.modules.webdriver_pool import WebDriverPool
+
+
+class SwitchTo:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = handle
+
+    def default_content(self):
+        pass
+
+
+class FakeDriver:
+    """ Tabs {handle: history urls} and cookie domains, the cdp commands sent are kept in `commands` """
+
+    def __init__(self, tabs=None, cookie_domains=(), failing_command=None):
+        self.tabs = dict(tabs or {'main': []})
+        self.cookie_domains = list(cookie_domains)
+        self.failing_command = failing_command
+        self.current = next(iter(self.tabs))
+        self.switch_to = SwitchTo(self)
+        self.commands = []
+        self.alive = True
+        self.quit_called = False
+
+    @property
+    def window_handles(self):
+        if not self.alive:
+            raise WebDriverException('chrome not reachable')
+        return list(self.tabs)
+
+    def close(self):
+        del self.tabs[self.current]
+
+    def delete_all_cookies(self):
+        pass
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+        if command == self.failing_command:
+            raise WebDriverException(f'{command} failed')
+        if command == 'Page.getNavigationHistory':
+            return {'entries': [{'url': url} for url in self.tabs[self.current]]}
+        if command == 'Network.getAllCookies':
+            return {'cookies': [{'domain': domain} for domain in self.cookie_domains]}
+        return {}
+
+    def get(self, url):
+        self.tabs[self.current] = [url]
+
+    def quit(self):
+        self.quit_called = True
+
+    def cleared_origins(self):
+        return [params['origin'] for command, params in self.commands if command == 'Storage.clearDataForOrigin']
+
+
+class Factory:
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.drivers = []
+
+    def __call__(self):
+        self.drivers.append(FakeDriver(**self.kwargs))
+        return self.drivers[-1]
+
+
+def test_released_driver_is_reused():
+    factory = Factory()
+    pool = WebDriverPool(max_drivers=1, factory=factory)
+    with pool.lease() as driver:
+        pass
+    with pool.lease() as again:
+        assert again is driver
+    assert len(factory.drivers) == 1
+    assert pool.report()['leases'] == 2
+
+
+def test_reset_clears_the_storage_of_every_visited_origin():
+    driver = FakeDriver(tabs={'main': ['about:blank', 'https://diario.com/login', 'https://diario.com/hemeroteca'],
+                              'popup': ['https://visor.com:8443/edicion']},
+                        cookie_domains=['.cdn.com'])
+    assert WebDriverPool.reset(driver)
+    assert driver.tabs == {'main': ['about:blank']}
+    assert driver.cleared_origins() == ['http://cdn.com', 'https://cdn.com', 'https://diario.com',
+                                        'https://visor.com:8443']
+    assert ('Network.clearBrowserCookies', {}) in driver.commands
+    assert ('Network.clearBrowserCache', {}) in driver.commands
+
+
+@pytest.mark.parametrize('failing_command', ['Storage.clearDataForOrigin', 'Network.clearBrowserCache',
+                                             'Page.getNavigationHistory'])
+def test_driver_not_reset_is_restarted(failing_command):
+    factory = Factory(tabs={'main': ['https://diario.com/']}, failing_command=failing_command)
+    pool = WebDriverPool(max_drivers=1, factory=factory)
+    with pool.lease() as driver:
+        pass
+    assert driver.quit_called
+    with pool.lease() as again:
+        assert again is not driver
+    assert pool.recycled == 2
+
+
+def test_driver_is_recycled_after_max_uses():
+    factory = Factory()
+    pool = WebDriverPool(max_drivers=1, max_uses=2, factory=factory)
+    for _ in range(3):
+        with pool.lease():
+            pass
+    assert len(factory.drivers) == 2 and factory.drivers[0].quit_called
+
+
+def test_crashed_idle_driver_is_replaced():
+    factory = Factory()
+    pool = WebDriverPool(max_drivers=1, factory=factory)
+    with pool.lease() as driver:
+        pass
+    driver.alive = False
+    assert pool.acquire() is not driver
+    assert driver.quit_called
+
+
+def test_lease_waits_for_a_free_driver():
+    pool = WebDriverPool(max_drivers=1, factory=Factory())
+    driver = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    pool.release(driver)
+    assert pool.acquire(timeout=0.05) is driver